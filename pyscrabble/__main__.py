@@ -1,7 +1,5 @@
-from pyscrabble.gui import MainWindow
-
-
 def main():
+    from pyscrabble.gui import MainWindow
     MainWindow().mainloop()
 
 
@@ -0,0 +1,420 @@
+import argparse
+import gc
+import gzip
+import json
+import os
+import pkgutil
+import platform
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from threading import Thread
+from typing import Any, Callable, Dict, List, Optional
+
+import pyscrabble.protocol as proto
+import pyscrabble.server as server
+import pyscrabble.simulation as simulation
+from pyscrabble.model import Tile, TileBag
+from pyscrabble.replay import Snapshot
+from pyscrabble.rules import CompactLexicon
+
+Results = Dict[str, Dict[str, Any]]
+
+IMPORT_BUDGET = 0.2
+STARTUP_BUDGET = 0.5
+
+
+def _measure(func: Callable[[], Any], repeat: int, min_time: float) -> List[float]:
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / 10 or number >= 1 << 20:
+            break
+        number *= 10
+    timings = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            timings.append((time.perf_counter() - start) / number)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return timings
+
+
+def _result(timings: List[float]) -> Dict[str, Any]:
+    return {
+        'runs': len(timings),
+        'min_us': min(timings) * 1e6,
+        'median_us': statistics.median(timings) * 1e6,
+        'stdev_us': statistics.stdev(timings) * 1e6 if len(timings) > 1 else 0.0
+    }
+
+
+class Suite:
+    def __init__(self, repeat: int = 7, min_time: float = 0.2, pattern: str = None):
+        self.repeat = repeat
+        self.min_time = min_time
+        self.pattern = pattern
+        self.results: Results = {}
+
+    def selected(self, name: str) -> bool:
+        return not self.pattern or self.pattern in name
+
+    def bench(self, name: str, func: Callable[[], Any]):
+        if self.selected(name):
+            self.results[name] = _result(_measure(func, self.repeat, self.min_time))
+
+    def record(self, name: str, timings: List[float], budget: float = None):
+        if self.selected(name):
+            self.results[name] = _result(timings)
+            if budget is not None:
+                self.results[name]['budget_us'] = budget * 1e6
+
+    def skip(self, name: str, reason: str):
+        if self.selected(name):
+            self.results[name] = {'skipped': reason}
+
+
+def _sample_messages() -> List['proto.Message']:
+    rng = random.Random(0)
+    tiles = [Tile(rng.randrange(100), rng.randint(1, 10), chr(ord('A') + rng.randrange(26))) for _ in range(7)]
+    placements = [proto.PlaceTilesTile(112 + i, tile.id) for i, tile in enumerate(tiles)]
+    players = [(i, f'player{i}') for i in range(4)]
+    return [
+        proto.Join('player0'),
+        proto.FindGame('player0', 'en', 1500),
+        proto.Resume(bytes(range(16)), 42),
+        proto.Ready(),
+        proto.Leave(),
+        proto.TileExchange([tile.id for tile in tiles]),
+        proto.PlaceTiles(placements),
+        proto.Chat('Hello, world!'),
+        proto.PreviewMove(placements),
+        proto.Ping(1234567890123),
+        proto.Pong(1234567890123),
+        proto.JoinOk(0, [proto.PlayerInfo(player_id, True, name) for player_id, name in players], 'en',
+                     bytes(range(16))),
+        proto.ActionRejected('Invalid word: XYZZY'),
+        proto.PlayerJoined(1, 'player1'),
+        proto.PlayerLeft(1),
+        proto.PlayerReady(1),
+        proto.StartTurn(0, 72, tiles, [proto.StartTurnPlayer(player_id, 7) for player_id, _ in players]),
+        proto.EndTurn(0, 120, [proto.EndTurnTile(112 + i, tile.points, tile.letter) for i, tile in enumerate(tiles)]),
+        proto.EndGame([proto.EndGamePlayer(player_id, 300 + player_id) for player_id, _ in players]),
+        proto.Shutdown(),
+        proto.PlayerChat(1, 'Hello, world!'),
+        proto.ChatBatch([proto.ChatEntry(i % 4, f'player{i % 4}', f'Hello, world! {i}') for i in range(50)]),
+        proto.Notification('player1 left the game'),
+        proto.MovePreview(None, 42, [proto.MovePreviewWord('QUIXOTE', 42, True), proto.MovePreviewWord('QI', 11, True)]),
+        proto.Queued(3),
+        proto.Resumed(42)
+    ]
+
+
+def bench_protocol(suite: 'Suite'):
+    for msg in _sample_messages():
+        name = type(msg).__name__
+        in_msg_type = proto.ClientMessage if type(msg) in proto.ClientMessage.prefix_map_inv else proto.ServerMessage
+        data = msg.serialize()
+        suite.bench(f'protocol.serialize.{name}', msg.serialize)
+        suite.bench(f'protocol.deserialize.{name}', lambda: proto.BufferStream(data, in_msg_type).get_msg())
+
+    rng = random.Random(1)
+    racks = [[Tile(rng.randrange(100), rng.randint(1, 10), chr(ord('A') + rng.randrange(26))) for _ in range(7)]
+             for _ in range(4)]
+    player_tile_counts = [proto.StartTurnPlayer(player_id, 7) for player_id in range(4)]
+    suite.bench('protocol.StartTurn.turn_change',
+                lambda: [proto.StartTurn(0, 72, rack, player_tile_counts).serialize() for rack in racks])
+    suite.bench('protocol.StartTurnTemplate.turn_change',
+                lambda: [message.serialize() for message in
+                         map(proto.StartTurnTemplate(0, 72, player_tile_counts).message, racks)])
+
+
+def bench_stream(suite: 'Suite', count: int = 20000):
+    name = 'protocol.Stream.get_msg.socketpair'
+    if not suite.selected(name):
+        return
+    msg = next(msg for msg in _sample_messages() if isinstance(msg, proto.StartTurn))
+    data = msg.serialize() * count
+    timings = []
+    for _ in range(suite.repeat):
+        reader, writer = socket.socketpair()
+        stream = proto.Stream(reader, proto.ServerMessage)
+        thread = Thread(target=writer.sendall, args=(data,), daemon=True)
+        thread.start()
+        start = time.perf_counter()
+        for _ in range(count):
+            stream.get_msg()
+        timings.append((time.perf_counter() - start) / count)
+        thread.join()
+        reader.close()
+        writer.close()
+    suite.record(name, timings)
+
+
+def bench_words(suite: 'Suite'):
+    def load_compact_lexicon() -> 'CompactLexicon':
+        return CompactLexicon(gzip.decompress(pkgutil.get_data('pyscrabble', 'words_en')))
+
+    for name, func in (('words.server.load_words', lambda: server.load_words('en')),
+                       ('words.CompactLexicon.load', load_compact_lexicon)):
+        if suite.selected(name):
+            suite.record(name, _measure(func, min(suite.repeat, 3), 0))
+    lexicon = load_compact_lexicon()
+    probes = ['QUIXOTIC', 'ZZYZX', 'AA', 'STREETS', 'XYLOPHONE', 'QWERTY'] * 10
+    suite.bench('words.CompactLexicon.contains', lambda: [word in lexicon for word in probes])
+    words = server.words_for('en')
+    suite.bench('words.set.contains', lambda: [word in words for word in probes])
+
+
+_handler_turns = (0, 8, 16)
+
+
+def _positions(seed: int = 1) -> List[tuple]:
+    simulation.load_lexicon('en')
+    game = server.Game('en', seed)
+    clients = [simulation.SimClient(i, f'player{i}', game.queue_in) for i in range(2)]
+    clients_by_id = {client.player_id: client for client in clients}
+    game.clients = list(clients)
+    for client in clients:
+        server.Handler.handle(proto.Ready(), client, game)
+    bots = {client.player_id: simulation.BotPlayer(random.Random(seed + client.player_id)) for client in clients}
+
+    positions = []
+    for turn in range(max(_handler_turns) + 1):
+        if game.lobby:
+            break
+        client = clients_by_id[game.turn_player_id]
+        move = bots[client.player_id].choose(game, client)
+        if turn in _handler_turns and isinstance(move, proto.PlaceTiles) and move.tile_placements:
+            tile_ids = [tile.id for tile in move.tile_placements]
+            shuffled = [proto.PlaceTilesTile(tile.position, tile_id, tile.letter)
+                        for tile, tile_id in zip(move.tile_placements, reversed(tile_ids))]
+            positions.append((f'turn{turn}', game, Snapshot(game), clients_by_id, client, move,
+                              proto.PlaceTiles(shuffled)))
+        server.Handler.handle(move, client, game)
+    return positions
+
+
+def bench_handlers(suite: 'Suite'):
+    if not any(suite.selected(f'server.PlaceTilesHandler.{kind}.turn{turn}')
+               for kind in ('valid', 'invalid') for turn in _handler_turns):
+        return
+    for label, game, snapshot, clients_by_id, client, valid, invalid in _positions():
+        for kind, msg in (('valid', valid), ('invalid', invalid)):
+            name = f'server.PlaceTilesHandler.{kind}.{label}'
+            if not suite.selected(name):
+                continue
+            timings = []
+            for _ in range(suite.repeat):
+                total = 0.0
+                for _ in range(50):
+                    snapshot.restore(game, clients_by_id)
+                    for client_ in clients_by_id.values():
+                        client_.inbox.clear()
+                    start = time.perf_counter()
+                    server.Handler.handle(msg, client, game)
+                    total += time.perf_counter() - start
+                timings.append(total / 50)
+            suite.record(name, timings)
+
+
+def bench_tile_bag(suite: 'Suite'):
+    tiles = server.Game._tiles['en']
+    bag = TileBag(tiles, 0)
+
+    def draw_put_back():
+        drawn = bag.draw(7)
+        bag.put_back(drawn)
+
+    suite.bench('model.TileBag.new', lambda: TileBag(tiles, 0))
+    suite.bench('model.TileBag.draw_put_back', draw_put_back)
+    suite.bench('model.TileBag.copy', bag.copy)
+
+
+def _python_env() -> Dict[str, str]:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    path = os.environ.get('PYTHONPATH')
+    return {**os.environ, 'PYTHONPATH': root + os.pathsep + path if path else root}
+
+
+def _server_listening() -> float:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-m', 'pyscrabble.server', '--host', '127.0.0.1', '--port', str(port)],
+                               stdout=subprocess.PIPE, env=_python_env())
+    try:
+        if not process.stdout.readline().startswith(b'Listening'):
+            raise RuntimeError('Server process failed to start')
+        return time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def bench_startup(suite: 'Suite'):
+    runs = min(suite.repeat, 5)
+    name = 'startup.import_server'
+    if suite.selected(name):
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.check_call([sys.executable, '-c', 'import pyscrabble.server'], env=_python_env())
+            timings.append(time.perf_counter() - start)
+        suite.record(name, timings, IMPORT_BUDGET)
+    name = 'startup.server_listening'
+    if suite.selected(name):
+        suite.record(name, [_server_listening() for _ in range(runs)], STARTUP_BUDGET)
+
+
+def _start_virtual_display() -> Optional[subprocess.Popen]:
+    if os.environ.get('DISPLAY') or sys.platform in ('win32', 'darwin') or not shutil.which('Xvfb'):
+        return None
+    display = ':97'
+    process = subprocess.Popen(['Xvfb', display, '-screen', '0', '1024x768x24'],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(0.5)
+    os.environ['DISPLAY'] = display
+    return process
+
+
+class _FakeConnection:
+    def __init__(self, state):
+        self.game = self
+        self.state = state
+
+
+def bench_gui(suite: 'Suite'):
+    names = ('gui.BoardCanvas.redraw.one_tile', 'gui.BoardCanvas.redraw.full_board')
+    if not any(suite.selected(name) for name in names):
+        return
+    display = _start_virtual_display()
+    try:
+        try:
+            import tkinter as tk
+            from pyscrabble.client import GameState
+            from pyscrabble.gui import BoardCanvas
+            root = tk.Tk()
+        except (ImportError, RuntimeError) as e:
+            for name in names:
+                suite.skip(name, str(e))
+            return
+        except Exception as e:
+            for name in names:
+                suite.skip(name, f'no display: {e}')
+            return
+
+        rng = random.Random(0)
+        full = tuple(Tile(i, rng.randint(1, 10), chr(ord('A') + rng.randrange(26))) for i in range(225))
+        empty = GameState(False, {}, 0, True, 0, 0, (), (None,) * 225, None, None, False)
+        one = empty._replace(board=(full[0],) + (None,) * 224)
+        board = empty._replace(board=full)
+        connection = _FakeConnection(empty)
+        canvas = BoardCanvas(root, connection, lambda *args: None)
+        canvas.pack()
+        root.update()
+
+        for name, state in zip(names, (one, board)):
+            def redraw():
+                connection.state = state
+                canvas.redraw()
+                root.update_idletasks()
+                connection.state = empty
+                canvas.redraw()
+                root.update_idletasks()
+
+            suite.bench(name, redraw)
+        root.destroy()
+    finally:
+        if display:
+            display.terminate()
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(repeat: int = 7, min_time: float = 0.2, pattern: str = None) -> dict:
+    suite = Suite(repeat, min_time, pattern)
+    for group in (bench_protocol, bench_stream, bench_words, bench_handlers, bench_tile_bag, bench_startup,
+                  bench_gui):
+        group(suite)
+    return {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'results': suite.results
+    }
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> List[str]:
+    regressions = []
+    for name, result in sorted(report['results'].items()):
+        base = baseline['results'].get(name)
+        if not base or 'median_us' not in base or 'median_us' not in result:
+            continue
+        ratio = result['median_us'] / base['median_us'] if base['median_us'] else 1.0
+        marker = ''
+        if ratio > threshold:
+            marker = '  REGRESSION'
+            regressions.append(name)
+        print(f'  {name:<48} {base["median_us"]:>12.2f}us -> {result["median_us"]:>12.2f}us  x{ratio:.2f}{marker}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run PyScrabble microbenchmarks')
+    parser.add_argument('-o', '--output', help='write the results as JSON to this file')
+    parser.add_argument('-k', '--filter', help='only run benchmarks whose name contains this string')
+    parser.add_argument('-r', '--repeat', type=int, default=7, help='timed runs per benchmark')
+    parser.add_argument('-t', '--min-time', type=float, default=0.2, help='target seconds per timed run')
+    parser.add_argument('-c', '--compare', help='compare against a previous JSON result')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='median slowdown ratio reported as a regression with --compare')
+    args = parser.parse_args()
+
+    report = run(args.repeat, args.min_time, args.filter)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f'{baseline.get("commit")} -> {report["commit"]}')
+        sys.exit(1 if compare(report, baseline, args.threshold) else 0)
+
+    over_budget = False
+    for name, result in sorted(report['results'].items()):
+        if 'skipped' in result:
+            print(f'  {name:<48} skipped: {result["skipped"]}')
+        else:
+            marker = ''
+            if result.get('budget_us') is not None and result['median_us'] > result['budget_us']:
+                marker = f'  OVER BUDGET ({result["budget_us"]:.0f}us)'
+                over_budget = True
+            print(f'  {name:<48} {result["median_us"]:>12.2f}us  ±{result["stdev_us"]:.2f}{marker}')
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+import gzip
+import pkgutil
+import random
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import pyscrabble.protocol as proto
+from pyscrabble.model import Board, Tile
+from pyscrabble.rules import FullTile, MoveResult, evaluate_move
+
+if TYPE_CHECKING:
+    from pyscrabble.endgame import EndgameSolver
+
+
+class Lexicon:
+    def __init__(self, words: Iterable[str]):
+        self.words: Set[str] = words if isinstance(words, set) else set(words)
+        self.prefixes: Set[str] = set()
+        for word in self.words:
+            for i in range(1, len(word)):
+                self.prefixes.add(word[:i])
+        self.alphabet = sorted({word[0] for word in self.words} | {word[-1] for word in self.words})
+
+    @classmethod
+    def load(cls, lang: str) -> 'Lexicon':
+        data = gzip.decompress(pkgutil.get_data('pyscrabble', f'words_{lang}'))
+        return cls(data.decode('utf-8').split())
+
+
+class Move:
+    def __init__(self, tile_placements: List['proto.PlaceTilesTile'], result: 'MoveResult'):
+        self.tile_placements = tile_placements
+        self.result = result
+
+    @property
+    def score(self) -> int:
+        return self.result.score
+
+
+def _letters(board: 'Board') -> List[List[Optional[str]]]:
+    return [[square.tile.letter if square.tile else None for square in row] for row in board.squares]
+
+
+def _find_placements(letters: List[List[Optional[str]]], rack: List['Tile'],
+                     lexicon: 'Lexicon') -> Iterator[List[Tuple[int, int, 'Tile', str]]]:
+    empty_board = not any(any(row) for row in letters)
+    anchors = [[False] * 15 for _ in range(15)]
+    if empty_board:
+        anchors[7][7] = True
+    else:
+        for row in range(15):
+            for col in range(15):
+                if not letters[row][col] and any(0 <= r < 15 and 0 <= c < 15 and letters[r][c] for r, c in
+                                                 ((row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1))):
+                    anchors[row][col] = True
+
+    rack_by_letter: Dict[Optional[str], List['Tile']] = {}
+    for tile in rack:
+        rack_by_letter.setdefault(tile.letter, []).append(tile)
+
+    for horizontal in (True, False):
+        def letter_at(line, i):
+            return letters[line][i] if horizontal else letters[i][line]
+
+        def cross_letters(line, i) -> Optional[Set[str]]:
+            before = ''
+            j = line - 1
+            while j >= 0 and (letters[j][i] if horizontal else letters[i][j]):
+                before = (letters[j][i] if horizontal else letters[i][j]) + before
+                j -= 1
+            after = ''
+            j = line + 1
+            while j < 15 and (letters[j][i] if horizontal else letters[i][j]):
+                after += letters[j][i] if horizontal else letters[i][j]
+                j += 1
+            if not before and not after:
+                return None
+            return {letter for letter in lexicon.alphabet if before + letter + after in lexicon.words}
+
+        for line in range(15):
+            cross_checks: Dict[int, Optional[Set[str]]] = {}
+            next_anchor: List[Optional[int]] = [None] * 16
+            for i in range(14, -1, -1):
+                is_anchor = anchors[line][i] if horizontal else anchors[i][line]
+                next_anchor[i] = i if is_anchor else next_anchor[i + 1]
+
+            placed: List[Tuple[int, int, 'Tile', str]] = []
+
+            def extend(i: int, word: str, connected: bool) -> Iterator[List[Tuple[int, int, 'Tile', str]]]:
+                if i == 15 or not letter_at(line, i):
+                    if placed and connected and len(word) > 1 and word in lexicon.words:
+                        yield list(placed)
+                    if i == 15 or len(placed) == len(rack):
+                        return
+                    remaining = len(rack) - len(placed)
+                    if not connected and (next_anchor[i] is None or next_anchor[i] - i + 1 > remaining):
+                        return
+                    if i not in cross_checks:
+                        cross_checks[i] = cross_letters(line, i)
+                    allowed = cross_checks[i]
+                    is_anchor = anchors[line][i] if horizontal else anchors[i][line]
+                    for rack_letter, tiles in rack_by_letter.items():
+                        if not tiles:
+                            continue
+                        tile = tiles.pop()
+                        for letter in lexicon.alphabet if rack_letter is None else (rack_letter,):
+                            if allowed is not None and letter not in allowed:
+                                continue
+                            new_word = word + letter
+                            if new_word not in lexicon.prefixes and new_word not in lexicon.words:
+                                continue
+                            row, col = (line, i) if horizontal else (i, line)
+                            placed.append((row, col, tile, letter))
+                            yield from extend(i + 1, new_word, connected or is_anchor)
+                            placed.pop()
+                        tiles.append(tile)
+                else:
+                    new_word = word + letter_at(line, i)
+                    if new_word in lexicon.prefixes or new_word in lexicon.words:
+                        yield from extend(i + 1, new_word, True)
+
+            for start in range(15):
+                if start > 0 and letter_at(line, start - 1):
+                    continue
+                if next_anchor[start] is None:
+                    break
+                if not letter_at(line, start) and next_anchor[start] - start + 1 > len(rack):
+                    continue
+                yield from extend(start, '', False)
+
+
+def generate_moves(board: 'Board', rack: List['Tile'], lexicon: 'Lexicon') -> Iterator['Move']:
+    seen = set()
+    for placement in _find_placements(_letters(board), rack, lexicon):
+        key = frozenset((row * 15 + col, letter) for row, col, _, letter in placement)
+        if len(placement) == 1 and key in seen:
+            continue
+        seen.add(key)
+        tile_placements = [proto.PlaceTilesTile(row * 15 + col, tile.id, None if tile.letter else letter)
+                           for row, col, tile, letter in placement]
+        tiles = [FullTile(tile, tile_placement)
+                 for (_, _, tile, _), tile_placement in zip(placement, tile_placements)]
+        result = evaluate_move(board, tiles, lexicon.words)
+        if result.valid:
+            yield Move(tile_placements, result)
+
+
+class Bot:
+    def __init__(self, lexicon: 'Lexicon', rng: random.Random = None, greed: float = 1.0,
+                 endgame: 'EndgameSolver' = None, endgame_time: float = 1.0):
+        self.lexicon = lexicon
+        self.rng = rng or random.Random()
+        self.greed = greed
+        self.endgame = endgame
+        self.endgame_time = endgame_time
+
+    def choose(self, board: 'Board', rack: List['Tile'], tiles_left: int, other_rack: List['Tile'] = None,
+               scoreless_turns: int = 0) -> 'proto.ClientMessage':
+        if self.endgame and not tiles_left and rack and other_rack:
+            result = self.endgame.solve(board, rack, other_rack, scoreless_turns, self.endgame_time)
+            if result.best:
+                return result.best
+        moves = sorted(generate_moves(board, rack, self.lexicon), key=lambda move: move.score, reverse=True)
+        if moves:
+            if self.greed >= 1 or self.rng.random() < self.greed:
+                return proto.PlaceTiles(moves[0].tile_placements)
+            return proto.PlaceTiles(self.rng.choice(moves).tile_placements)
+        if tiles_left >= 7 and rack:
+            exchanged = self.rng.sample(rack, self.rng.randint(1, len(rack)))
+            return proto.TileExchange([tile.id for tile in exchanged])
+        return proto.PlaceTiles([])
@@ -0,0 +1,379 @@
+import argparse
+import itertools
+import json
+import socket
+import subprocess
+import sys
+import time
+from threading import Condition, Lock, Thread
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import pyscrabble.protocol as proto
+import pyscrabble.utils as utils
+
+CLIENT_MESSAGE = 0
+SERVER_MESSAGE = 1
+CLOSED = 2
+
+
+class CaptureRecord(NamedTuple):
+    kind: int
+    connection: int
+    time: int
+    data: bytes
+
+
+class CaptureWriter:
+    def __init__(self, path: str, lang: str, seed: int):
+        self.path = path
+        self.lang = lang
+        self.seed = seed
+        self.__file = open(path, 'wb')
+        self.__lock = Lock()
+        self.__connections = itertools.count(1)
+        self.__start = utils.timestamp()
+        b = lang.encode('utf-8')
+        self.__file.write(b'PSCP' + utils.int_to_byte(len(b)) + b + seed.to_bytes(4, byteorder='big'))
+
+    def connection(self) -> int:
+        return next(self.__connections)
+
+    def record(self, connection: int, msg: Optional['proto.Message'], outbound: bool = False):
+        data = msg.serialize() if msg else b''
+        kind = SERVER_MESSAGE if outbound else CLIENT_MESSAGE if msg else CLOSED
+        with self.__lock:
+            if self.__file:
+                t = utils.timestamp() - self.__start
+                self.__file.write(utils.int_to_byte(kind) + connection.to_bytes(2, byteorder='big')
+                                  + t.to_bytes(5, byteorder='big') + len(data).to_bytes(2, byteorder='big') + data)
+
+    def close(self):
+        with self.__lock:
+            if self.__file:
+                self.__file.close()
+                self.__file = None
+
+
+class Capture:
+    def __init__(self, lang: str, seed: int, records: List['CaptureRecord']):
+        self.lang = lang
+        self.seed = seed
+        self.records = records
+
+    def outbound(self) -> Dict[int, List[bytes]]:
+        result = {}
+        for record in self.records:
+            if record.kind == SERVER_MESSAGE and not _is_ping(record.data):
+                result.setdefault(record.connection, []).append(record.data)
+        return result
+
+
+def _is_ping(data: bytes) -> bool:
+    return data[:1] in (b'\x13', b'\x14')
+
+
+def _is_join_ok(data: bytes) -> bool:
+    return data[:1] == b'\x06'
+
+
+def _without_token(data: bytes) -> bytes:
+    if not _is_join_ok(data):
+        return data
+    msg = proto.BufferStream(data, proto.ServerMessage).get_msg()
+    return proto.JoinOk(msg.player_id, msg.players, msg.lang).serialize()
+
+
+def _tokens(messages: List[bytes]) -> List[bytes]:
+    return [proto.BufferStream(data, proto.ServerMessage).get_msg().token for data in messages if _is_join_ok(data)]
+
+
+def _is_resume(data: bytes) -> bool:
+    return data[:1] == b'\x17'
+
+
+def _replace_token(data: bytes, tokens: Dict[bytes, bytes]) -> bytes:
+    msg = proto.BufferStream(data, proto.ClientMessage).get_msg()
+    return proto.Resume(tokens.get(msg.token, msg.token), msg.received).serialize()
+
+
+def read_capture(path: str) -> 'Capture':
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] != b'PSCP':
+        raise ValueError(f'{path} is not a capture file')
+    n = data[4]
+    lang = data[5:5 + n].decode('utf-8')
+    seed = int.from_bytes(data[5 + n:9 + n], byteorder='big')
+    records = []
+    pos = 9 + n
+    while pos + 10 <= len(data):
+        kind = data[pos]
+        connection = int.from_bytes(data[pos + 1:pos + 3], byteorder='big')
+        t = int.from_bytes(data[pos + 3:pos + 8], byteorder='big')
+        size = int.from_bytes(data[pos + 8:pos + 10], byteorder='big')
+        if pos + 10 + size > len(data):
+            break
+        records.append(CaptureRecord(kind, connection, t, data[pos + 10:pos + 10 + size]))
+        pos += 10 + size
+    return Capture(lang, seed, records)
+
+
+class _ReplayConnection:
+    def __init__(self, connection: int, ip: str, port: int, condition: 'Condition', epoch: float):
+        self.connection = connection
+        self.received: List[Tuple[float, bytes]] = []
+        self.sent: List[float] = []
+        self.closed = False
+        self.__condition = condition
+        self.__epoch = epoch
+        self.__socket = socket.create_connection((ip, port))
+        self.__socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.__stream = proto.Stream(self.__socket, proto.ServerMessage)
+        Thread(target=self.__listen, daemon=True).start()
+
+    def __listen(self):
+        try:
+            while True:
+                msg = self.__stream.get_msg()
+                if not msg:
+                    break
+                if isinstance(msg, proto.Ping):
+                    continue
+                with self.__condition:
+                    if self.closed:
+                        break
+                    self.received.append((time.perf_counter() - self.__epoch, msg.serialize()))
+                    self.__condition.notify_all()
+        except IOError:
+            pass
+        finally:
+            with self.__condition:
+                self.closed = True
+                self.__condition.notify_all()
+
+    def send(self, data: bytes):
+        self.sent.append(time.perf_counter() - self.__epoch)
+        try:
+            self.__socket.sendall(data)
+        except IOError:
+            pass
+
+    def close(self):
+        with self.__condition:
+            self.closed = True
+            self.__condition.notify_all()
+        self.__stream.close()
+
+
+def _response_latencies(events: List[Tuple[float, bool]]) -> List[float]:
+    latencies = []
+    pending = None
+    for t, outbound in events:
+        if not outbound:
+            if pending is None:
+                pending = t
+        elif pending is not None:
+            latencies.append(t - pending)
+            pending = None
+    return latencies
+
+
+def _latency_summary(latencies: List[float]) -> dict:
+    latencies = sorted(latencies)
+    return {
+        'count': len(latencies),
+        'p50_ms': utils.percentile(latencies, 50) * 1e3,
+        'p99_ms': utils.percentile(latencies, 99) * 1e3,
+        'max_ms': latencies[-1] * 1e3 if latencies else 0
+    }
+
+
+def _message_name(data: bytes) -> Optional[str]:
+    try:
+        msg = proto.BufferStream(data, proto.ServerMessage).get_msg()
+    except (EOFError, UnicodeDecodeError):
+        return None
+    return type(msg).__name__ if msg else None
+
+
+def _session_tokens(connections: Dict[int, '_ReplayConnection'],
+                    replies: Dict[int, List[bytes]]) -> Dict[bytes, bytes]:
+    result = {}
+    for connection_id, connection in connections.items():
+        received = [data for _, data in connection.received]
+        result.update(zip(_tokens(replies.get(connection_id, [])), _tokens(received)))
+    return result
+
+
+def replay(capture: 'Capture', ip: str, port: int, speed: float = 1.0, stall_timeout: float = 5.0,
+           drain_timeout: float = 1.0) -> dict:
+    condition = Condition()
+    expected: Dict[int, int] = {}
+    replies: Dict[int, List[bytes]] = {}
+    connections: Dict[int, '_ReplayConnection'] = {}
+    original_events: Dict[int, List[Tuple[float, bool]]] = {}
+    stalls = 0
+    epoch = time.perf_counter()
+    first = capture.records[0].time if capture.records else 0
+
+    for record in capture.records:
+        if record.kind == SERVER_MESSAGE:
+            if not _is_ping(record.data):
+                expected[record.connection] = expected.get(record.connection, 0) + 1
+                replies.setdefault(record.connection, []).append(record.data)
+                original_events.setdefault(record.connection, []).append(((record.time - first) / 1e6, True))
+            continue
+        if record.kind == CLIENT_MESSAGE and _is_ping(record.data):
+            continue
+
+        if speed > 0:
+            delay = epoch + (record.time - first) / 1e6 / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        connection = connections.get(record.connection)
+        if connection:
+            count = expected.get(record.connection, 0)
+            with condition:
+                if not condition.wait_for(lambda: len(connection.received) >= count or connection.closed,
+                                          stall_timeout):
+                    stalls += 1
+        if record.kind == CLOSED:
+            if connection:
+                connection.close()
+            continue
+        if not connection:
+            connection = connections[record.connection] = _ReplayConnection(record.connection, ip, port,
+                                                                             condition, epoch)
+        original_events.setdefault(record.connection, []).append(((record.time - first) / 1e6, False))
+        data = record.data
+        if _is_resume(data):
+            with condition:
+                data = _replace_token(data, _session_tokens(connections, replies))
+        connection.send(data)
+
+    outbound = capture.outbound()
+    deadline = time.perf_counter() + drain_timeout
+    for connection_id, connection in connections.items():
+        count = len(outbound.get(connection_id, []))
+        with condition:
+            condition.wait_for(lambda: len(connection.received) >= count or connection.closed,
+                               max(deadline - time.perf_counter(), 0))
+    elapsed = time.perf_counter() - epoch
+    for connection in connections.values():
+        connection.close()
+
+    mismatches = []
+    trailing = 0
+    original_latencies = []
+    replay_latencies = []
+    for connection_id, connection in sorted(connections.items()):
+        original = outbound.get(connection_id, [])
+        received = [data for _, data in connection.received]
+        for i in range(len(original)):
+            if i >= len(received) or _without_token(original[i]) != _without_token(received[i]):
+                mismatches.append({
+                    'connection': connection_id,
+                    'index': i,
+                    'expected': _message_name(original[i]),
+                    'received': _message_name(received[i]) if i < len(received) else None
+                })
+                break
+        else:
+            trailing += len(received) - len(original)
+        original_latencies += _response_latencies(original_events.get(connection_id, []))
+        replay_latencies += _response_latencies(sorted([(t, False) for t in connection.sent]
+                                                       + [(t, True) for t, _ in connection.received]))
+
+    original_duration = (capture.records[-1].time - first) / 1e6 if capture.records else 0.0
+    return {
+        'speed': speed,
+        'connections': len(connections),
+        'messages_sent': sum(len(connection.sent) for connection in connections.values()),
+        'messages_received': sum(len(connection.received) for connection in connections.values()),
+        'messages_expected': sum(len(messages) for messages in outbound.values()),
+        'trailing': trailing,
+        'stalls': stalls,
+        'mismatches': mismatches,
+        'original_s': round(original_duration, 3),
+        'replay_s': round(elapsed, 3),
+        'original_latency': _latency_summary(original_latencies),
+        'replay_latency': _latency_summary(replay_latencies)
+    }
+
+
+def serve(ip: str, port: int, lang: str, seed: int, capture_path: str = None):
+    from pyscrabble.server import Server
+    server = Server(lang, seed, capture_path=capture_path)
+    server.start(ip, port)
+    print('ready', flush=True)
+    sys.stdin.read()
+    server.stop()
+
+
+def _spawn_server(ip: str, port: int, lang: str, seed: int, capture_path: str = None) -> subprocess.Popen:
+    args = [sys.executable, '-m', 'pyscrabble.capture', '--serve', '--host', ip, '--port', str(port),
+            '-l', lang, '-s', str(seed)]
+    if capture_path:
+        args += ['--capture', capture_path]
+    process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    if process.stdout.readline().strip() != b'ready':
+        process.kill()
+        raise RuntimeError('Server process failed to start')
+    return process
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay captured client traffic against a PyScrabble server')
+    parser.add_argument('capture', nargs='?', help='capture file written by Server(capture_path=...)')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='replay speed relative to the capture, 0 sends as fast as the server answers')
+    parser.add_argument('--host', default='127.0.0.1', help='server address')
+    parser.add_argument('--port', type=int, default=17500, help='server port')
+    parser.add_argument('--no-spawn', action='store_true',
+                        help='replay against a running server started with the capture\'s language and seed')
+    parser.add_argument('--stall-timeout', type=float, default=5.0,
+                        help='seconds to wait for the replies that preceded a message in the capture')
+    parser.add_argument('--capture-replay', help='capture the replayed server\'s traffic to this file')
+    parser.add_argument('-o', '--output', help='write the report as JSON to this file')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('-l', '--lang', default='en', help=argparse.SUPPRESS)
+    parser.add_argument('-s', '--seed', type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument('--capture', dest='capture_path', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.host, args.port, args.lang, args.seed, args.capture_path)
+        return
+    if not args.capture:
+        parser.error('the capture file is required')
+
+    capture = read_capture(args.capture)
+    process = None if args.no_spawn else _spawn_server(args.host, args.port, capture.lang, capture.seed,
+                                                       args.capture_replay)
+    try:
+        report = replay(capture, args.host, args.port, args.speed, args.stall_timeout)
+    finally:
+        if process:
+            process.stdin.close()
+            process.wait()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    print(f'{report["connections"]} connections, {report["messages_sent"]} messages sent, '
+          f'{report["messages_received"]}/{report["messages_expected"]} replies received '
+          f'({report["trailing"]} after the captured ones), {report["stalls"]} stalls')
+    print(f'duration: capture {report["original_s"]} s, replay {report["replay_s"]} s at speed {args.speed}')
+    for name in ('original', 'replay'):
+        latency = report[f'{name}_latency']
+        print(f'{name} response latency: p50={latency["p50_ms"]:.2f}ms p99={latency["p99_ms"]:.2f}ms '
+              f'max={latency["max_ms"]:.2f}ms')
+    for mismatch in report['mismatches']:
+        print(f'connection {mismatch["connection"]} diverges at reply {mismatch["index"]}: '
+              f'expected {mismatch["expected"]}, received {mismatch["received"]}')
+    sys.exit(1 if report['mismatches'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,25 @@
+import heapq
+import selectors
 import socket
+import time
+import traceback
 from abc import ABC
-from queue import Queue
-from threading import RLock, Thread
-from typing import Any, Dict, Callable, Optional, Type
+from collections import deque
+from functools import partial
+from threading import Lock, Thread
+from types import MappingProxyType
+from typing import Any, Deque, Dict, Callable, List, Mapping, NamedTuple, Optional, Tuple, Type
 
 import pyscrabble.protocol as proto
+import pyscrabble.tracing as tracing
+import pyscrabble.utils as utils
 from pyscrabble.model import Board, Player, Tile
+from pyscrabble.rules import CompactLexicon, FullTile, MoveResult, evaluate_move, load_lexicon
+
+PING_INTERVAL = 5.0
+RESUME_TIMEOUT = 30.0
+RESUME_DELAY = 0.5
+RESUME_BUFFER_SIZE = 256
 
 
 class Client:
@@ -17,48 +31,376 @@ class Client:
         self.tile_count: int = None
 
 
+class ClientState(NamedTuple):
+    player_id: int
+    name: str
+    ready: bool
+    tile_count: Optional[int]
+    score: int
+
+
+class GameState(NamedTuple):
+    lobby: bool
+    clients: Mapping[int, 'ClientState']
+    player_id: Optional[int]
+    player_turn: Optional[bool]
+    turn_player_id: Optional[int]
+    tiles_left: Optional[int]
+    tiles: Tuple['Tile', ...]
+    board: Optional[Tuple[Optional['Tile'], ...]]
+    move_preview: Optional['proto.MovePreview']
+    latency: Optional[float]
+    desynced: bool
+
+
+OnUpdate = Callable[['proto.ServerMessage', Optional[str], 'GameState'], Any]
+
+
+def board_from_state(state: 'GameState') -> 'Board':
+    board = Board()
+    if state.board:
+        for position, tile in enumerate(state.board):
+            board.place(position, tile)
+    return board
+
+
+class EventLoop:
+    def __init__(self):
+        self.__selector = selectors.DefaultSelector()
+        self.__wakeup_in, self.__wakeup_out = socket.socketpair()
+        self.__wakeup_in.setblocking(False)
+        self.__wakeup_out.setblocking(False)
+        self.__selector.register(self.__wakeup_in, selectors.EVENT_READ)
+        self.__calls: List[Tuple[Callable[[], Any], Optional['Connection']]] = []
+        self.__timers: List[Tuple[float, int, Callable[[], Any], Optional['Connection']]] = []
+        self.__timer_count = 0
+        self.__lock = Lock()
+        self.__thread: Thread = None
+
+    def call_soon(self, func: Callable[[], Any], connection: 'Connection' = None):
+        with self.__lock:
+            self.__calls.append((func, connection))
+            self.__start()
+        self.__wakeup()
+
+    def call_later(self, delay: float, func: Callable[[], Any], connection: 'Connection' = None):
+        with self.__lock:
+            self.__timer_count += 1
+            heapq.heappush(self.__timers, (time.monotonic() + delay, self.__timer_count, func, connection))
+            self.__start()
+        self.__wakeup()
+
+    def __start(self):
+        if not self.__thread:
+            self.__thread = Thread(target=self.__run, daemon=True)
+            self.__thread.start()
+
+    def __wakeup(self):
+        try:
+            self.__wakeup_out.send(b'\x00')
+        except BlockingIOError:
+            pass
+
+    def register(self, sock: socket.socket, events: int, connection: 'Connection'):
+        self.__selector.register(sock, events, connection)
+
+    def modify(self, sock: socket.socket, events: int, connection: 'Connection'):
+        self.__selector.modify(sock, events, connection)
+
+    def unregister(self, sock: socket.socket):
+        self.__selector.unregister(sock)
+
+    def __run(self):
+        while True:
+            with self.__lock:
+                timeout = max(0.0, self.__timers[0][0] - time.monotonic()) if self.__timers else None
+            for key, events in self.__selector.select(timeout):
+                if key.data is None:
+                    try:
+                        while self.__wakeup_in.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                else:
+                    self.__dispatch(partial(key.data.on_events, events), key.data)
+            with self.__lock:
+                calls = self.__calls
+                self.__calls = []
+                now = time.monotonic()
+                while self.__timers and self.__timers[0][0] <= now:
+                    calls.append(heapq.heappop(self.__timers)[2:])
+            for call, connection in calls:
+                self.__dispatch(call, connection)
+
+    @staticmethod
+    def __dispatch(func: Callable[[], Any], connection: Optional['Connection']):
+        try:
+            func()
+        except Exception:
+            traceback.print_exc()
+            if connection:
+                try:
+                    connection.abort()
+                except Exception:
+                    traceback.print_exc()
+
+
+_default_loop: 'EventLoop' = None
+
+
+def default_loop() -> 'EventLoop':
+    global _default_loop
+    if not _default_loop:
+        _default_loop = EventLoop()
+    return _default_loop
+
+
 class Connection:
-    def __init__(self, on_update: Callable[['proto.ServerMessage', Optional[str]], Any]):
-        self.__stream: 'proto.Stream' = None
-        self.worker: 'proto.StreamWorker' = None
-        self.game = Game(on_update)
-
-    def start(self, ip: str, port: int, name: str):
-        if not self.__stream:
-            self.__stream = proto.Stream(socket.create_connection((ip, port)), proto.ServerMessage)
-            self.worker = proto.StreamWorker(self.__stream, self.game.queue_in)
-            self.worker.queue_out.put(proto.Join(name))
-            Thread(target=self.worker.listen_incoming, daemon=True).start()
-            Thread(target=self.worker.listen_outgoing, daemon=True).start()
-            Thread(target=self.game.process_incoming_messages, daemon=True).start()
+    def __init__(self, on_update: 'OnUpdate', loop: 'EventLoop' = None, local_validation: bool = False,
+                 auto_resume: bool = False):
+        self.__socket: socket.socket = None
+        self.__address: Tuple[str, int] = None
+        self.__loop = loop or default_loop()
+        self.__buffer_in = b''
+        self.__buffer_out = bytearray()
+        self.__events = selectors.EVENT_READ
+        self.__closing = False
+        self.__closed = False
+        self.__received = 0
+        self.__sent = 0
+        self.__recent: Deque[bytes] = deque(maxlen=RESUME_BUFFER_SIZE)
+        self.__resume_deadline: float = None
+        self.__resume_delay = RESUME_DELAY
+        self.__resuming = False
+        self.auto_resume = auto_resume
+        self.game = Game(on_update, local_validation)
+
+    def start(self, ip: str, port: int, name: str, lang: str = None, rating: int = 0):
+        if not self.__socket:
+            self.__address = (ip, port)
+            self.__socket = socket.create_connection((ip, port))
+            self.__socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.__socket.setblocking(False)
+            self.__loop.call_soon(self.__open, self)
+            self.send_msg(proto.FindGame(name, lang, rating) if lang else proto.Join(name))
 
     def stop(self):
-        self.worker.queue_out.put(proto.Leave())
-        self.game.queue_in.put((None,))
+        self.__loop.call_soon(self.__stop, self)
 
     def send_msg(self, msg: 'proto.ClientMessage'):
-        self.worker.queue_out.put(msg)
+        self.__loop.call_soon(lambda: self.__send(msg), self)
+
+    def ping(self):
+        self.send_msg(proto.Ping(utils.timestamp()))
+
+    def __send(self, msg: 'proto.ClientMessage'):
+        data = msg.serialize()
+        if not isinstance(msg, (proto.Join, proto.FindGame, proto.Ping, proto.Pong)):
+            self.__sent += 1
+            self.__recent.append(data)
+            if self.__resuming:
+                return
+        self.__write(data)
+
+    def __resend(self, received: int):
+        missed = min(self.__sent - received, len(self.__recent))
+        recent = list(self.__recent)
+        for data in recent[len(recent) - missed:]:
+            self.__write(data)
+
+    def __open(self):
+        self.__loop.register(self.__socket, self.__events, self)
+        self.__loop.call_later(PING_INTERVAL, self.__ping, self)
+
+    def __ping(self):
+        if self.__closing or (self.__closed and self.__resume_deadline is None):
+            return
+        if not self.__closed:
+            self.__write(proto.Ping(utils.timestamp()).serialize())
+        self.__loop.call_later(PING_INTERVAL, self.__ping, self)
+
+    def __reconnect(self):
+        if self.__closing:
+            return
+        try:
+            s = socket.create_connection(self.__address, RESUME_DELAY * 2)
+        except IOError:
+            if time.monotonic() + self.__resume_delay < self.__resume_deadline:
+                self.__loop.call_later(self.__resume_delay, self.__reconnect, self)
+                self.__resume_delay = min(self.__resume_delay * 2, 5.0)
+            else:
+                self.__resume_deadline = None
+                Handler.handle(None, self.game)
+            return
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        s.setblocking(False)
+        self.__socket = s
+        self.__buffer_in = b''
+        self.__buffer_out = bytearray()
+        self.__events = selectors.EVENT_READ
+        self.__closed = False
+        self.__resuming = True
+        self.__resume_deadline = None
+        self.__resume_delay = RESUME_DELAY
+        self.__loop.register(s, self.__events, self)
+        self.__write(proto.Resume(self.game.token, self.__received).serialize())
+
+    def abort(self):
+        self.__closing = True
+        if not self.__closed:
+            self.__close()
+        elif self.__resume_deadline is not None:
+            self.__resume_deadline = None
+            Handler.handle(None, self.game)
+
+    def __stop(self):
+        if not self.__closed:
+            self.__write(proto.Leave().serialize())
+            self.__closing = True
+        elif self.__resume_deadline is not None:
+            self.__closing = True
+            self.__resume_deadline = None
+            Handler.handle(None, self.game)
+
+    def __write(self, data: bytes):
+        if self.__closed or self.__closing:
+            return
+        self.__buffer_out += data
+        self.__flush()
+
+    def __flush(self):
+        try:
+            while self.__buffer_out:
+                sent = self.__socket.send(self.__buffer_out)
+                del self.__buffer_out[:sent]
+        except BlockingIOError:
+            pass
+        except IOError:
+            self.__close()
+            return
+        if self.__closing and not self.__buffer_out:
+            self.__close()
+            return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if self.__buffer_out else 0)
+        if events != self.__events:
+            self.__events = events
+            self.__loop.modify(self.__socket, events, self)
+
+    def on_events(self, events: int):
+        if events & selectors.EVENT_WRITE:
+            self.__flush()
+        if events & selectors.EVENT_READ and not self.__closed:
+            self.__read()
+
+    def __read(self):
+        try:
+            data = self.__socket.recv(65536)
+        except BlockingIOError:
+            return
+        except IOError:
+            data = b''
+        if not data:
+            self.__close()
+            return
+        self.__buffer_in += data
+        while self.__buffer_in and not self.__closed:
+            stream = proto.BufferStream(self.__buffer_in, proto.ServerMessage)
+            try:
+                msg = stream.get_msg()
+            except EOFError:
+                break
+            self.__buffer_in = self.__buffer_in[stream.position:]
+            if not msg:
+                self.__close()
+                break
+            if type(msg) is proto.Ping:
+                self.__write(proto.Pong(msg.timestamp).serialize())
+                continue
+            if isinstance(msg, proto.JoinOk):
+                self.__received = 0
+                if msg.token != self.game.token or self.__resuming:
+                    self.__sent = 0
+                    self.__recent.clear()
+            if not isinstance(msg, (proto.Pong, proto.Resumed)):
+                self.__received += 1
+            if self.__resuming:
+                self.__resuming = False
+                if isinstance(msg, proto.Resumed):
+                    self.__resend(msg.received)
+                elif isinstance(msg, proto.ActionRejected):
+                    self.game.token = None
+            Handler.handle(msg, self.game)
+            if isinstance(msg, proto.Shutdown):
+                self.__close(False)
+
+    def __close(self, notify: bool = True):
+        if self.__closed:
+            return
+        self.__closed = True
+        self.__loop.unregister(self.__socket)
+        try:
+            self.__socket.shutdown(socket.SHUT_RDWR)
+        except IOError:
+            pass
+        self.__socket.close()
+        if notify and self.auto_resume and self.game.token and not self.game.lobby and not self.__closing:
+            self.__resume_deadline = time.monotonic() + RESUME_TIMEOUT
+            Handler.handle(proto.Notification('Connection lost, reconnecting...'), self.game)
+            self.__loop.call_later(self.__resume_delay, self.__reconnect, self)
+        elif notify:
+            Handler.handle(None, self.game)
 
 
 class Game:
-    def __init__(self, on_update: Callable[['proto.ServerMessage', Optional[str]], Any]):
+    def __init__(self, on_update: 'OnUpdate', local_validation: bool = False):
+        self.lang: str = None
+        self.local_validation = local_validation
+        self.lexicon: 'CompactLexicon' = None
         self.board: 'Board' = None
+        self.board_changed = False
+        self.desynced = False
         self.tiles_left: int = None
         self.clients: Dict[int, 'Client'] = {}
-        self.lock = RLock()
         self.lobby = True
         self.player_client: 'Client' = None
         self.player_turn: bool = None
-        self.queue_in = Queue()
         self.on_update = on_update
         self.turn_player_id: int = None
-
-    def process_incoming_messages(self):
-        while True:
-            msg, = self.queue_in.get()
-            Handler.handle(msg, self)
-            if not msg or isinstance(msg, proto.Shutdown):
-                break
+        self.move_preview: 'proto.MovePreview' = None
+        self.latency: float = None
+        self.token: bytes = None
+        self.state = GameState(True, MappingProxyType({}), None, None, None, None, (), None, None, None, False)
+
+    def publish_state(self):
+        board = self.state.board
+        if self.board_changed:
+            board = tuple(square.tile for row in self.board.squares for square in row) if self.board else None
+            self.board_changed = False
+        clients = MappingProxyType({
+            client.player_id: ClientState(client.player_id, client.name, client.ready, client.tile_count,
+                                          client.player.score if client.player else 0)
+            for client in self.clients.values()
+        })
+        player_client = self.player_client
+        tiles = tuple(player_client.player.tiles) if player_client and player_client.player else ()
+        self.state = GameState(self.lobby, clients, player_client.player_id if player_client else None,
+                               self.player_turn, self.turn_player_id, self.tiles_left, tiles, board,
+                               self.move_preview, self.latency, self.desynced)
+
+    def load_lexicon(self):
+        self.lexicon = load_lexicon(self.lang)
+
+    def check_move(self, tile_placements: List['proto.PlaceTilesTile']) -> Optional['MoveResult']:
+        state = self.state
+        lexicon = self.lexicon
+        if not lexicon or not state.board or not tile_placements:
+            return None
+        player_tiles_by_id = {tile.id: tile for tile in state.tiles}
+        tiles = [FullTile(player_tiles_by_id[tile.id], tile)
+                 for tile in tile_placements if tile.id in player_tiles_by_id]
+        if len(tiles) != len(tile_placements):
+            return MoveResult('Placed tiles do not belong to player!')
+        return evaluate_move(board_from_state(state), tiles, lexicon)
 
 
 class Handler(ABC):
@@ -66,12 +408,17 @@ class Handler(ABC):
     def handle(msg: Optional['proto.ServerMessage'], game: 'Game'):
         if not msg:
             msg = proto.Shutdown()
+        span = tracing.start('client', msg) if tracing.enabled else None
         handler = Handler._mappings.get(msg.__class__)
         text = None
-        if handler:
-            with game.lock:
+        try:
+            if handler:
                 text = handler._handle(msg, game)
-        game.on_update(msg, text)
+                game.publish_state()
+            game.on_update(msg, text, game.state)
+        finally:
+            if span:
+                span.finish()
 
     @classmethod
     def _handle(cls, msg: 'proto.ServerMessage', game: 'Game') -> Optional[str]:
@@ -81,6 +428,11 @@ class Handler(ABC):
 class JoinOkHandler(Handler):
     @classmethod
     def _handle(cls, msg: 'proto.JoinOk', game: 'Game') -> None:
+        game.lang = msg.lang
+        game.token = msg.token or None
+        game.lobby = True
+        if game.local_validation:
+            Thread(target=game.load_lexicon, daemon=True).start()
         for player in msg.players:
             client = Client(player.player_id, player.name, player.ready)
             game.clients[player.player_id] = client
@@ -123,6 +475,8 @@ class StartTurnHandler(Handler):
         if game.lobby:
             game.lobby = False
             game.board = Board()
+            game.board_changed = True
+            game.desynced = False
             for client in game.clients.values():
                 client.player = Player()
         turn_client = game.clients[msg.turn_player_id]
@@ -137,12 +491,17 @@ class StartTurnHandler(Handler):
 
 class EndTurnHandler(Handler):
     @classmethod
-    def _handle(cls, msg: 'proto.EndTurn', game: 'Game') -> None:
+    def _handle(cls, msg: 'proto.EndTurn', game: 'Game') -> Optional[str]:
         client = game.clients[msg.player_id]
         client.player.score = msg.score
         for placed_tile in msg.placed_tiles:
             tile = Tile(None, placed_tile.points, placed_tile.letter)
-            game.board[placed_tile.position].tile = tile
+            game.board.place(placed_tile.position, tile)
+        if msg.placed_tiles:
+            game.board_changed = True
+        if msg.board_hash != game.board.hash and not game.desynced:
+            game.desynced = True
+            return 'Board is out of sync with the server'
 
 
 class EndGameHandler(Handler):
@@ -160,12 +519,42 @@ class PlayerChatHandler(Handler):
         return f'{game.clients[msg.player_id].name}: {msg.text}'
 
 
+class ChatBatchHandler(Handler):
+    @classmethod
+    def _handle(cls, msg: 'proto.ChatBatch', game: 'Game') -> str:
+        return '\n'.join(f'{entry.name}: {entry.text}' for entry in msg.entries)
+
+
 class NotificationHandler(Handler):
     @classmethod
     def _handle(cls, msg: 'proto.Notification', game: 'Game') -> str:
         return f'{msg.text}'
 
 
+class MovePreviewHandler(Handler):
+    @classmethod
+    def _handle(cls, msg: 'proto.MovePreview', game: 'Game') -> None:
+        game.move_preview = msg
+
+
+class QueuedHandler(Handler):
+    @classmethod
+    def _handle(cls, msg: 'proto.Queued', game: 'Game') -> str:
+        return f'Waiting for players ({msg.waiting} in queue)'
+
+
+class ResumedHandler(Handler):
+    @classmethod
+    def _handle(cls, msg: 'proto.Resumed', game: 'Game') -> str:
+        return 'Reconnected'
+
+
+class PongHandler(Handler):
+    @classmethod
+    def _handle(cls, msg: 'proto.Pong', game: 'Game') -> None:
+        game.latency = (utils.timestamp() - msg.timestamp) / 1e6
+
+
 Handler._mappings: Dict[Type['proto.ServerMessage'], Type['Handler']] = {
     proto.JoinOk: JoinOkHandler,
     proto.ActionRejected: ActionRejectedHandler,
@@ -176,5 +565,10 @@ Handler._mappings: Dict[Type['proto.ServerMessage'], Type['Handler']] = {
     proto.EndTurn: EndTurnHandler,
     proto.EndGame: EndGameHandler,
     proto.PlayerChat: PlayerChatHandler,
-    proto.Notification: NotificationHandler
+    proto.ChatBatch: ChatBatchHandler,
+    proto.Notification: NotificationHandler,
+    proto.MovePreview: MovePreviewHandler,
+    proto.Pong: PongHandler,
+    proto.Queued: QueuedHandler,
+    proto.Resumed: ResumedHandler
 }
@@ -0,0 +1,354 @@
+import argparse
+import os
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import pyscrabble.protocol as proto
+import pyscrabble.server as server
+from pyscrabble.bot import Lexicon, generate_moves
+from pyscrabble.model import Board, Tile
+
+SCORELESS_TURNS = 6
+TABLE_SIZE = 1 << 20
+EXACT, LOWER, UPPER = range(3)
+_SOLVED = 1000
+_INF = 1 << 30
+
+_lexicon: 'Lexicon' = None
+_lexicon_lang: str = None
+_search: '_Search' = None
+
+
+class Play(NamedTuple):
+    score: int
+    tiles: Tuple[Tuple[int, Optional[str], int, str], ...]
+
+
+class EndgameResult(NamedTuple):
+    value: int
+    moves: List['proto.PlaceTiles']
+    depth: int
+    nodes: int
+    complete: bool
+    elapsed: float
+
+    @property
+    def best(self) -> Optional['proto.PlaceTiles']:
+        return self.moves[0] if self.moves else None
+
+
+class _Entry(NamedTuple):
+    depth: int
+    value: int
+    flag: int
+    line: Tuple[Optional['Play'], ...]
+
+
+class _Timeout(Exception):
+    pass
+
+
+RackKey = Tuple[Tuple[str, int], ...]
+
+
+def _rack_key(rack: Sequence['Tile']) -> 'RackKey':
+    return tuple(sorted((tile.letter or '', tile.points) for tile in rack))
+
+
+def _rack_points(rack: Sequence['Tile']) -> int:
+    return sum(tile.points for tile in rack)
+
+
+def _take(rack: List['Tile'], play: 'Play') -> Tuple[List['Tile'], List[Tuple[int, 'Tile']]]:
+    remaining = list(rack)
+    placed = []
+    for position, rack_letter, points, letter in play.tiles:
+        tile = next(tile for tile in remaining if tile.letter == rack_letter and tile.points == points)
+        remaining.remove(tile)
+        placed.append((position, tile))
+    return remaining, placed
+
+
+def _place(board: 'Board', play: 'Play', placed: List[Tuple[int, 'Tile']]):
+    for (position, tile), (_, _, _, letter) in zip(placed, play.tiles):
+        board.place(position, Tile(tile.id, tile.points, letter))
+
+
+def _remove(board: 'Board', play: 'Play'):
+    for position, _, _, _ in play.tiles:
+        board.place(position, None)
+
+
+class _Search:
+    def __init__(self, lexicon: 'Lexicon', deadline: float = None, table_size: int = TABLE_SIZE):
+        self.lexicon = lexicon
+        self.deadline = deadline
+        self.table_size = table_size
+        self.nodes = 0
+        self.cutoffs = 0
+        self.table: Dict[Tuple[int, 'RackKey', 'RackKey', int], '_Entry'] = {}
+        self.plays: Dict[Tuple[int, 'RackKey'], List['Play']] = {}
+
+    def generate(self, board: 'Board', rack: List['Tile']) -> List['Play']:
+        key = (board.hash, _rack_key(rack))
+        plays = self.plays.get(key)
+        if plays is None:
+            if len(self.plays) >= TABLE_SIZE:
+                self.plays.clear()
+            rack_by_id = {tile.id: tile for tile in rack}
+            plays = [Play(move.score, tuple((placement.position, rack_by_id[placement.id].letter,
+                                             rack_by_id[placement.id].points,
+                                             rack_by_id[placement.id].letter or placement.letter)
+                                            for placement in move.tile_placements))
+                     for move in generate_moves(board, rack, self.lexicon)]
+            plays.sort(key=lambda play: play.score, reverse=True)
+            self.plays[key] = plays
+        return plays
+
+    def negamax(self, board: 'Board', rack: List['Tile'], other: List['Tile'], passes: int, depth: int,
+                alpha: int, beta: int) -> Tuple[int, Tuple[Optional['Play'], ...]]:
+        self.nodes += 1
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise _Timeout()
+        if depth <= 0:
+            self.cutoffs += 1
+            return _rack_points(other) - _rack_points(rack), ()
+
+        key = (board.hash, _rack_key(rack), _rack_key(other), passes)
+        entry = self.table.get(key)
+        first = None
+        if entry:
+            first = entry.line[0] if entry.line else None
+            if entry.depth >= depth:
+                if entry.depth < _SOLVED:
+                    self.cutoffs += 1
+                if entry.flag == EXACT or (entry.flag == LOWER and entry.value >= beta) \
+                        or (entry.flag == UPPER and entry.value <= alpha):
+                    return entry.value, entry.line
+
+        original_alpha = alpha
+        cutoffs = self.cutoffs
+        plays: List[Optional['Play']] = list(self.generate(board, rack))
+        if first in plays:
+            plays.remove(first)
+            plays.insert(0, first)
+        plays.append(None)
+
+        best, line = -_INF, ()
+        for play in plays:
+            value, child_line = self.play(board, rack, other, passes, play, depth, alpha, beta)
+            if value > best:
+                best, line = value, (play,) + child_line
+            alpha = max(alpha, best)
+            if alpha >= beta:
+                break
+
+        if self.table_size:
+            if len(self.table) >= self.table_size:
+                self.table.clear()
+            flag = UPPER if best <= original_alpha else LOWER if best >= beta else EXACT
+            self.table[key] = _Entry(depth if self.cutoffs > cutoffs else _SOLVED, best, flag, line)
+        return best, line
+
+    def play(self, board: 'Board', rack: List['Tile'], other: List['Tile'], passes: int, play: Optional['Play'],
+             depth: int, alpha: int, beta: int) -> Tuple[int, Tuple[Optional['Play'], ...]]:
+        if play is None:
+            if passes + 1 >= SCORELESS_TURNS:
+                return _rack_points(other) - _rack_points(rack), ()
+            value, line = self.negamax(board, other, rack, passes + 1, depth - 1, -beta, -alpha)
+            return -value, line
+        remaining, placed = _take(rack, play)
+        if not remaining:
+            return play.score + 2 * _rack_points(other), ()
+        _place(board, play, placed)
+        try:
+            value, line = self.negamax(board, other, remaining, 0, depth - 1, play.score - beta, play.score - alpha)
+        finally:
+            _remove(board, play)
+        return play.score - value, line
+
+
+def _load(lang: str, lexicon: 'Lexicon' = None) -> 'Lexicon':
+    global _lexicon, _lexicon_lang
+    if lexicon or _lexicon_lang != lang:
+        _lexicon = lexicon or Lexicon.load(lang)
+        _lexicon_lang = lang
+    return _lexicon
+
+
+def _init_worker(lang: str, table_size: int):
+    global _search
+    _search = _Search(_load(lang), table_size=table_size)
+
+
+def _search_root_play(tiles: List[Tuple[int, 'Tile']], rack: List['Tile'], other: List['Tile'], passes: int,
+                      play: Optional['Play'], depth: int, deadline: float) \
+        -> Tuple[Optional[int], Tuple[Optional['Play'], ...], int, bool]:
+    board = Board()
+    for position, tile in tiles:
+        board.place(position, tile)
+    _search.deadline = deadline
+    nodes, cutoffs = _search.nodes, _search.cutoffs
+    try:
+        value, line = _search.play(board, rack, other, passes, play, depth, -_INF, _INF)
+    except _Timeout:
+        return None, (), _search.nodes - nodes, False
+    return value, (play,) + line, _search.nodes - nodes, _search.cutoffs == cutoffs
+
+
+def _messages(rack: List['Tile'], other: List['Tile'], line: Sequence[Optional['Play']]) -> List['proto.PlaceTiles']:
+    messages = []
+    for play in line:
+        if play is None:
+            messages.append(proto.PlaceTiles([]))
+        else:
+            remaining, placed = _take(rack, play)
+            messages.append(proto.PlaceTiles([proto.PlaceTilesTile(position, tile.id, None if tile.letter else letter)
+                                              for (position, tile), (_, _, _, letter) in zip(placed, play.tiles)]))
+            rack = remaining
+        rack, other = other, rack
+    return messages
+
+
+class EndgameSolver:
+    def __init__(self, lang: str, workers: int = None, lexicon: 'Lexicon' = None, table_size: int = TABLE_SIZE):
+        self.lang = lang
+        self.workers = workers or os.cpu_count() or 1
+        self.lexicon = _load(lang, lexicon)
+        self.__search = _Search(self.lexicon, table_size=table_size)
+        self.__pool = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(lang, table_size)) \
+            if self.workers > 1 else None
+
+    def unseen_tiles(self, board: 'Board', rack: Sequence['Tile']) -> List['Tile']:
+        counts = Counter((tile.letter, tile.points) for tile in server.Game._tiles[self.lang])
+        for row in board.squares:
+            for square in row:
+                if square.tile:
+                    counts[(square.tile.letter if square.tile.points else None, square.tile.points)] -= 1
+        counts.subtract((tile.letter, tile.points) for tile in rack)
+        return [Tile(-1 - i, points, letter) for i, (letter, points) in enumerate(counts.elements())]
+
+    def solve(self, board: 'Board', rack: List['Tile'], other: List['Tile'], passes: int = 0,
+              time_budget: float = 5.0, max_depth: int = None) -> 'EndgameResult':
+        start = time.monotonic()
+        deadline = start + time_budget
+        tiles = [(position, square.tile) for position, square in enumerate(square for row in board.squares
+                                                                           for square in row) if square.tile]
+        root: List[Optional['Play']] = list(self.__search.generate(board, rack)) + [None]
+        max_depth = max_depth or 2 * (len(rack) + len(other)) + SCORELESS_TURNS
+        result = EndgameResult(0, [], 0, 0, False, 0.0)
+        nodes = 0
+        for depth in range(1, max_depth + 1):
+            if self.__pool:
+                values = self.__search_parallel(tiles, rack, other, passes, root, depth, deadline)
+            else:
+                values = self.__search_sequential(board, rack, other, passes, root, depth, deadline)
+            nodes += sum(count for _, _, count, _ in values)
+            if not values:
+                break
+            value, line, _, _ = max(values, key=lambda value: value[0])
+            finished = len(values) == len(root)
+            complete = finished and all(exact for _, _, _, exact in values)
+            result = EndgameResult(value, _messages(rack, other, line), depth, nodes, complete,
+                                   time.monotonic() - start)
+            if not finished or complete or time.monotonic() >= deadline:
+                break
+            order = {line[0]: i for i, (_, line, _, _) in enumerate(sorted(values, key=lambda value: -value[0]))}
+            root.sort(key=order.get)
+        return result._replace(nodes=nodes, elapsed=time.monotonic() - start)
+
+    def __search_sequential(self, board: 'Board', rack: List['Tile'], other: List['Tile'], passes: int,
+                            root: List[Optional['Play']], depth: int, deadline: float) \
+            -> List[Tuple[int, Tuple[Optional['Play'], ...], int, bool]]:
+        search = self.__search
+        search.deadline = deadline
+        values = []
+        best = -_INF
+        for play in root:
+            nodes, cutoffs = search.nodes, search.cutoffs
+            try:
+                value, line = search.play(board, rack, other, passes, play, depth, best, _INF)
+            except _Timeout:
+                break
+            best = max(best, value)
+            values.append((value, (play,) + line, search.nodes - nodes, search.cutoffs == cutoffs))
+        return values
+
+    def __search_parallel(self, tiles: List[Tuple[int, 'Tile']], rack: List['Tile'], other: List['Tile'],
+                          passes: int, root: List[Optional['Play']], depth: int, deadline: float) \
+            -> List[Tuple[int, Tuple[Optional['Play'], ...], int, bool]]:
+        futures = [self.__pool.submit(_search_root_play, tiles, rack, other, passes, play, depth, deadline)
+                   for play in root]
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, max(deadline - time.monotonic(), 0), FIRST_COMPLETED)
+            if not done or any(future.result()[0] is None for future in done):
+                break
+        for future in pending:
+            future.cancel()
+        values = []
+        for future in futures:
+            if not future.done() or future.cancelled() or future.result()[0] is None:
+                break
+            values.append(future.result())
+        return values
+
+    def close(self):
+        if self.__pool:
+            self.__pool.shutdown()
+            self.__pool = None
+
+
+def main():
+    from pyscrabble.journal import GameRecord
+    from pyscrabble.replay import Replay, _format_board
+
+    parser = argparse.ArgumentParser(description='Solve the endgame of a recorded two-player PyScrabble game')
+    parser.add_argument('record', help='path to a game record')
+    parser.add_argument('-t', '--turn', type=int, help='solve the position after this many actions instead of the '
+                                                       'first one with an empty bag')
+    parser.add_argument('--time', type=float, default=10.0, help='time budget in seconds')
+    parser.add_argument('--depth', type=int, help='maximum search depth in turns')
+    parser.add_argument('-j', '--workers', type=int, help='worker processes, defaults to the CPU count')
+    args = parser.parse_args()
+
+    record = GameRecord.load(args.record)
+    replay = Replay(record)
+    turn = args.turn
+    if turn is None:
+        turn = next((turn for turn in range(len(replay) + 1)
+                     if not replay.seek(turn).free_tiles and not replay.game.lobby), None)
+        if turn is None:
+            parser.exit(1, 'The bag is never empty in this game\n')
+    game = replay.seek(turn)
+    if len(game.clients) != 2 or game.free_tiles or game.lobby:
+        parser.exit(1, f'The position after {turn} actions is not a two-player endgame\n')
+
+    client = next(client for client in game.clients if client.player_id == game.turn_player_id)
+    opponent = next(client_ for client_ in game.clients if client_ is not client)
+    print(f'Turn {turn}/{len(replay)}, {client.name} to move')
+    print(_format_board(game))
+    for client_ in (client, opponent):
+        print(f'{client_.name}: {client_.player.score} points, rack '
+              f'{"".join(tile.letter or "?" for tile in client_.player.tiles)}')
+
+    solver = EndgameSolver(record.lang, args.workers)
+    try:
+        result = solver.solve(game.board, client.player.tiles, opponent.player.tiles, game.turns_without_score,
+                              args.time, args.depth)
+    finally:
+        solver.close()
+    print(f'{"Solved" if result.complete else "Best found"} at depth {result.depth}: '
+          f'{client.name} {result.value:+d} from here ({result.nodes} nodes in {result.elapsed:.2f} s)')
+    tiles_by_id = {tile.id: tile for tile in client.player.tiles + opponent.player.tiles}
+    for i, msg in enumerate(result.moves):
+        letters = ''.join(placement.letter or tiles_by_id[placement.id].letter for placement in msg.tile_placements)
+        position = msg.tile_placements[0].position if msg.tile_placements else None
+        move = f'{letters} at row {position // 15 + 1}, column {position % 15 + 1}' if letters else 'pass'
+        print(f'  {(client, opponent)[i % 2].name}: {move}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import json
+import signal
+import time
+from collections import deque
+from threading import Event, Lock, Thread
+from typing import Any, Deque, Dict, IO, List, NamedTuple
+from weakref import WeakValueDictionary
+
+RING_SIZE = 256
+
+_rooms: Dict[int, 'RoomLog'] = WeakValueDictionary()
+
+
+class LogEvent(NamedTuple):
+    time: float
+    room: int
+    kind: str
+    fields: Dict[str, Any]
+
+    def to_json(self) -> str:
+        return json.dumps({'time': round(self.time, 6), 'room': self.room, 'event': self.kind, **self.fields},
+                          ensure_ascii=False)
+
+
+class EventLogWriter:
+    def __init__(self, path: str, flush_interval: float = 0.5, max_pending: int = 65536):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.dropped = 0
+        self.__file = open(path, 'a', encoding='utf-8')
+        self.__pending: Deque['LogEvent'] = deque()
+        self.__lock = Lock()
+        self.__stopped = Event()
+        self.__thread = Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def submit(self, event: 'LogEvent'):
+        if len(self.__pending) < self.max_pending:
+            self.__pending.append(event)
+        else:
+            self.dropped += 1
+
+    def __run(self):
+        while not self.__stopped.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        with self.__lock:
+            lines = []
+            try:
+                while True:
+                    lines.append(self.__pending.popleft().to_json())
+            except IndexError:
+                pass
+            if lines and self.__file:
+                try:
+                    self.__file.write('\n'.join(lines) + '\n')
+                    self.__file.flush()
+                except IOError:
+                    pass
+
+    def close(self):
+        self.__stopped.set()
+        self.__thread.join()
+        self.flush()
+        with self.__lock:
+            self.__file.close()
+            self.__file = None
+
+
+class RoomLog:
+    def __init__(self, room: int, writer: 'EventLogWriter' = None, size: int = RING_SIZE):
+        self.room = room
+        self.writer = writer
+        self.__ring: Deque['LogEvent'] = deque(maxlen=size)
+        _rooms[room] = self
+
+    def log(self, kind: str, **fields):
+        event = LogEvent(time.time(), self.room, kind, fields)
+        self.__ring.append(event)
+        if self.writer:
+            self.writer.submit(event)
+
+    def recent(self) -> List['LogEvent']:
+        while True:
+            try:
+                return list(self.__ring)
+            except RuntimeError:
+                pass
+
+    def dump(self, f: IO[str]):
+        for event in self.recent():
+            f.write(event.to_json() + '\n')
+
+
+def dump_all(f: IO[str]):
+    for room in sorted(_rooms.keys()):
+        log = _rooms.get(room)
+        if log:
+            log.dump(f)
+
+
+def install_signal_handler(path: str, signum: int = getattr(signal, 'SIGUSR2', None)) -> bool:
+    if signum is None:
+        return False
+
+    def dump(*_):
+        with open(path, 'w', encoding='utf-8') as f:
+            dump_all(f)
+
+    signal.signal(signum, dump)
+    return True
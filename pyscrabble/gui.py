@@ -2,12 +2,14 @@ import sys
 import tkinter as tk
 import tkinter.messagebox
 from abc import ABC, abstractmethod
+from collections import deque
+from threading import Lock
 from tkinter import simpledialog
-from typing import Tuple, Optional, List, Callable, Any, Dict, Set
+from typing import Tuple, Optional, List, Callable, Any, Deque, Dict, FrozenSet, Set
 
 import pyscrabble.protocol as proto
-from pyscrabble.client import Connection
-from pyscrabble.model import SquareType, Tile
+from pyscrabble.client import Connection, GameState
+from pyscrabble.model import Board, SquareType, Tile
 from pyscrabble.server import Server
 
 server: 'Server' = None
@@ -240,7 +242,7 @@ class LobbyFrame(tk.Frame):
     def update_contents(self):
         for slave in self.__players_frame.grid_slaves():
             slave.destroy()
-        for i, client in enumerate(self.__conn.game.clients.values()):
+        for i, client in enumerate(self.__conn.game.state.clients.values()):
             tk.Label(self.__players_frame, text=client.name, width=30, anchor=tk.W)\
                 .grid(row=i, column=0, pady=(2, 0), sticky=tk.W)
             tk.Label(self.__players_frame, text='READY' if client.ready else '', width=5, anchor=tk.E)\
@@ -259,7 +261,10 @@ class BoardCanvas(tk.Canvas):
         self.bind('<ButtonRelease-3>', self.__on_right_release)
 
         self.temp_tiles: Dict[int, Dict[int, Tuple[Tile, List[int]]]] = {}
+        self.__placed_tiles: Dict[int, Tuple[Tile, List[int]]] = {}
+        self.__highlights: List[int] = []
         self.__picked_up_tile: 'Tile' = None
+        self.__draw_squares()
 
     __lookup = {
         SquareType.NORMAL: (None, '#d2c5ac', None),
@@ -270,19 +275,17 @@ class BoardCanvas(tk.Canvas):
     }
 
     def __on_press(self, event):
-        with self.__conn.game.lock:
-            row = int(min(self.canvasy(event.y), 749) // 50)
-            col = int(min(self.canvasx(event.x), 749) // 50)
-            if row in self.temp_tiles and col in self.temp_tiles[row]:
-                self.__picked_up_tile = self.temp_tiles[row][col][0]
+        row = int(min(self.canvasy(event.y), 749) // 50)
+        col = int(min(self.canvasx(event.x), 749) // 50)
+        if row in self.temp_tiles and col in self.temp_tiles[row]:
+            self.__picked_up_tile = self.temp_tiles[row][col][0]
 
     def __on_release(self, event):
-        with self.__conn.game.lock:
-            if self.__picked_up_tile and self.__conn.game.player_turn:
-                x = self.winfo_rootx() + event.x
-                y = self.winfo_rooty() + event.y
-                self.__on_tile_dropped(self.__picked_up_tile, x, y, True)
-                self.__picked_up_tile = None
+        if self.__picked_up_tile and self.__conn.game.state.player_turn:
+            x = self.winfo_rootx() + event.x
+            y = self.winfo_rooty() + event.y
+            self.__on_tile_dropped(self.__picked_up_tile, x, y, True)
+            self.__picked_up_tile = None
 
     def __on_right_release(self, event):
         self.__on_press(event)
@@ -290,40 +293,72 @@ class BoardCanvas(tk.Canvas):
         event.y = -1
         self.__on_release(event)
 
+    def __draw_squares(self):
+        for row, squares in enumerate(Board().squares):
+            for col, square in enumerate(squares):
+                text, bg_color, text_color = BoardCanvas.__lookup[square.type]
+                self.create_rectangle(col * 50, row * 50, col * 50 + 50, row * 50 + 50,
+                                      fill=bg_color, width=2, outline='#f0f0f0')
+                if row == 7 and col == 7:
+                    self.create_text(col * 50 + 25, row * 50 + 25,
+                                     text='★', font=('Helvetica', 30), fill=text_color)
+                elif text:
+                    for i, string in enumerate(text.split(sep=' ')):
+                        self.create_text(col * 50 + 25, row * 50 + 13 + i * 12,
+                                         text=string, font=('Helvetica', 6, 'bold'), fill=text_color)
+
     def redraw(self):
+        temp_tiles = self.temp_tiles
         self.temp_tiles = {}
         self.__picked_up_tile = None
-        self.delete(tk.ALL)
-        tiles = []
-        for row, squares in enumerate(self.__conn.game.board.squares):
-            for col, square in enumerate(squares):
-                if square.tile:
-                    tiles.append((row, col, square.tile))
+        self.highlight([])
+        for position, tile in enumerate(self.__conn.game.state.board):
+            placed_tile = self.__placed_tiles.get(position)
+            if tile is (placed_tile[0] if placed_tile else None):
+                continue
+            if placed_tile:
+                for item in placed_tile[1]:
+                    self.delete(item)
+                del self.__placed_tiles[position]
+            if tile:
+                row, col = divmod(position, 15)
+                temp_tile = temp_tiles.get(row, {}).pop(col, None)
+                if temp_tile and (temp_tile[0].letter, temp_tile[0].points) == (tile.letter, tile.points):
+                    items = temp_tile[1]
+                    self.itemconfigure(items[0], outline='black')
                 else:
-                    text, bg_color, text_color = BoardCanvas.__lookup[square.type]
-                    self.create_rectangle(col * 50, row * 50, col * 50 + 50, row * 50 + 50,
-                                          fill=bg_color, width=2, outline='#f0f0f0')
-                    if row == 7 and col == 7:
-                        self.create_text(col * 50 + 25, row * 50 + 25,
-                                         text='★', font=('Helvetica', 30), fill=text_color)
-                    elif text:
-                        for i, string in enumerate(text.split(sep=' ')):
-                            self.create_text(col * 50 + 25, row * 50 + 13 + i * 12,
-                                             text=string, font=('Helvetica', 6, 'bold'), fill=text_color)
-        for row, col, tile in tiles:
-            self.draw_tile(row, col, tile)
-
-    def draw_tile(self, row: int, col: int, tile: 'Tile', temp: bool = False):
-        items = [
+                    if temp_tile:
+                        for item in temp_tile[1]:
+                            self.delete(item)
+                    items = self.__create_tile_items(row, col, tile, False)
+                self.__placed_tiles[position] = (tile, items)
+        for tiles in temp_tiles.values():
+            for _, items in tiles.values():
+                for item in items:
+                    self.delete(item)
+
+    def highlight(self, positions: List[int]):
+        for item in self.__highlights:
+            self.delete(item)
+        self.__highlights = []
+        for position in set(positions):
+            row, col = divmod(position, 15)
+            self.__highlights.append(self.create_rectangle(col * 50 + 2, row * 50 + 2, col * 50 + 48, row * 50 + 48,
+                                                           width=3, outline='#ff8c00'))
+
+    def __create_tile_items(self, row: int, col: int, tile: 'Tile', temp: bool) -> List[int]:
+        return [
             self.create_rectangle(col * 50, row * 50, col * 50 + 50, row * 50 + 50,
                                   fill='#f8f3e2', width=2, outline='red' if temp else 'black'),
             self.create_text(col * 50 + 21, row * 50 + 23, text=tile.letter, font=('Helvetica', 22)),
             self.create_text(col * 50 + 33, row * 50 + 35, text=tile.points, anchor=tk.W, font=('Helvetica', 8, 'bold'))
         ]
-        if temp:
-            if row not in self.temp_tiles:
-                self.temp_tiles[row] = {}
-            self.temp_tiles[row][col] = (tile, items)
+
+    def draw_tile(self, row: int, col: int, tile: 'Tile'):
+        items = self.__create_tile_items(row, col, tile, True)
+        if row not in self.temp_tiles:
+            self.temp_tiles[row] = {}
+        self.temp_tiles[row][col] = (tile, items)
 
     def delete_tile(self, tile: 'Tile'):
         for row, tiles in self.temp_tiles.items():
@@ -362,39 +397,37 @@ class TilesCanvas(tk.Canvas):
             self.__selection_items = {}
 
     def __on_press(self, event):
-        with self.__conn.game.lock:
-            i = min(event.x // 50, len(self.__tiles) - 1)
-            tile = self.__tiles[i]
-            if self.exchange_mode:
-                if tile in self.selected_tiles:
-                    for item in self.__selection_items[tile]:
-                        self.delete(item)
-                    del self.__selection_items[tile]
-                    self.selected_tiles.remove(tile)
-                else:
-                    self.selected_tiles.add(tile)
-                    self.__selection_items[tile] = [
-                        self.create_line(i * 50, 0, (i + 1) * 50, 50, width=2),
-                        self.create_line(i * 50, 50, (i + 1) * 50, 0, width=2)
-                    ]
-                if self.on_selection_change:
-                    self.on_selection_change(self.selected_tiles)
+        i = min(event.x // 50, len(self.__tiles) - 1)
+        tile = self.__tiles[i]
+        if self.exchange_mode:
+            if tile in self.selected_tiles:
+                for item in self.__selection_items[tile]:
+                    self.delete(item)
+                del self.__selection_items[tile]
+                self.selected_tiles.remove(tile)
             else:
-                self.__picked_up_tile = tile
+                self.selected_tiles.add(tile)
+                self.__selection_items[tile] = [
+                    self.create_line(i * 50, 0, (i + 1) * 50, 50, width=2),
+                    self.create_line(i * 50, 50, (i + 1) * 50, 0, width=2)
+                ]
+            if self.on_selection_change:
+                self.on_selection_change(self.selected_tiles)
+        else:
+            self.__picked_up_tile = tile
 
     def __on_release(self, event):
-        with self.__conn.game.lock:
-            if self.__picked_up_tile and self.__conn.game.player_turn:
-                x = self.winfo_rootx() + event.x
-                y = self.winfo_rooty() + event.y
-                self.__on_tile_dropped(self.__picked_up_tile, x, y, False)
-                self.__picked_up_tile = None
+        if self.__picked_up_tile and self.__conn.game.state.player_turn:
+            x = self.winfo_rootx() + event.x
+            y = self.winfo_rooty() + event.y
+            self.__on_tile_dropped(self.__picked_up_tile, x, y, False)
+            self.__picked_up_tile = None
 
     def redraw(self):
         self.__tiles = []
         self.__picked_up_tile = None
         self.delete(tk.ALL)
-        for tile in self.__conn.game.player_client.player.tiles:
+        for tile in self.__conn.game.state.tiles:
             self.draw_tile(tile)
 
     def draw_tile(self, tile: 'Tile'):
@@ -444,42 +477,80 @@ class ScrabbleFrame(tk.Frame):
         self.__end_turn_btn = tk.Button(self, command=self.__on_end_turn, width=15)
         self.__end_turn_btn.grid(row=2, column=1, ipadx=20, padx=(6, 0), pady=(6, 0), sticky=tk.EW)
 
+        self.__preview_requests: Deque[FrozenSet[Tuple[int, int, Optional[str]]]] = deque()
+
     def update_contents(self):
         self.__board.redraw()
         self.__tiles.redraw()
         self.__cancel_exchange()
-        if self.__conn.game.player_turn:
+        state = self.__conn.game.state
+        if state.player_turn:
             self.__end_turn_btn.configure(state=tk.NORMAL, text='Skip turn')
         else:
             self.__end_turn_btn.configure(state=tk.DISABLED, text='Skip turn')
 
-        if not self.__conn.game.player_turn or self.__conn.game.tiles_left < 7:
+        if not state.player_turn or state.tiles_left < 7:
             self.__exchange_btn.configure(state=tk.DISABLED)
 
     def __on_end_turn(self):
-        with self.__conn.game.lock:
-            if self.__tiles.exchange_mode:
-                tile_ids = [tile.id for tile in self.__tiles.selected_tiles]
-                self.__conn.send_msg(proto.TileExchange(tile_ids))
-                self.__cancel_exchange()
+        if self.__tiles.exchange_mode:
+            tile_ids = [tile.id for tile in self.__tiles.selected_tiles]
+            self.__conn.send_msg(proto.TileExchange(tile_ids))
+            self.__cancel_exchange()
+        else:
+            tile_placements = self.__tile_placements()
+            result = self.__conn.game.check_move(tile_placements)
+            if result and not result.valid:
+                tk.messagebox.showwarning('Warning', result.reason)
             else:
-                tile_placements: List['proto.PlaceTilesTile'] = []
-                for row in self.__board.temp_tiles:
-                    for col in self.__board.temp_tiles[row]:
-                        tile, _ = self.__board.temp_tiles[row][col]
-                        tile_placement = proto.PlaceTilesTile(row * 15 + col, tile.id, tile.letter if not tile.points else None)
-                        tile_placements.append(tile_placement)
                 self.__conn.send_msg(proto.PlaceTiles(tile_placements))
 
-    def __on_exchange(self):
-        with self.__conn.game.lock:
-            if self.__tiles.exchange_mode:
-                self.__cancel_exchange()
+    def __tile_placements(self) -> List['proto.PlaceTilesTile']:
+        tile_placements: List['proto.PlaceTilesTile'] = []
+        for row in self.__board.temp_tiles:
+            for col in self.__board.temp_tiles[row]:
+                tile, _ = self.__board.temp_tiles[row][col]
+                tile_placement = proto.PlaceTilesTile(row * 15 + col, tile.id, tile.letter if not tile.points else None)
+                tile_placements.append(tile_placement)
+        return tile_placements
+
+    @staticmethod
+    def __placement_key(tile_placements: List['proto.PlaceTilesTile']) -> FrozenSet[Tuple[int, int, Optional[str]]]:
+        return frozenset((placement.position, placement.id, placement.letter) for placement in tile_placements)
+
+    def __request_preview(self):
+        self.__board.highlight([])
+        if self.__board.temp_tiles:
+            tile_placements = self.__tile_placements()
+            result = self.__conn.game.check_move(tile_placements)
+            if result:
+                self.__board.highlight([position for counter in result.word_counters if not counter.valid
+                                        for position in counter.positions])
+                self.__show_score(result.score, result.valid)
             else:
-                self.__tiles.exchange_mode = True
-                self.__tiles.selected_tiles = set()
-                self.__exchange_btn.configure(text='Cancel')
-                self.__end_turn_btn.configure(state=tk.DISABLED, text='Select tiles...')
+                self.__preview_requests.append(self.__placement_key(tile_placements))
+                self.__conn.send_msg(proto.PreviewMove(tile_placements))
+
+    def show_preview(self, preview: 'proto.MovePreview'):
+        if not self.__preview_requests:
+            return
+        requested = self.__preview_requests.popleft()
+        if requested == self.__placement_key(self.__tile_placements()):
+            self.__show_score(preview.score, preview.valid)
+
+    def __show_score(self, score: int, valid: bool):
+        if self.__board.temp_tiles and not self.__tiles.exchange_mode:
+            text = f'End turn (+{score})' if valid else 'End turn (invalid)'
+            self.__end_turn_btn.configure(text=text)
+
+    def __on_exchange(self):
+        if self.__tiles.exchange_mode:
+            self.__cancel_exchange()
+        else:
+            self.__tiles.exchange_mode = True
+            self.__tiles.selected_tiles = set()
+            self.__exchange_btn.configure(text='Cancel')
+            self.__end_turn_btn.configure(state=tk.DISABLED, text='Select tiles...')
 
     def __on_selection_change(self, tiles: List['Tile']):
         if tiles:
@@ -499,11 +570,11 @@ class ScrabbleFrame(tk.Frame):
             y = self.__board.canvasy(y - self.__board.winfo_rooty())
             row = int(min(y, 749) // 50)
             col = int(min(x, 749) // 50)
-            square = self.__conn.game.board.squares[row][col]
+            board_tile = self.__conn.game.state.board[row * 15 + col]
             temp_tile = None
             if row in self.__board.temp_tiles and col in self.__board.temp_tiles[row]:
                 temp_tile = self.__board.temp_tiles[row][col]
-            if not square.tile and not temp_tile:
+            if not board_tile and not temp_tile:
                 canceled = False
                 if from_board:
                     self.__board.delete_tile(tile)
@@ -521,8 +592,9 @@ class ScrabbleFrame(tk.Frame):
                     if not canceled:
                         self.__tiles.delete_tile(tile)
                 if not canceled:
-                    self.__board.draw_tile(row, col, tile, True)
+                    self.__board.draw_tile(row, col, tile)
                     self.__end_turn_btn.configure(text='End turn')
+                    self.__request_preview()
         elif from_board:
             self.__board.delete_tile(tile)
             if not self.__board.temp_tiles:
@@ -530,6 +602,7 @@ class ScrabbleFrame(tk.Frame):
             if tile.points == 0:
                 tile.letter = None
             self.__tiles.draw_tile(tile)
+            self.__request_preview()
 
 
 class InfoFrame(tk.Frame):
@@ -542,15 +615,18 @@ class InfoFrame(tk.Frame):
         self.__tiles_left_lbl = tk.Label(self)
         self.__tiles_left_lbl.grid(row=0, column=0, padx=(0, 6), sticky=tk.W)
 
+        self.__latency_lbl = tk.Label(self, fg='grey')
+        self.__latency_lbl.grid(row=0, column=1, padx=(0, 6), sticky=tk.E)
+
         tk.Button(self, text='Leave', command=self.__on_leave)\
-            .grid(row=0, column=1, ipadx=20, sticky=tk.E)
+            .grid(row=0, column=2, ipadx=20, sticky=tk.E)
 
         self.__players_frame = tk.Frame(self, bd=1, relief=tk.SUNKEN, padx=2)
         self.__players_frame.columnconfigure(1, weight=1)
-        self.__players_frame.grid(row=1, column=0, columnspan=2, pady=(6, 0), sticky=tk.NSEW)
+        self.__players_frame.grid(row=1, column=0, columnspan=3, pady=(6, 0), sticky=tk.NSEW)
 
     def redraw(self):
-        if self.__conn.game.lobby:
+        if self.__conn.game.state.lobby:
             self.grid_remove()
         else:
             self.grid()
@@ -565,18 +641,23 @@ class InfoFrame(tk.Frame):
             .grid(row=0, column=2, padx=(6, 0), pady=(2, 0), sticky=tk.E)
         tk.Label(self.__players_frame, text='Score', font=('Helvetica', 9, 'bold'))\
             .grid(row=0, column=3, padx=(6, 0), pady=(2, 0), sticky=tk.E)
-        for i, client in enumerate(self.__conn.game.clients.values()):
-            if self.__conn.game.turn_player_id == client.player_id:
+        state = self.__conn.game.state
+        for i, client in enumerate(state.clients.values()):
+            if state.turn_player_id == client.player_id:
                 tk.Label(self.__players_frame, text='▶')\
                     .grid(row=i + 1, column=0, pady=(0, 2))
             tk.Label(self.__players_frame, text=client.name, width=30, anchor=tk.W)\
                 .grid(row=i + 1, column=1, pady=(0, 2), sticky=tk.W)
             tk.Label(self.__players_frame, text=client.tile_count, width=1, anchor=tk.E)\
                 .grid(row=i + 1, column=2, padx=(6, 0), pady=(0, 2), sticky=tk.E)
-            tk.Label(self.__players_frame, text=client.player.score)\
+            tk.Label(self.__players_frame, text=client.score)\
                 .grid(row=i + 1, column=3, padx=(6, 0), pady=(0, 2), sticky=tk.E)
-        self.__tiles_left_lbl.configure(text=f'Tiles left: {self.__conn.game.tiles_left}',
-                                        fg='red' if self.__conn.game.tiles_left < 7 else 'black')
+        self.__tiles_left_lbl.configure(text=f'Tiles left: {state.tiles_left}',
+                                        fg='red' if state.tiles_left < 7 else 'black')
+        self.show_latency(state.latency)
+
+    def show_latency(self, latency: Optional[float]):
+        self.__latency_lbl.configure(text=f'Ping: {latency * 1e3:.0f} ms' if latency is not None else '')
 
     def __on_leave(self):
         self.__conn.stop()
@@ -597,10 +678,16 @@ class GameFrame(tk.Frame):
         proto.EndGame
     }
 
+    _frame_interval = 16
+
     def __init__(self, master: tk.Tk, name: str, ip: str, port: int):
         super().__init__(master)
 
-        self.__conn = Connection(lambda msg, text: self.after_idle(self.__on_update, msg, text))
+        self.__pending_updates: List[Tuple['proto.ServerMessage', Optional[str], 'GameState']] = []
+        self.__pending_lock = Lock()
+        self.__flush_scheduled = False
+
+        self.__conn = Connection(self.__queue_update, local_validation=True, auto_resume=True)
         self.columnconfigure(1, weight=1)
         self.rowconfigure(1, weight=1)
 
@@ -615,33 +702,70 @@ class GameFrame(tk.Frame):
 
         self.__conn.start(ip, port, name)
 
-    def __on_update(self, msg: 'proto.ServerMessage', text: Optional[str]):
-        with self.__conn.game.lock:
+    def __queue_update(self, msg: 'proto.ServerMessage', text: Optional[str], state: 'GameState'):
+        with self.__pending_lock:
+            self.__pending_updates.append((msg, text, state))
+            if self.__flush_scheduled:
+                return
+            self.__flush_scheduled = True
+        self.after(GameFrame._frame_interval, self.__flush_updates)
+
+    def __flush_updates(self):
+        with self.__pending_lock:
+            updates = self.__pending_updates
+            self.__pending_updates = []
+
+        contents_outdated = False
+        for msg, text, state in updates:
             if text:
                 self.__chat_frame.add_text(text)
 
             if isinstance(msg, proto.Shutdown):
                 self.master.set_frame(MainMenu(self.master))
+                return
             elif isinstance(msg, proto.ActionRejected):
+                if contents_outdated:
+                    self.__update_contents()
+                    contents_outdated = False
                 tk.messagebox.showwarning('Warning', msg.reason)
             elif isinstance(msg, proto.StartTurn):
                 if isinstance(self.__active_frame, LobbyFrame):
                     self.__set_active_frame(ScrabbleFrame(self, self.__conn))
-                if self.__conn.game.player_turn:
+                if state.player_turn:
                     self.master.deiconify()
                     self.master.focus_force()
+            elif isinstance(msg, proto.MovePreview):
+                if isinstance(self.__active_frame, ScrabbleFrame):
+                    self.__active_frame.show_preview(msg)
+            elif isinstance(msg, proto.Pong):
+                self.info_frame.show_latency(state.latency)
             elif isinstance(msg, proto.EndGame):
+                if contents_outdated:
+                    self.__update_contents()
+                    contents_outdated = False
                 msg.players.sort(key=lambda player: player.score, reverse=True)
-                text = '\n'.join(f'{i + 1}. {self.__conn.game.clients[player.player_id].name}: {player.score} points'
+                text = '\n'.join(f'{i + 1}. {state.clients[player.player_id].name}: {player.score} points'
                                  for i, player in enumerate(msg.players))
                 tk.messagebox.showinfo('Game over!', text)
                 self.__set_active_frame(LobbyFrame(self, self.__conn))
 
             if msg.__class__ in GameFrame._update_msgs:
-                self.__active_frame.update_contents()
-                self.info_frame.redraw()
+                contents_outdated = True
+
+        if contents_outdated:
+            self.__update_contents()
         self.update_idletasks()
 
+        with self.__pending_lock:
+            if self.__pending_updates:
+                self.after(GameFrame._frame_interval, self.__flush_updates)
+            else:
+                self.__flush_scheduled = False
+
+    def __update_contents(self):
+        self.__active_frame.update_contents()
+        self.info_frame.redraw()
+
     def __set_active_frame(self, frame: tk.Frame):
         if self.__active_frame:
             self.__active_frame.destroy()
@@ -0,0 +1,245 @@
+import argparse
+import asyncio
+import random
+import sys
+import time
+from threading import Condition, Thread
+from typing import Any, Callable, List, Optional, Tuple
+
+import pyscrabble.protocol as proto
+from pyscrabble.bot import Bot, Lexicon
+from pyscrabble.client import Connection, EventLoop, GameState, OnUpdate, board_from_state
+from pyscrabble.model import Board, Tile
+
+OnTurn = Callable[['GameState'], Optional['proto.ClientMessage']]
+OnRejected = Callable[['proto.ActionRejected', 'GameState'], Any]
+OnGameOver = Callable[['GameState'], Any]
+
+
+def _set_result(future: 'asyncio.Future', result):
+    if not future.done():
+        future.set_result(result)
+
+
+class HeadlessClient:
+    def __init__(self, name: str, loop: 'EventLoop' = None, auto_resume: bool = False):
+        self.name = name
+        self.connection = Connection(self.__on_update, loop, auto_resume=auto_resume)
+        self.state = self.connection.game.state
+        self.on_message: Optional['OnUpdate'] = None
+        self.on_turn: Optional['OnTurn'] = None
+        self.on_rejected: Optional['OnRejected'] = None
+        self.on_game_over: Optional['OnGameOver'] = None
+        self.turn_pending = False
+        self.games_played = 0
+        self.closed = False
+        self.__condition = Condition()
+        self.__futures: List[Tuple[str, 'asyncio.AbstractEventLoop', 'asyncio.Future']] = []
+
+    def connect(self, ip: str, port: int, lang: str = None, rating: int = 0):
+        self.connection.start(ip, port, self.name, lang, rating)
+
+    def close(self):
+        self.connection.stop()
+
+    def send(self, msg: 'proto.ClientMessage'):
+        if isinstance(msg, (proto.PlaceTiles, proto.TileExchange)) and not isinstance(msg, proto.PreviewMove):
+            with self.__condition:
+                self.turn_pending = False
+        self.connection.send_msg(msg)
+
+    def ready(self):
+        self.send(proto.Ready())
+
+    def place(self, tiles: List['proto.PlaceTilesTile']):
+        self.send(proto.PlaceTiles(tiles))
+
+    def exchange(self, tile_ids: List[int]):
+        self.send(proto.TileExchange(tile_ids))
+
+    def skip(self):
+        self.send(proto.PlaceTiles([]))
+
+    def chat(self, text: str):
+        self.send(proto.Chat(text))
+
+    def wait_for_turn(self, timeout: float = None) -> Optional['GameState']:
+        with self.__condition:
+            if self.__condition.wait_for(lambda: self.turn_pending or self.closed, timeout) and not self.closed:
+                return self.state
+
+    def wait_for_game_over(self, timeout: float = None) -> Optional['GameState']:
+        with self.__condition:
+            games_played = self.games_played
+            if self.__condition.wait_for(lambda: self.games_played > games_played or self.closed, timeout) \
+                    and not self.closed:
+                return self.state
+
+    async def next_turn(self) -> Optional['GameState']:
+        return await self.__wait_async('turn')
+
+    async def game_over(self) -> Optional['GameState']:
+        return await self.__wait_async('game_over')
+
+    def __wait_async(self, kind: str) -> 'asyncio.Future':
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        with self.__condition:
+            if self.closed:
+                future.set_result(None)
+            elif kind == 'turn' and self.turn_pending:
+                future.set_result(self.state)
+            else:
+                self.__futures.append((kind, loop, future))
+        return future
+
+    def __resolve(self, kind: str, result: Optional['GameState']):
+        futures = [(loop, future) for kind_, loop, future in self.__futures if kind_ == kind or self.closed]
+        self.__futures = [entry for entry in self.__futures if entry[0] != kind and not self.closed]
+        for loop, future in futures:
+            loop.call_soon_threadsafe(_set_result, future, result)
+
+    def __on_update(self, msg: 'proto.ServerMessage', text: Optional[str], state: 'GameState'):
+        with self.__condition:
+            self.state = state
+            if isinstance(msg, proto.StartTurn) and state.player_turn:
+                self.turn_pending = True
+                self.__resolve('turn', state)
+            elif isinstance(msg, proto.ActionRejected) and state.player_turn and not state.lobby:
+                self.turn_pending = True
+                self.__resolve('turn', state)
+            elif isinstance(msg, proto.EndGame):
+                self.turn_pending = False
+                self.games_played += 1
+                self.__resolve('game_over', state)
+            elif isinstance(msg, proto.Shutdown):
+                self.turn_pending = False
+                self.closed = True
+                self.__resolve('turn', None)
+            self.__condition.notify_all()
+
+        if self.on_message:
+            self.on_message(msg, text, state)
+        if isinstance(msg, proto.StartTurn) and state.player_turn and self.on_turn:
+            reply = self.on_turn(state)
+            if reply:
+                self.send(reply)
+        elif isinstance(msg, proto.ActionRejected) and self.on_rejected:
+            self.on_rejected(msg, state)
+        elif isinstance(msg, proto.EndGame) and self.on_game_over:
+            self.on_game_over(state)
+
+
+class BotClient(HeadlessClient):
+    def __init__(self, name: str, bot: 'Bot', player_count: int, games: int = 1, loop: 'EventLoop' = None):
+        super().__init__(name, loop)
+        self.bot = bot
+        self.player_count = player_count
+        self.games = games
+        self.turns = 0
+        self.think_time = 0.0
+        self.scores: List[int] = []
+        self.__ready = False
+        self.__scoreless_turns = 0
+        self.on_message = self.__on_message
+        self.on_turn = self.__on_turn
+        self.on_rejected = self.__on_rejected
+        self.on_game_over = self.__on_game_over
+
+    def __on_message(self, msg: 'proto.ServerMessage', text: Optional[str], state: 'GameState'):
+        if isinstance(msg, proto.EndTurn):
+            self.__scoreless_turns = 0 if msg.placed_tiles else self.__scoreless_turns + 1
+        elif isinstance(msg, (proto.JoinOk, proto.EndGame)):
+            self.__scoreless_turns = 0
+        if state.lobby and not self.__ready and len(state.clients) >= self.player_count \
+                and self.games_played < self.games:
+            self.__ready = True
+            self.ready()
+
+    def __on_turn(self, state: 'GameState') -> None:
+        start = time.perf_counter()
+        board = board_from_state(state)
+        other_rack = None
+        if self.bot.endgame and not state.tiles_left and len(state.clients) == 2:
+            other_rack = self.bot.endgame.unseen_tiles(board, state.tiles)
+            opponent = next(client for client in state.clients.values() if client.player_id != state.player_id)
+            if len(other_rack) != opponent.tile_count:
+                other_rack = None
+        Thread(target=self.__think, args=(start, board, list(state.tiles), state.tiles_left, other_rack,
+                                          self.__scoreless_turns), daemon=True).start()
+
+    def __think(self, start: float, board: 'Board', rack: List['Tile'], tiles_left: int,
+                other_rack: Optional[List['Tile']], scoreless_turns: int):
+        msg = self.bot.choose(board, rack, tiles_left, other_rack, scoreless_turns)
+        self.think_time += time.perf_counter() - start
+        self.turns += 1
+        self.send(msg)
+
+    def __on_rejected(self, msg: 'proto.ActionRejected', state: 'GameState'):
+        if self.turn_pending:
+            self.skip()
+
+    def __on_game_over(self, state: 'GameState'):
+        self.scores.append(state.clients[state.player_id].score)
+        self.__ready = False
+        if self.games_played >= self.games:
+            self.close()
+        elif len(state.clients) >= self.player_count:
+            self.__ready = True
+            self.ready()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run headless PyScrabble bot players against a server')
+    parser.add_argument('host', help='server address')
+    parser.add_argument('port', type=int, help='server port')
+    parser.add_argument('-n', '--players', type=int, choices=range(1, 5), default=2, help='bot players to launch')
+    parser.add_argument('-g', '--games', type=int, default=1, help='games to play before leaving')
+    parser.add_argument('-l', '--lang', default='en', help='game language')
+    parser.add_argument('-s', '--seed', type=int, help='seed of the bots\' random choices')
+    parser.add_argument('--greed', type=float, default=1.0, help='probability of playing the best move')
+    parser.add_argument('--name', default='bot', help='player name prefix')
+    parser.add_argument('--timeout', type=float, help='give up after this many seconds')
+    parser.add_argument('--find-game', action='store_true',
+                        help='join through the matchmaking queue instead of the server\'s room')
+    parser.add_argument('--endgame', type=float, metavar='SECONDS',
+                        help='solve two-player endgames once the bag is empty, spending up to this long per move')
+    args = parser.parse_args()
+
+    lexicon = Lexicon.load(args.lang)
+    solver = None
+    if args.endgame:
+        from pyscrabble.endgame import EndgameSolver
+        solver = EndgameSolver(args.lang, 1, lexicon)
+    rng = random.Random(args.seed)
+    loop = EventLoop()
+    clients = [BotClient(f'{args.name}{i}', Bot(lexicon, random.Random(rng.getrandbits(32)), args.greed, solver,
+                                                args.endgame or 1.0),
+                         args.players, args.games, loop) for i in range(args.players)]
+    start = time.perf_counter()
+    for client in clients:
+        client.connect(args.host, args.port, args.lang if args.find_game else None)
+
+    deadline = start + args.timeout if args.timeout else None
+    for client in clients:
+        while client.games_played < args.games and not client.closed:
+            timeout = deadline - time.perf_counter() if deadline else None
+            if (timeout is not None and timeout <= 0) or not client.wait_for_game_over(timeout):
+                break
+    elapsed = time.perf_counter() - start
+
+    finished = True
+    for client in clients:
+        finished = finished and client.games_played >= args.games
+        think = client.think_time / client.turns * 1e3 if client.turns else 0.0
+        print(f'{client.name}: {client.games_played} games, scores {client.scores}, '
+              f'{client.turns} turns, {think:.1f} ms per move')
+        client.close()
+    if solver:
+        solver.close()
+    print(f'{elapsed:.2f} s')
+    sys.exit(0 if finished else 1)
+
+
+if __name__ == '__main__':
+    main()
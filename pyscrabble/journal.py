@@ -0,0 +1,214 @@
+import os
+import time
+import zlib
+from threading import Condition, Thread
+from typing import Iterator, List, Optional, Tuple, Union
+
+import pyscrabble.protocol as proto
+import pyscrabble.utils as utils
+
+
+class JournalStart:
+    def __init__(self, seed: int, players: List[Tuple[int, str]]):
+        self.seed = seed
+        self.players = players
+
+    def encode(self) -> bytes:
+        result = b'\x00' + self.seed.to_bytes(4, byteorder='big') + utils.int_to_byte(len(self.players))
+        for player_id, name in self.players:
+            b = name.encode('utf-8')
+            result += utils.int_to_byte(player_id) + utils.int_to_byte(len(b)) + b
+        return result
+
+
+class JournalAction:
+    def __init__(self, player_id: int, msg: 'proto.ClientMessage'):
+        self.player_id = player_id
+        self.msg = msg
+
+    def encode(self) -> bytes:
+        return b'\x01' + utils.int_to_byte(self.player_id) + self.msg.serialize()
+
+
+class JournalSession:
+    def __init__(self, player_id: int, token: bytes):
+        self.player_id = player_id
+        self.token = token
+
+    def encode(self) -> bytes:
+        return b'\x02' + utils.int_to_byte(self.player_id) + utils.int_to_byte(len(self.token)) + self.token
+
+
+JournalRecord = Union['JournalStart', 'JournalAction', 'JournalSession']
+
+
+def decode_record(data: bytes) -> Optional['JournalRecord']:
+    stream = proto.BufferStream(data, proto.ClientMessage)
+    kind = stream.get_int()
+    if kind == 0:
+        seed = stream.get_int(4)
+        players = [(stream.get_int(), stream.get_str(stream.get_int())) for _ in range(stream.get_int())]
+        return JournalStart(seed, players)
+    elif kind == 1:
+        player_id = stream.get_int()
+        msg = stream.get_msg()
+        if msg:
+            return JournalAction(player_id, msg)
+    elif kind == 2:
+        player_id = stream.get_int()
+        return JournalSession(player_id, stream.get_bytes(stream.get_int()))
+
+
+def frame(record: bytes) -> bytes:
+    return len(record).to_bytes(2, byteorder='big') + zlib.crc32(record).to_bytes(4, byteorder='big') + record
+
+
+def read_frames(data: bytes) -> Iterator[bytes]:
+    pos = 0
+    while pos + 6 <= len(data):
+        n = int.from_bytes(data[pos:pos + 2], byteorder='big')
+        crc = int.from_bytes(data[pos + 2:pos + 6], byteorder='big')
+        record = data[pos + 6:pos + 6 + n]
+        if len(record) < n or zlib.crc32(record) != crc:
+            break
+        yield record
+        pos += 6 + n
+
+
+def read_journal(path: str) -> List['JournalRecord']:
+    with open(path, 'rb') as f:
+        data = f.read()
+    records = []
+    for record in read_frames(data):
+        try:
+            decoded = decode_record(record)
+        except (EOFError, UnicodeDecodeError):
+            break
+        if decoded:
+            records.append(decoded)
+    return records
+
+
+class JournalWriter:
+    def __init__(self, commit_interval: float = 0.002):
+        self.commit_interval = commit_interval
+        self.__condition = Condition()
+        self.__ops: List[Tuple['GameJournal', str, Optional[bytes]]] = []
+        self.__submitted = 0
+        self.__completed = 0
+        self.__thread: Thread = None
+
+    def submit(self, journal: 'GameJournal', op: str, data: bytes = None):
+        with self.__condition:
+            self.__ops.append((journal, op, data))
+            self.__submitted += 1
+            if not self.__thread:
+                self.__thread = Thread(target=self.__run, daemon=True)
+                self.__thread.start()
+            self.__condition.notify_all()
+
+    def sync(self, timeout: float = None) -> bool:
+        with self.__condition:
+            target = self.__submitted
+            return self.__condition.wait_for(lambda: self.__completed >= target, timeout)
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                self.__condition.wait_for(lambda: self.__ops)
+            time.sleep(self.commit_interval)
+            with self.__condition:
+                ops, self.__ops = self.__ops, []
+
+            dirty = []
+            for journal, op, data in ops:
+                try:
+                    if op == 'open':
+                        journal.file = open(journal.path, 'ab' if journal.append else 'wb')
+                    elif op == 'write':
+                        journal.file.write(data)
+                        if journal not in dirty:
+                            dirty.append(journal)
+                    elif op == 'close':
+                        if journal in dirty:
+                            dirty.remove(journal)
+                            if not data:
+                                journal.file.flush()
+                                os.fsync(journal.file.fileno())
+                        journal.file.close()
+                        journal.file = None
+                        if data:
+                            os.remove(journal.path)
+                except (IOError, AttributeError):
+                    pass
+            for journal in dirty:
+                try:
+                    journal.file.flush()
+                    os.fsync(journal.file.fileno())
+                except (IOError, AttributeError):
+                    pass
+
+            with self.__condition:
+                self.__completed += len(ops)
+                self.__condition.notify_all()
+
+
+default_writer = JournalWriter()
+
+
+class GameJournal:
+    def __init__(self, path: str, writer: 'JournalWriter' = None, append: bool = False):
+        self.path = path
+        self.append = append
+        self.file = None
+        self.__writer = writer or default_writer
+        self.__writer.submit(self, 'open')
+
+    def write(self, record: 'JournalRecord'):
+        self.__writer.submit(self, 'write', frame(record.encode()))
+
+    def close(self, remove: bool = False):
+        self.__writer.submit(self, 'close', b'\x01' if remove else None)
+
+
+_magic = b'PSGR'
+
+
+class GameRecord:
+    def __init__(self, lang: str, seed: int, players: List[Tuple[int, str]], actions: List['JournalAction']):
+        self.lang = lang
+        self.seed = seed
+        self.players = players
+        self.actions = actions
+
+    def serialize(self) -> bytes:
+        b = self.lang.encode('utf-8')
+        result = _magic + utils.int_to_byte(len(b)) + b
+        result += JournalStart(self.seed, self.players).encode()[1:]
+        result += len(self.actions).to_bytes(2, byteorder='big')
+        for action in self.actions:
+            result += action.encode()[1:]
+        return result
+
+    @classmethod
+    def deserialize(cls, data: bytes) -> 'GameRecord':
+        if data[:4] != _magic:
+            raise ValueError('Not a game record')
+        stream = proto.BufferStream(data[4:], proto.ClientMessage)
+        lang = stream.get_str(stream.get_int())
+        seed = stream.get_int(4)
+        players = [(stream.get_int(), stream.get_str(stream.get_int())) for _ in range(stream.get_int())]
+        actions = []
+        for _ in range(stream.get_int(2)):
+            player_id = stream.get_int()
+            actions.append(JournalAction(player_id, stream.get_msg()))
+        return cls(lang, seed, players, actions)
+
+    def save(self, path: str):
+        with open(path, 'wb') as f:
+            f.write(self.serialize())
+
+    @classmethod
+    def load(cls, path: str) -> 'GameRecord':
+        with open(path, 'rb') as f:
+            return cls.deserialize(f.read())
@@ -0,0 +1,229 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from threading import Event, Thread
+from typing import List, Optional, Tuple
+
+import pyscrabble.protocol as proto
+import pyscrabble.utils as utils
+from pyscrabble.bot import Bot, Lexicon
+from pyscrabble.client import EventLoop, GameState
+from pyscrabble.headless import BotClient
+
+
+class LoadPlayer(BotClient):
+    def __init__(self, name: str, bot: Optional['Bot'], player_count: int, games: int, loop: 'EventLoop'):
+        super().__init__(name, bot, player_count, games, loop)
+        self.latencies: List[float] = []
+        self.joined: float = None
+        self.__sent: float = None
+        self.__on_bot_message = self.on_message
+        if not bot:
+            self.on_turn = self.__on_turn
+        self.on_message = self.__on_message
+
+    def send(self, msg: 'proto.ClientMessage'):
+        if isinstance(msg, (proto.PlaceTiles, proto.TileExchange)) and not isinstance(msg, proto.PreviewMove):
+            self.__sent = time.perf_counter()
+        super().send(msg)
+
+    def __on_turn(self, state: 'GameState') -> 'proto.ClientMessage':
+        return proto.PlaceTiles([])
+
+    def __on_message(self, msg: 'proto.ServerMessage', text: Optional[str], state: 'GameState'):
+        if isinstance(msg, proto.EndTurn) and msg.player_id == state.player_id and self.__sent is not None:
+            self.latencies.append(time.perf_counter() - self.__sent)
+            self.__sent = None
+        elif isinstance(msg, proto.JoinOk):
+            self.joined = time.perf_counter()
+        self.__on_bot_message(msg, text, state)
+
+
+def _process_usage(pid: int) -> Optional[Tuple[float, int]]:
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+    except (IOError, IndexError):
+        return None
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    return cpu, int(fields[21]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class ResourceSampler:
+    def __init__(self, pid: int, interval: float = 1.0):
+        self.pid = pid
+        self.interval = interval
+        self.samples: List[dict] = []
+        self.__stopped = Event()
+        self.__thread = Thread(target=self.__run, daemon=True)
+
+    def __run(self):
+        start = time.perf_counter()
+        previous = _process_usage(self.pid)
+        previous_time = start
+        while previous and not self.__stopped.wait(self.interval):
+            usage = _process_usage(self.pid)
+            now = time.perf_counter()
+            if not usage:
+                break
+            self.samples.append({
+                't_s': round(now - start, 3),
+                'cpu_percent': round((usage[0] - previous[0]) / (now - previous_time) * 100, 1),
+                'rss_mb': round(usage[1] / 2 ** 20, 1)
+            })
+            previous, previous_time = usage, now
+
+    def start(self):
+        self.__thread.start()
+
+    def stop(self):
+        self.__stopped.set()
+        self.__thread.join()
+
+
+def serve(rooms: int, ip: str, port: int, lang: str, match_size: int = 2):
+    from pyscrabble.server import Server
+    servers = []
+    for i in range(rooms):
+        server = Server(lang, match_size=match_size)
+        server.start(ip, port + i)
+        servers.append(server)
+    print('ready', flush=True)
+    sys.stdin.read()
+    for server in servers:
+        server.stop()
+
+
+def _spawn_server(rooms: int, ip: str, port: int, lang: str, match_size: int = 2) -> subprocess.Popen:
+    process = subprocess.Popen([sys.executable, '-m', 'pyscrabble.loadtest', '--serve', '-r', str(rooms),
+                                '--host', ip, '--port', str(port), '-l', lang, '-p', str(match_size)],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    if process.stdout.readline().strip() != b'ready':
+        process.kill()
+        raise RuntimeError('Server process failed to start')
+    return process
+
+
+def run(rooms: int, players: int, games: int, ip: str, port: int, lang: str = 'en', strategy: str = 'skip',
+        seed: int = 0, timeout: float = None, server_pid: int = None, sample_interval: float = 1.0,
+        matchmaking: bool = False) -> dict:
+    bot = None
+    if strategy == 'bot':
+        bot = Bot(Lexicon.load(lang), random.Random(seed))
+    sampler = ResourceSampler(server_pid, sample_interval) if server_pid else None
+    if sampler:
+        sampler.start()
+
+    loop = EventLoop()
+    clients: List['LoadPlayer'] = []
+    start = time.perf_counter()
+    failed = 0
+    for room in range(rooms):
+        for i in range(players):
+            client = LoadPlayer(f'load{room}_{i}', bot, players, games, loop)
+            try:
+                if matchmaking:
+                    client.connect(ip, port, lang)
+                else:
+                    client.connect(ip, port + room)
+            except IOError:
+                failed += 1
+                continue
+            clients.append(client)
+    setup_time = time.perf_counter() - start
+
+    deadline = start + timeout if timeout else None
+    for client in clients:
+        while client.games_played < games and not client.closed:
+            remaining = deadline - time.perf_counter() if deadline else None
+            if (remaining is not None and remaining <= 0) or not client.wait_for_game_over(remaining):
+                break
+    elapsed = time.perf_counter() - start
+    for client in clients:
+        client.close()
+    if sampler:
+        sampler.stop()
+
+    latencies = sorted(latency for client in clients for latency in client.latencies)
+    joins = sorted(client.joined - start for client in clients if client.joined)
+    return {
+        'rooms': rooms,
+        'connections': len(clients),
+        'failed_connections': failed,
+        'strategy': strategy,
+        'matchmaking': matchmaking,
+        'setup_s': round(setup_time, 3),
+        'connections_per_s': round(len(clients) / setup_time, 1) if setup_time else None,
+        'all_joined_s': round(joins[-1], 3) if joins else None,
+        'games_completed': sum(min(client.games_played, games) for client in clients) // max(players, 1),
+        'elapsed_s': round(elapsed, 3),
+        'turns': len(latencies),
+        'turn_latency_ms': {
+            'p50': utils.percentile(latencies, 50) * 1e3,
+            'p99': utils.percentile(latencies, 99) * 1e3,
+            'p999': utils.percentile(latencies, 99.9) * 1e3,
+            'max': latencies[-1] * 1e3 if latencies else 0
+        },
+        'server': sampler.samples if sampler else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test PyScrabble servers over loopback')
+    parser.add_argument('-r', '--rooms', type=int, default=50, help='number of rooms, one server port each')
+    parser.add_argument('-p', '--players', type=int, choices=range(2, 5), default=2, help='players per room')
+    parser.add_argument('-g', '--games', type=int, default=1, help='games each room plays')
+    parser.add_argument('-l', '--lang', default='en', help='game language')
+    parser.add_argument('--host', default='127.0.0.1', help='server address')
+    parser.add_argument('--port', type=int, default=17000, help='port of the first room')
+    parser.add_argument('--strategy', choices=('skip', 'bot'), default='skip',
+                        help='skip every turn, or play the best move found by the bot')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='seed of the bot')
+    parser.add_argument('--timeout', type=float, help='give up after this many seconds')
+    parser.add_argument('--matchmaking', action='store_true',
+                        help='queue all players on one server port and let matchmaking form the rooms')
+    parser.add_argument('--no-spawn', action='store_true', help='connect to already running servers')
+    parser.add_argument('--server-pid', type=int, help='sample CPU and RSS of this process with --no-spawn')
+    parser.add_argument('--sample-interval', type=float, default=1.0, help='seconds between server samples')
+    parser.add_argument('-o', '--output', help='write the report as JSON to this file')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.rooms, args.host, args.port, args.lang, args.players)
+        return
+
+    process = None
+    if not args.no_spawn:
+        process = _spawn_server(1 if args.matchmaking else args.rooms, args.host, args.port, args.lang, args.players)
+    try:
+        report = run(args.rooms, args.players, args.games, args.host, args.port, args.lang, args.strategy,
+                     args.seed, args.timeout, process.pid if process else args.server_pid, args.sample_interval,
+                     args.matchmaking)
+    finally:
+        if process:
+            process.stdin.close()
+            process.wait()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    latency = report['turn_latency_ms']
+    print(f'{report["connections"]} connections ({report["failed_connections"]} failed) in {report["setup_s"]} s '
+          f'({report["connections_per_s"]}/s), all joined after {report["all_joined_s"]} s')
+    print(f'{report["games_completed"]} games, {report["turns"]} turns in {report["elapsed_s"]} s')
+    print(f'PlaceTiles -> EndTurn: p50={latency["p50"]:.2f}ms p99={latency["p99"]:.2f}ms '
+          f'p999={latency["p999"]:.2f}ms max={latency["max"]:.2f}ms')
+    if report['server']:
+        print(f'server: peak CPU {max(sample["cpu_percent"] for sample in report["server"])}%, '
+              f'peak RSS {max(sample["rss_mb"] for sample in report["server"])} MB')
+    sys.exit(0 if report['games_completed'] == args.rooms * args.games else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Lock, Thread
+from typing import Callable, Dict, Iterable, List, Tuple
+
+import pyscrabble.utils as utils
+
+Labels = Dict[str, str]
+Sample = Tuple[str, str, str, Labels, float]
+Collector = Callable[[], Iterable[Sample]]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(str(value))}"' for key, value in sorted(labels.items())) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_histogram(name: str, labels: Labels, histogram: 'utils.Histogram') -> List[str]:
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.bounds, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{_format_labels({**labels, "le": _format_value(bound)})} {cumulative}')
+    lines.append(f'{name}_bucket{_format_labels({**labels, "le": "+Inf"})} {histogram.count}')
+    lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}')
+    lines.append(f'{name}_count{_format_labels(labels)} {histogram.count}')
+    return lines
+
+
+class Metrics:
+    def __init__(self, prefix: str = 'pyscrabble'):
+        self.prefix = prefix
+        self.messages_in = Counter()
+        self.messages_out = Counter()
+        self.connections = Counter()
+        self.handler_latency: Dict[str, 'utils.Histogram'] = {}
+        self.__collectors: List['Collector'] = []
+        self.__lock = Lock()
+
+    def message_in(self, msg_type: str):
+        with self.__lock:
+            self.messages_in[msg_type] += 1
+
+    def message_out(self, msg_type: str):
+        with self.__lock:
+            self.messages_out[msg_type] += 1
+
+    def connection(self, outcome: str):
+        with self.__lock:
+            self.connections[outcome] += 1
+
+    def observe_handler(self, msg_type: str, seconds: float):
+        with self.__lock:
+            histogram = self.handler_latency.get(msg_type)
+            if not histogram:
+                histogram = self.handler_latency[msg_type] = utils.Histogram()
+            histogram.add(seconds)
+
+    def add_collector(self, collector: 'Collector'):
+        self.__collectors.append(collector)
+
+    def render(self) -> str:
+        p = self.prefix
+        lines = []
+        with self.__lock:
+            for name, help_text, label, values in (
+                    (f'{p}_messages_received_total', 'Client messages handled by type', 'type', self.messages_in),
+                    (f'{p}_messages_sent_total', 'Server messages queued by type', 'type', self.messages_out),
+                    (f'{p}_connections_total', 'Incoming connections by outcome', 'outcome', self.connections)):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                lines += [f'{name}{_format_labels({label: key})} {value}' for key, value in sorted(values.items())]
+
+            name = f'{p}_handler_seconds'
+            lines += [f'# HELP {name} Time spent handling client messages', f'# TYPE {name} histogram']
+            for msg_type, histogram in sorted(self.handler_latency.items()):
+                lines += format_histogram(name, {'type': msg_type}, histogram)
+
+        described = set()
+        for collector in self.__collectors:
+            for name, kind, help_text, labels, value in collector():
+                name = f'{p}_{name}'
+                if name not in described:
+                    described.add(name)
+                    lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+                if kind == 'histogram':
+                    lines += format_histogram(name, labels, value)
+                else:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, metrics: 'Metrics', ip: str, port: int):
+        super().__init__((ip, port), _RequestHandler)
+        self.metrics = metrics
+
+    def start(self):
+        Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -1,5 +1,16 @@
+import random
 from enum import Enum
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional, Tuple
+
+_zobrist_keys: Dict[Tuple[int, str, int], int] = {}
+
+
+def zobrist_key(position: int, tile: 'Tile') -> int:
+    key = (position, tile.letter, tile.points)
+    value = _zobrist_keys.get(key)
+    if value is None:
+        value = _zobrist_keys[key] = random.Random(f'{position}:{tile.letter}:{tile.points}').getrandbits(64)
+    return value
 
 
 class Tile:
@@ -9,6 +20,35 @@ class Tile:
         self.letter = letter
 
 
+class TileBag:
+    def __init__(self, tiles: Iterable['Tile'], seed: int):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.__tiles = list(tiles)
+        self.rng.shuffle(self.__tiles)
+
+    def __len__(self) -> int:
+        return len(self.__tiles)
+
+    def copy(self) -> 'TileBag':
+        bag = TileBag([], self.seed)
+        bag.rng.setstate(self.rng.getstate())
+        bag.__tiles = list(self.__tiles)
+        return bag
+
+    def draw(self, n: int) -> List['Tile']:
+        i = max(len(self.__tiles) - n, 0)
+        tiles = self.__tiles[i:]
+        del self.__tiles[i:]
+        return tiles
+
+    def put_back(self, tiles: Iterable['Tile']):
+        for tile in tiles:
+            self.__tiles.append(tile)
+            i = self.rng.randrange(len(self.__tiles))
+            self.__tiles[i], self.__tiles[-1] = self.__tiles[-1], self.__tiles[i]
+
+
 class Player:
     def __init__(self):
         self.score = 0
@@ -45,7 +85,16 @@ class Board:
 
     def __init__(self):
         self.squares = [[Square(t) for t in row] for row in Board.__layout]
+        self.hash = 0
 
     def __getitem__(self, i: int) -> 'Square':
         row = self.squares[i // len(self.squares)]
         return row[i % len(row)]
+
+    def place(self, position: int, tile: Optional['Tile']):
+        square = self[position]
+        if square.tile:
+            self.hash ^= zobrist_key(position, square.tile)
+        square.tile = tile
+        if tile:
+            self.hash ^= zobrist_key(position, tile)
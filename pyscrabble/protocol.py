@@ -1,7 +1,7 @@
 import socket
 from abc import ABC
 from queue import Queue
-from typing import Callable, List, Type
+from typing import Any, Callable, List, Optional, Type
 
 import pyscrabble.model as model
 import pyscrabble.utils as utils
@@ -119,15 +119,42 @@ class Chat(ClientMessage):
         return cls(stream.get_str(stream.get_int(2)))
 
 
-ClientMessage.prefix_map = {
-    b'\x00': Join,
-    b'\x01': Ready,
-    b'\x02': Leave,
-    b'\x03': TileExchange,
-    b'\x04': PlaceTiles,
-    b'\x05': Chat
-}
-ClientMessage.prefix_map_inv = {value: key for key, value in ClientMessage.prefix_map.items()}
+class PreviewMove(PlaceTiles):
+    ...
+
+
+class FindGame(ClientMessage):
+    def __init__(self, name: str, lang: str, rating: int = 0):
+        self.name = name
+        self.lang = lang
+        self.rating = rating
+
+    @_serializer
+    def serialize(self) -> bytes:
+        name = self.name.encode('utf-8')
+        lang = self.lang.encode('utf-8')
+        return utils.int_to_byte(len(name)) + name + utils.int_to_byte(len(lang)) + lang \
+            + self.rating.to_bytes(2, byteorder='big')
+
+    @classmethod
+    def _deserialize(cls, stream: 'Stream') -> 'FindGame':
+        name = stream.get_str(stream.get_int())
+        lang = stream.get_str(stream.get_int())
+        return cls(name, lang, stream.get_int(2))
+
+
+class Resume(ClientMessage):
+    def __init__(self, token: bytes, received: int):
+        self.token = token
+        self.received = received
+
+    @_serializer
+    def serialize(self) -> bytes:
+        return utils.int_to_byte(len(self.token)) + self.token + self.received.to_bytes(4, byteorder='big')
+
+    @classmethod
+    def _deserialize(cls, stream: 'Stream') -> 'Resume':
+        return cls(stream.get_bytes(stream.get_int()), stream.get_int(4))
 
 
 class ServerMessage(Message, ABC):
@@ -146,9 +173,11 @@ class PlayerInfo:
 
 
 class JoinOk(ServerMessage):
-    def __init__(self, player_id: int, players: List['PlayerInfo']):
+    def __init__(self, player_id: int, players: List['PlayerInfo'], lang: str, token: bytes = b''):
         self.player_id = player_id
         self.players = players
+        self.lang = lang
+        self.token = token
 
     @_serializer
     def serialize(self) -> bytes:
@@ -157,14 +186,16 @@ class JoinOk(ServerMessage):
             result += utils.int_to_byte(player_info.player_id) + utils.int_to_byte(player_info.ready)
             b = player_info.name.encode('utf-8')
             result += utils.int_to_byte(len(b)) + b
-        return result
+        b = self.lang.encode('utf-8')
+        return result + utils.int_to_byte(len(b)) + b + utils.int_to_byte(len(self.token)) + self.token
 
     @classmethod
     def _deserialize(cls, stream: 'Stream') -> 'JoinOk':
         self_player_id = stream.get_int()
         players = [PlayerInfo(stream.get_int(), bool(stream.get_int()), stream.get_str(stream.get_int()))
                    for _ in range(stream.get_int())]
-        return cls(self_player_id, players)
+        lang = stream.get_str(stream.get_int())
+        return cls(self_player_id, players, lang, stream.get_bytes(stream.get_int()))
 
 
 class ActionRejected(ServerMessage):
@@ -228,29 +259,44 @@ class StartTurnPlayer:
         self.tile_count = tile_count
 
 
+class StartTurnTemplate:
+    def __init__(self, turn_player_id: int, tiles_left: int, player_tile_counts: List['StartTurnPlayer']):
+        self.turn_player_id = turn_player_id
+        self.tiles_left = tiles_left
+        self.player_tile_counts = player_tile_counts
+        self.__head = Message.prefix_map_inv[StartTurn] + utils.int_to_byte(turn_player_id) \
+            + utils.int_to_byte(tiles_left)
+        self.__tail = utils.int_to_byte(len(player_tile_counts)) \
+            + b''.join(utils.int_to_byte(player.id) + utils.int_to_byte(player.tile_count)
+                       for player in player_tile_counts)
+
+    def serialize(self, tiles: List['model.Tile']) -> bytes:
+        rack = [utils.int_to_byte(len(tiles))]
+        for tile in tiles:
+            if tile.letter is None:
+                rack.append(bytes((tile.id, tile.points, 0)))
+            else:
+                b = tile.letter.encode('utf-8')
+                rack.append(bytes((tile.id, tile.points, len(b))) + b)
+        return self.__head + b''.join(rack) + self.__tail
+
+    def message(self, tiles: List['model.Tile']) -> 'StartTurn':
+        return StartTurn(self.turn_player_id, self.tiles_left, list(tiles), self.player_tile_counts, self)
+
+
 class StartTurn(ServerMessage):
     def __init__(self, turn_player_id: int, tiles_left: int, tiles: List['model.Tile'],
-                 player_tile_counts: List['StartTurnPlayer']):
+                 player_tile_counts: List['StartTurnPlayer'], template: 'StartTurnTemplate' = None):
         self.turn_player_id = turn_player_id
         self.tiles_left = tiles_left
         self.tiles = tiles
         self.player_tile_counts = player_tile_counts
+        self.__data = template.serialize(tiles) if template else None
 
-    @_serializer
     def serialize(self) -> bytes:
-        result = utils.int_to_byte(self.turn_player_id)
-        result += utils.int_to_byte(self.tiles_left) + utils.int_to_byte(len(self.tiles))
-        for tile in self.tiles:
-            result += utils.int_to_byte(tile.id) + utils.int_to_byte(tile.points)
-            if tile.letter is None:
-                result += b'\x00'
-            else:
-                b = tile.letter.encode('utf-8')
-                result += utils.int_to_byte(len(b)) + b
-        result += utils.int_to_byte(len(self.player_tile_counts))
-        for player in self.player_tile_counts:
-            result += utils.int_to_byte(player.id) + utils.int_to_byte(player.tile_count)
-        return result
+        if self.__data is not None:
+            return self.__data
+        return StartTurnTemplate(self.turn_player_id, self.tiles_left, self.player_tile_counts).serialize(self.tiles)
 
     @classmethod
     def _deserialize(cls, stream: 'Stream') -> 'StartTurn':
@@ -277,10 +323,11 @@ class EndTurnTile:
 
 
 class EndTurn(ServerMessage):
-    def __init__(self, player_id: int, score: int, placed_tiles: List['EndTurnTile']):
+    def __init__(self, player_id: int, score: int, placed_tiles: List['EndTurnTile'], board_hash: int = 0):
         self.player_id = player_id
         self.score = score
         self.placed_tiles = placed_tiles
+        self.board_hash = board_hash
 
     @_serializer
     def serialize(self) -> bytes:
@@ -290,7 +337,7 @@ class EndTurn(ServerMessage):
             result += utils.int_to_byte(tile.position) + utils.int_to_byte(tile.points)
             b = tile.letter.encode('utf-8')
             result += utils.int_to_byte(len(b)) + b
-        return result
+        return result + self.board_hash.to_bytes(8, byteorder='big')
 
     @classmethod
     def _deserialize(cls, stream: 'Stream') -> 'EndTurn':
@@ -298,7 +345,7 @@ class EndTurn(ServerMessage):
         score = stream.get_int(2, signed=True)
         tiles = [EndTurnTile(stream.get_int(), stream.get_int(), stream.get_str(stream.get_int()))
                  for _ in range(stream.get_int())]
-        return cls(player_id, score, tiles)
+        return cls(player_id, score, tiles, stream.get_int(8))
 
 
 class EndGamePlayer:
@@ -342,6 +389,33 @@ class PlayerChat(ServerMessage):
         return cls(stream.get_int(), stream.get_str(stream.get_int(2)))
 
 
+class ChatEntry:
+    def __init__(self, player_id: int, name: str, text: str):
+        self.player_id = player_id
+        self.name = name
+        self.text = text
+
+
+class ChatBatch(ServerMessage):
+    def __init__(self, entries: List['ChatEntry']):
+        self.entries = entries
+
+    @_serializer
+    def serialize(self) -> bytes:
+        result = len(self.entries).to_bytes(2, byteorder='big')
+        for entry in self.entries:
+            b = entry.name.encode('utf-8')
+            result += utils.int_to_byte(entry.player_id) + utils.int_to_byte(len(b)) + b
+            b = entry.text.encode('utf-8')
+            result += len(b).to_bytes(2, byteorder='big') + b
+        return result
+
+    @classmethod
+    def _deserialize(cls, stream: 'Stream') -> 'ChatBatch':
+        return cls([ChatEntry(stream.get_int(), stream.get_str(stream.get_int()), stream.get_str(stream.get_int(2)))
+                    for _ in range(stream.get_int(2))])
+
+
 class Notification(ServerMessage):
     def __init__(self, text: str):
         self.text = text
@@ -356,6 +430,106 @@ class Notification(ServerMessage):
         return cls(stream.get_str(stream.get_int(2)))
 
 
+class MovePreviewWord:
+    def __init__(self, word: str, score: int, valid: bool):
+        self.word = word
+        self.score = score
+        self.valid = valid
+
+
+class MovePreview(ServerMessage):
+    def __init__(self, reason: Optional[str], score: int, words: List['MovePreviewWord']):
+        self.reason = reason
+        self.score = score
+        self.words = words
+
+    @property
+    def valid(self) -> bool:
+        return self.reason is None
+
+    @_serializer
+    def serialize(self) -> bytes:
+        result = self.score.to_bytes(2, byteorder='big')
+        if self.reason is None:
+            result += b'\x00\x00'
+        else:
+            b = self.reason.encode('utf-8')
+            result += len(b).to_bytes(2, byteorder='big') + b
+        result += utils.int_to_byte(len(self.words))
+        for word in self.words:
+            b = word.word.encode('utf-8')
+            result += utils.int_to_byte(len(b)) + b
+            result += word.score.to_bytes(2, byteorder='big') + utils.int_to_byte(word.valid)
+        return result
+
+    @classmethod
+    def _deserialize(cls, stream: 'Stream') -> 'MovePreview':
+        score = stream.get_int(2)
+        n = stream.get_int(2)
+        reason = stream.get_str(n) if n else None
+        words = [MovePreviewWord(stream.get_str(stream.get_int()), stream.get_int(2), bool(stream.get_int()))
+                 for _ in range(stream.get_int())]
+        return cls(reason, score, words)
+
+
+class Queued(ServerMessage):
+    def __init__(self, waiting: int):
+        self.waiting = waiting
+
+    @_serializer
+    def serialize(self) -> bytes:
+        return self.waiting.to_bytes(2, byteorder='big')
+
+    @classmethod
+    def _deserialize(cls, stream: 'Stream') -> 'Queued':
+        return cls(stream.get_int(2))
+
+
+class Resumed(ServerMessage):
+    def __init__(self, received: int):
+        self.received = received
+
+    @_serializer
+    def serialize(self) -> bytes:
+        return self.received.to_bytes(4, byteorder='big')
+
+    @classmethod
+    def _deserialize(cls, stream: 'Stream') -> 'Resumed':
+        return cls(stream.get_int(4))
+
+
+class Ping(ClientMessage, ServerMessage):
+    def __init__(self, timestamp: int):
+        self.timestamp = timestamp
+
+    @_serializer
+    def serialize(self) -> bytes:
+        return self.timestamp.to_bytes(8, byteorder='big')
+
+    @classmethod
+    def _deserialize(cls, stream: 'Stream') -> 'Ping':
+        return cls(stream.get_int(8))
+
+
+class Pong(Ping):
+    ...
+
+
+ClientMessage.prefix_map = {
+    b'\x00': Join,
+    b'\x01': Ready,
+    b'\x02': Leave,
+    b'\x03': TileExchange,
+    b'\x04': PlaceTiles,
+    b'\x05': Chat,
+    b'\x11': PreviewMove,
+    b'\x13': Ping,
+    b'\x14': Pong,
+    b'\x15': FindGame,
+    b'\x17': Resume
+}
+ClientMessage.prefix_map_inv = {value: key for key, value in ClientMessage.prefix_map.items()}
+
 ServerMessage.prefix_map = {
     b'\x06': JoinOk,
     b'\x07': ActionRejected,
@@ -367,7 +541,13 @@ ServerMessage.prefix_map = {
     b'\x0D': EndGame,
     b'\x0E': Shutdown,
     b'\x0F': PlayerChat,
-    b'\x10': Notification
+    b'\x10': Notification,
+    b'\x12': MovePreview,
+    b'\x13': Ping,
+    b'\x14': Pong,
+    b'\x16': Queued,
+    b'\x18': Resumed,
+    b'\x19': ChatBatch
 }
 ServerMessage.prefix_map_inv = {value: key for key, value in ServerMessage.prefix_map.items()}
 
@@ -416,25 +596,68 @@ class Stream:
             pass
 
 
+class BufferStream:
+    def __init__(self, data: bytes, in_msg_type: Type['Message']):
+        self.__data = data
+        self.__in_msg_type = in_msg_type
+        self.__pos = 0
+
+    @property
+    def position(self) -> int:
+        return self.__pos
+
+    def get_bytes(self, n: int) -> bytes:
+        if self.__pos + n > len(self.__data):
+            raise EOFError()
+        result = self.__data[self.__pos:self.__pos + n]
+        self.__pos += n
+        return result
+
+    def get_int(self, n: int = 1, signed=False) -> int:
+        return int.from_bytes(self.get_bytes(n), byteorder='big', signed=signed)
+
+    def get_str(self, n: int) -> str:
+        return self.get_bytes(n).decode('utf-8')
+
+    def get_msg(self) -> 'Message':
+        return self.__in_msg_type.deserialize(self)
+
+
 class StreamWorker:
     def __init__(self, stream: 'Stream', queue_in: Queue, *extra_info):
         self.__stream = stream
         self.__queue_in = queue_in
         self.queue_out = Queue()
+        self.rtt = utils.Histogram()
+        self.capture: Optional[Callable[[Optional['Message'], bool], Any]] = None
+        self.closed = False
         self.__extra_info = extra_info
 
+    def redirect(self, queue_in: Queue):
+        self.__queue_in = queue_in
+
     def listen_incoming(self):
         try:
             while True:
                 msg = self.__stream.get_msg()
-                if msg:
+                if self.capture:
+                    self.capture(msg, False)
+                if isinstance(msg, Pong):
+                    self.rtt.add((utils.timestamp() - msg.timestamp) / 1e6)
+                elif isinstance(msg, Ping):
+                    self.queue_out.put(Pong(msg.timestamp))
+                elif msg:
                     self.__queue_in.put((msg, *self.__extra_info))
                     if isinstance(msg, Leave) or isinstance(msg, Shutdown):
                         break
                 else:
+                    self.closed = True
                     self.__queue_in.put((None, *self.__extra_info))
                     break
         except socket.error:
+            if self.capture:
+                self.capture(None, False)
+            self.closed = True
             self.__queue_in.put((None, *self.__extra_info))
         finally:
             self.__stream.close()
@@ -446,11 +669,19 @@ class StreamWorker:
                 msg = self.queue_out.get()
                 if msg:
                     self.__stream.send_msg(msg)
+                    if self.capture:
+                        self.capture(msg, True)
                     if isinstance(msg, Leave) or isinstance(msg, Shutdown):
                         break
                 else:
                     break
         except socket.error:
+            self.closed = True
             self.__queue_in.put((None, *self.__extra_info))
         finally:
             self.__stream.close()
+
+    def close(self):
+        self.closed = True
+        self.__stream.close()
+        self.queue_out.put(None)
@@ -0,0 +1,101 @@
+import argparse
+import bisect
+import os
+from typing import Dict, List, Optional
+
+import pyscrabble.server as server
+from pyscrabble.journal import GameRecord
+from pyscrabble.model import Board, Player, Tile
+
+
+class Snapshot:
+    def __init__(self, game: 'server.Game'):
+        self.tiles: List[Optional['Tile']] = [square.tile for row in game.board.squares for square in row]
+        self.player_ids = [client.player_id for client in game.clients]
+        self.racks = {client.player_id: list(client.player.tiles) for client in game.clients}
+        self.scores = {client.player_id: client.player.score for client in game.clients}
+        self.bag = game.free_tiles.copy()
+        self.turn_player_id = game.turn_player_id
+        self.turns_without_score = game.turns_without_score
+        self.lobby = game.lobby
+        self.action_count = len(game.actions)
+
+    def restore(self, game: 'server.Game', clients_by_id: Dict[int, 'server.Client']):
+        game.board = Board()
+        for position, tile in enumerate(self.tiles):
+            game.board.place(position, tile)
+        game.move_cache.clear()
+        game.clients = [clients_by_id[player_id] for player_id in self.player_ids]
+        for client in game.clients:
+            client.player = Player()
+            client.player.tiles = list(self.racks[client.player_id])
+            client.player.score = self.scores[client.player_id]
+        game.free_tiles = self.bag.copy()
+        game.turn_player_id = self.turn_player_id
+        game.turns_without_score = self.turns_without_score
+        game.lobby = self.lobby
+        del game.actions[self.action_count:]
+
+
+class Replay:
+    def __init__(self, record: 'GameRecord', snapshot_interval: int = 16):
+        self.record = record
+        self.snapshot_interval = snapshot_interval
+        server.words_for(record.lang)
+        self.game = server.Game(record.lang)
+        self.__clients_by_id = {player_id: server.Client(player_id, name, None, self.game.queue_in)
+                                for player_id, name in record.players}
+        self.game.clients = list(self.__clients_by_id.values())
+        server._start_game(self.game, record.seed)
+        self.turn = 0
+        self.__snapshot_turns = [0]
+        self.__snapshots = [Snapshot(self.game)]
+        while self.turn < len(record.actions):
+            self.__step()
+
+    def __len__(self) -> int:
+        return len(self.record.actions)
+
+    def __step(self):
+        action = self.record.actions[self.turn]
+        server.Handler.handle(action.msg, self.__clients_by_id[action.player_id], self.game)
+        self.turn += 1
+        if self.turn % self.snapshot_interval == 0 and self.turn > self.__snapshot_turns[-1]:
+            self.__snapshot_turns.append(self.turn)
+            self.__snapshots.append(Snapshot(self.game))
+
+    def seek(self, turn: int) -> 'server.Game':
+        turn = max(0, min(turn, len(self.record.actions)))
+        if turn < self.turn or turn - self.turn > self.snapshot_interval:
+            i = bisect.bisect_right(self.__snapshot_turns, turn) - 1
+            self.__snapshots[i].restore(self.game, self.__clients_by_id)
+            self.turn = self.__snapshot_turns[i]
+        while self.turn < turn:
+            self.__step()
+        return self.game
+
+
+def _format_board(game: 'server.Game') -> str:
+    return '\n'.join(' '.join(square.tile.letter if square.tile else '.' for square in row)
+                     for row in game.board.squares)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a PyScrabble game record')
+    parser.add_argument('record', help='path to a game record')
+    parser.add_argument('-t', '--turn', type=int, help='show the position after this many actions')
+    args = parser.parse_args()
+
+    record = GameRecord.load(args.record)
+    replay = Replay(record)
+    game = replay.seek(len(replay) if args.turn is None else args.turn)
+    print(f'{os.path.basename(args.record)}: turn {replay.turn}/{len(replay)}, seed {record.seed}')
+    print(_format_board(game))
+    for client in game.clients:
+        rack = ''.join(tile.letter or '?' for tile in client.player.tiles)
+        turn_marker = '▶' if client.player_id == game.turn_player_id and not game.lobby else ' '
+        print(f'{turn_marker} {client.name}: {client.player.score} points, rack {rack}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+import gzip
+import pkgutil
+from array import array
+from typing import Container, Dict, List, Optional
+
+import pyscrabble.protocol as proto
+from pyscrabble.model import Board, SquareType, Tile
+
+
+class FullTile:
+    def __init__(self, tile: 'Tile', place_tiles_tile: 'proto.PlaceTilesTile'):
+        self.id = tile.id
+        self.letter = tile.letter if tile.letter else place_tiles_tile.letter
+        self.points = tile.points
+        self.row = place_tiles_tile.position // 15
+        self.col = place_tiles_tile.position % 15
+        self.position = place_tiles_tile.position
+
+
+class WordCounter:
+    def __init__(self):
+        self.word = ''
+        self.positions: List[int] = []
+        self.points = 0
+        self.multiplier = 1
+        self.is_connected = False
+        self.valid = True
+
+    @property
+    def score(self) -> int:
+        return self.points * self.multiplier
+
+
+class MoveResult:
+    def __init__(self, reason: str = None, word_counters: List['WordCounter'] = None, bingo: bool = False):
+        self.reason = reason
+        self.word_counters = word_counters if word_counters is not None else []
+        self.bingo = bingo
+
+    @property
+    def valid(self) -> bool:
+        return self.reason is None
+
+    @property
+    def score(self) -> int:
+        return sum(counter.score for counter in self.word_counters) + (50 if self.bingo else 0)
+
+
+class CompactLexicon:
+    def __init__(self, data: bytes):
+        self.__data = b'\n'.join(sorted(set(data.split())))
+        self.__offsets = array('I', [0])
+        position = self.__data.find(b'\n')
+        while position != -1:
+            self.__offsets.append(position + 1)
+            position = self.__data.find(b'\n', position + 1)
+        self.__offsets.append(len(self.__data) + 1)
+
+    def __len__(self) -> int:
+        return len(self.__offsets) - 1
+
+    def __contains__(self, word: str) -> bool:
+        key = word.encode('utf-8')
+        lo, hi = 0, len(self.__offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            candidate = self.__data[self.__offsets[mid]:self.__offsets[mid + 1] - 1]
+            if candidate < key:
+                lo = mid + 1
+            elif candidate > key:
+                hi = mid
+            else:
+                return True
+        return False
+
+
+_lexicons: Dict[str, 'CompactLexicon'] = {}
+
+
+def load_lexicon(lang: str) -> Optional['CompactLexicon']:
+    if lang not in _lexicons:
+        try:
+            data = pkgutil.get_data(__package__, f'words_{lang}')
+        except IOError:
+            return None
+        _lexicons[lang] = CompactLexicon(gzip.decompress(data))
+    return _lexicons[lang]
+
+
+def evaluate_move(board: 'Board', tiles: List['FullTile'], words: Container[str]) -> 'MoveResult':
+    if any(not tile.letter for tile in tiles):
+        return MoveResult('Blank tiles must be assigned a letter!')
+
+    if all(tile.row == tiles[0].row for tile in tiles):
+        def accessor(coord1, coord2):
+            return board.squares[coord1][coord2]
+
+        def position(coord1, coord2):
+            return coord1 * 15 + coord2
+    elif all(tile.col == tiles[0].col for tile in tiles):
+        def accessor(coord1, coord2):
+            return board.squares[coord2][coord1]
+
+        def position(coord1, coord2):
+            return coord2 * 15 + coord1
+        for tile in tiles:
+            tile.row, tile.col = tile.col, tile.row
+    else:
+        return MoveResult('Tiles must form a horizontal or vertical line!')
+
+    row = tiles[0].row
+    tiles.sort(key=lambda tile: tile.col)
+    tiles_by_col = {tile.col: tile for tile in tiles}
+    for tile in tiles:
+        if tile.row not in range(15) or tile.col not in range(15) or tiles_by_col.get(tile.col) != tile or accessor(tile.row, tile.col).tile:
+            return MoveResult('Tiles are overlapping or out of bounds!')
+
+    for col in range(tiles[0].col + 1, tiles[-1].col + 1):
+        if not accessor(row, col).tile and col not in tiles_by_col:
+            return MoveResult('Tiles must form a single line!')
+
+    tile_count = len(tiles)
+    if not accessor(7, 7).tile:
+        if row != 7 or 7 not in tiles_by_col:
+            return MoveResult('The center square must be populated!')
+        elif tile_count == 1:
+            return MoveResult('The first word must be at least 2 characters long!')
+
+    def count_word(tile_from: 'FullTile', horizontal: bool = False) -> Optional['WordCounter']:
+        counter = WordCounter()
+        for i in range((tile_from.col if horizontal else tile_from.row) - 1, -1, -1):
+            tile = accessor(row, i).tile if horizontal else accessor(i, tile_from.col).tile
+            if not tile:
+                break
+            counter.points += tile.points
+            counter.word = tile.letter + counter.word
+            counter.positions.insert(0, position(row, i) if horizontal else position(i, tile_from.col))
+            counter.is_connected = True
+
+        for i in range(tile_from.col if horizontal else tile_from.row, 15):
+            square = accessor(row, i) if horizontal else accessor(i, tile_from.col)
+            if square.tile:
+                tile = square.tile
+                counter.points += tile.points
+                counter.is_connected = True
+            elif (i in tiles_by_col) if horizontal else (i == tile_from.row):
+                tile = tiles_by_col[i] if horizontal else tile_from
+                if square.type == SquareType.DLS:
+                    counter.points += 2 * tile.points
+                elif square.type == SquareType.TLS:
+                    counter.points += 3 * tile.points
+                else:
+                    counter.points += tile.points
+                if square.type == SquareType.DWS:
+                    counter.multiplier *= 2
+                elif square.type == SquareType.TWS:
+                    counter.multiplier *= 3
+            else:
+                break
+            counter.word += tile.letter
+            counter.positions.append(position(row, i) if horizontal else position(i, tile_from.col))
+
+        return counter if len(counter.word) > 1 else None
+
+    word_counters = []
+    horizontal_counter = count_word(tiles[0], True)
+    if horizontal_counter:
+        word_counters.append(horizontal_counter)
+    for tile in tiles:
+        word_counter = count_word(tile)
+        if word_counter:
+            word_counters.append(word_counter)
+
+    if all(not counter.is_connected for counter in word_counters) and accessor(7, 7).tile:
+        return MoveResult('Must connect with pre-existing tiles!')
+
+    for counter in word_counters:
+        counter.valid = counter.word in words
+    result = MoveResult(None, word_counters, tile_count == 7)
+    invalid_words = {counter.word for counter in word_counters if not counter.valid}
+    if invalid_words:
+        result.reason = f'Invalid word{"" if len(invalid_words) == 1 else "s"}: {", ".join(invalid_words)}'
+    return result
@@ -1,59 +1,208 @@
 import gzip
+import heapq
+import itertools
+import os
+import pkgutil
 import random
+import secrets
+import signal
 import socket
+import sys
+import time
 from abc import ABC
+from collections import deque
 from queue import Queue
-from threading import Thread, Lock
-from typing import List, Set, Tuple, Dict, Type, Optional
-
-from pkg_resources import resource_stream
+from threading import Event, Thread, Lock, Timer
+from functools import partial
+from typing import TYPE_CHECKING, Callable, Deque, List, Set, Tuple, Dict, Type, Optional
 
 import pyscrabble.protocol as proto
-from pyscrabble.model import Player, Board, Tile, SquareType
+import pyscrabble.tracing as tracing
+import pyscrabble.utils as utils
+from pyscrabble.capture import CaptureWriter
+from pyscrabble.eventlog import EventLogWriter, RoomLog
+from pyscrabble.journal import GameJournal, GameRecord, JournalAction, JournalSession, JournalStart, read_journal
+from pyscrabble.model import Player, Board, Tile, TileBag
+from pyscrabble.rules import FullTile, MoveResult, evaluate_move
+
+if TYPE_CHECKING:
+    from pyscrabble.metrics import Metrics, MetricsServer, Sample
+
+MOVE_CACHE_SIZE = 1024
+PING_INTERVAL = 5.0
+RESUME_GRACE = 30.0
+RESUME_BUFFER_SIZE = 256
+CHAT_HISTORY_SIZE = 50
+
+_words: Dict[str, Set[str]] = {}
 
-words: Set[str] = None
 
+def load_words(lang: str) -> Set[str]:
+    result = _words[lang] = set(gzip.decompress(pkgutil.get_data(__package__, f'words_{lang}')).decode('utf-8').split())
+    return result
 
-def load_words(lang: str):
-    global words
-    with resource_stream(__name__, f'words_{lang}') as stream:
-        with gzip.open(stream, mode='rt') as f:
-            words = set(line.strip() for line in f)
+
+def words_for(lang: str) -> Set[str]:
+    result = _words.get(lang)
+    if result is None:
+        result = load_words(lang)
+    return result
 
 
 class Client:
-    def __init__(self, player_id: int, name: str, stream: 'proto.Stream', queue_in: Queue):
+    def __init__(self, player_id: int, name: str, stream: Optional['proto.Stream'], queue_in: Queue):
         self.player_id = player_id
         self.name = name
         self.player: Player = None
         self.ready = False
+        self.worker: 'proto.StreamWorker' = None
+        self.metrics: 'Metrics' = None
+        self.game: 'Game' = None
+        self.token = secrets.token_bytes(16)
+        self.received = 0
+        self.sent = 0
+        self.recent = deque(maxlen=RESUME_BUFFER_SIZE)
+        self.detached_at: float = None
+        self.restored = False
+        if stream:
+            self.attach(stream, queue_in)
+
+    def attach(self, stream: 'proto.Stream', queue_in: Queue):
         self.worker = proto.StreamWorker(stream, queue_in, self)
 
     def send_msg(self, msg: 'proto.ServerMessage'):
-        self.worker.queue_out.put(msg)
+        if not isinstance(msg, proto.Ping):
+            if isinstance(msg, proto.JoinOk):
+                self.sent = 0
+                self.recent.clear()
+            self.sent += 1
+            self.recent.append(msg)
+        if self.worker:
+            self.worker.queue_out.put(msg)
+            if self.metrics:
+                self.metrics.message_out(type(msg).__name__)
 
 
 class Server:
-    def __init__(self, lang: str):
+    def __init__(self, lang: str, seed: int = None, journal_path: str = None, record_dir: str = None,
+                 metrics_port: int = None, capture_path: str = None, event_log_path: str = None,
+                 max_players: int = 4, match_size: int = 2, rating_window: int = 100,
+                 resume_grace: float = RESUME_GRACE, chat_batch: float = 0.0):
         self.__socket: socket = None
-        self.game = Game(lang)
+        self.__stopped = Event()
+        self.capture: 'CaptureWriter' = None
+        if capture_path:
+            if seed is None:
+                seed = random.getrandbits(32)
+            self.capture = CaptureWriter(capture_path, lang, seed)
+        self.event_log = EventLogWriter(event_log_path) if event_log_path else None
+        self.game = Game(lang, seed, journal_path, record_dir, self.event_log)
+        self.game.resume_grace = resume_grace
+        self.game.chat_batch = chat_batch
+        self.resume_grace = resume_grace
+        self.chat_batch = chat_batch
+        self.record_dir = record_dir
+        self.max_players = max_players
+        self.__seeds = random.Random(seed)
+        self.matchmaker = Matchmaker(self.__new_room, match_size, rating_window)
+        self.metrics_port = metrics_port
+        self.metrics: 'Metrics' = None
+        self.__metrics_server: 'MetricsServer' = None
+        if metrics_port is not None:
+            from pyscrabble.metrics import Metrics
+            self.metrics = self.game.metrics = Metrics()
+            self.metrics.add_collector(self.__collect_metrics)
+
+    def __count_connection(self, outcome: str):
+        if self.metrics:
+            self.metrics.connection(outcome)
+
+    def __reject(self, stream: 'proto.Stream', connection: Optional[int], name: Optional[str], reason: str):
+        self.game.log('join_rejected', name=name, reason=reason)
+        msg = proto.ActionRejected(reason)
+        stream.send_msg(msg)
+        if self.capture:
+            self.capture.record(connection, msg, True)
+        stream.close()
+
+    def __new_room(self, lang: str) -> 'Game':
+        game = Game(lang, self.__seeds.getrandbits(32), record_dir=self.record_dir, event_log=self.event_log)
+        game.metrics = self.metrics
+        game.resume_grace = self.resume_grace
+        game.chat_batch = self.chat_batch
+        Thread(target=game.process_incoming_requests, daemon=True).start()
+        return game
+
+    def __find_session(self, token: bytes) -> Tuple[Optional['Client'], Optional['Game']]:
+        if token:
+            for game in [self.game, *self.matchmaker.rooms]:
+                with game.clients_lock:
+                    client = next((client for client in game.clients if client.token == token), None)
+                if client:
+                    return client, game
+        return None, None
+
+    def __resume(self, stream: 'proto.Stream', connection: Optional[int], msg: 'proto.Resume'):
+        client, game = self.__find_session(msg.token)
+        reattach = None
+        if client:
+            capture = partial(self.capture.record, connection) if self.capture else None
+            reattach = _Reattach(stream, msg.received, capture)
+            game.queue_in.put((reattach, client))
+            reattach.done.wait()
+        if not reattach or not reattach.accepted:
+            self.__reject(stream, connection, client.name if client else None, 'Session expired')
+            return
+        self.__count_connection('resumed')
+        Thread(target=client.worker.listen_incoming, daemon=True).start()
+        client.worker.listen_outgoing()
+
+    def __find_game(self, stream: 'proto.Stream', connection: Optional[int], msg: 'proto.FindGame'):
+        if msg.lang not in Game._tiles:
+            self.__reject(stream, connection, msg.name, 'Unsupported language')
+            return
+        try:
+            words_for(msg.lang)
+        except IOError:
+            self.__reject(stream, connection, msg.name, 'Unsupported language')
+            return
+        client = self.matchmaker.enqueue(msg, stream)
+        client.metrics = self.metrics
+        if self.capture:
+            client.worker.capture = partial(self.capture.record, connection)
+        self.__count_connection('queued')
+        Thread(target=client.worker.listen_incoming, daemon=True).start()
+        client.worker.listen_outgoing()
 
     def __handle_connection(self, stream: 'proto.Stream'):
         msg = stream.get_msg()
-        if isinstance(msg, proto.Join):
+        connection = None
+        if self.capture:
+            connection = self.capture.connection()
+            self.capture.record(connection, msg)
+        if isinstance(msg, proto.FindGame):
+            self.__find_game(stream, connection, msg)
+        elif isinstance(msg, proto.Resume):
+            self.__resume(stream, connection, msg)
+        elif isinstance(msg, proto.Join):
             self.game.clients_lock.acquire()
-            if len(self.game.clients) == 4:
+            if len(self.game.clients) >= self.max_players:
                 self.game.clients_lock.release()
-                stream.send_msg(proto.ActionRejected('Server is full'))
-                stream.close()
+                self.__count_connection('full')
+                self.__reject(stream, connection, msg.name, 'Server is full')
             elif not self.game.lobby:
                 self.game.clients_lock.release()
-                stream.send_msg(proto.ActionRejected('Game in progress'))
-                stream.close()
+                self.__count_connection('game_in_progress')
+                self.__reject(stream, connection, msg.name, 'Game in progress')
             else:
                 free_id = self.game.find_free_player_id()
                 new_client = Client(free_id, msg.name, stream, self.game.queue_in)
+                new_client.metrics = self.metrics
+                if self.capture:
+                    new_client.worker.capture = partial(self.capture.record, connection)
                 self.game.clients.append(new_client)
+                self.__count_connection('accepted')
+                self.game.log('join', player=free_id, name=msg.name)
 
                 player_infos = []
                 player_joined = proto.PlayerJoined(free_id, new_client.name)
@@ -61,36 +210,238 @@ class Server:
                     player_infos.append(proto.PlayerInfo(client.player_id, client.ready, client.name))
                     if client != new_client:
                         client.send_msg(player_joined)
-                new_client.send_msg(proto.JoinOk(free_id, player_infos))
+                new_client.send_msg(proto.JoinOk(free_id, player_infos, self.game.lang, new_client.token))
+                if self.game.chat_history:
+                    new_client.send_msg(proto.ChatBatch(list(self.game.chat_history)))
                 self.game.clients_lock.release()
 
                 Thread(target=new_client.worker.listen_incoming, daemon=True).start()
                 new_client.worker.listen_outgoing()
         else:
+            self.__count_connection('invalid')
             stream.close()
 
     def __listen_connections(self):
         try:
             while True:
                 s, _ = self.__socket.accept()
+                s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
                 Thread(target=self.__handle_connection, args=(proto.Stream(s, proto.ClientMessage),), daemon=True).start()
         except IOError:
             pass
 
+    def __ping_clients(self):
+        while not self.__stopped.wait(PING_INTERVAL):
+            for game in [self.game, *self.matchmaker.rooms]:
+                with game.clients_lock:
+                    ping = proto.Ping(utils.timestamp())
+                    for client in game.clients:
+                        client.send_msg(ping)
+
+    def latencies(self) -> Dict[str, 'utils.Histogram']:
+        with self.game.clients_lock:
+            return {client.name: client.worker.rtt for client in self.game.clients if client.worker}
+
+    def __collect_metrics(self) -> List['Sample']:
+        game = self.game
+        samples = [('queue_in_depth', 'gauge', 'Client messages waiting for the game thread', {},
+                    game.queue_in.qsize()),
+                   ('game_in_progress', 'gauge', 'Whether a game is being played', {}, int(not game.lobby))]
+        with game.clients_lock:
+            clients = list(game.clients)
+        attached = [client for client in clients if client.worker]
+        samples += [('players', 'gauge', 'Players in the room by connection state', {'state': 'connected'},
+                     len(attached)),
+                    ('players', 'gauge', 'Players in the room by connection state', {'state': 'detached'},
+                     len(clients) - len(attached))]
+        labels = {client: {'room': str(game.room_id), 'player': str(client.player_id)} for client in attached}
+        samples += [('queue_out_depth', 'gauge', 'Server messages waiting to be sent per connection', labels[client],
+                     client.worker.queue_out.qsize()) for client in attached]
+        samples += [('rtt_seconds', 'histogram', 'Round trip time of server pings per connection', labels[client],
+                     client.worker.rtt) for client in attached]
+        samples += [('matchmaking_waiting', 'gauge', 'Players waiting in the matchmaking queue', {},
+                     self.matchmaker.waiting),
+                    ('matchmaking_rooms', 'gauge', 'Rooms created by matchmaking that are still open', {},
+                     len(self.matchmaker.rooms)),
+                    ('matchmaking_wait_seconds', 'histogram', 'Time players waited for a matchmaking room', {},
+                     self.matchmaker.wait_times)]
+        return samples
+
     def start(self, ip: str, port: int):
         if self.__socket is None:
             self.__socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.__socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             self.__socket.bind((ip, port))
-            self.__socket.listen(1)
-            load_words(self.game.lang)
+            self.__socket.listen(socket.SOMAXCONN)
+            words_for(self.game.lang)
+            if self.game.journal_path and os.path.exists(self.game.journal_path):
+                _restore_game(self.game)
             Thread(target=self.__listen_connections, daemon=True).start()
             Thread(target=self.game.process_incoming_requests, daemon=True).start()
+            Thread(target=self.__ping_clients, daemon=True).start()
+            self.matchmaker.start()
+            if self.metrics:
+                from pyscrabble.metrics import MetricsServer
+                self.__metrics_server = MetricsServer(self.metrics, '127.0.0.1', self.metrics_port)
+                self.__metrics_server.start()
 
     def stop(self):
+        self.__stopped.set()
         self.game.send_to_all(proto.Shutdown())
         self.game.queue_in.put((None, None))
+        self.matchmaker.stop()
         self.__socket.close()
+        if self.game.journal:
+            self.game.journal.close()
+            self.game.journal = None
+        if self.__metrics_server:
+            self.__metrics_server.stop()
+            self.__metrics_server = None
+        if self.capture:
+            self.capture.close()
+        if self.event_log:
+            self.event_log.close()
+
+
+class Ticket:
+    def __init__(self, client: 'Client', lang: str, rating: int, seq: int):
+        self.client = client
+        self.lang = lang
+        self.rating = rating
+        self.seq = seq
+        self.queued = time.perf_counter()
+        self.active = True
+
+    def entry(self) -> Tuple[int, int, 'Ticket']:
+        return self.rating, self.seq, self
+
+
+class Matchmaker:
+    def __init__(self, new_room: Callable[[str], 'Game'], room_size: int = 2, rating_window: int = 100,
+                 widen_rate: float = 50.0, interval: float = 0.1):
+        self.new_room = new_room
+        self.room_size = room_size
+        self.rating_window = rating_window
+        self.widen_rate = widen_rate
+        self.interval = interval
+        self.queue_in = Queue()
+        self.waiting = 0
+        self.wait_times = utils.Histogram()
+        self.rooms: List['Game'] = []
+        self.__pools: Dict[Tuple[str, bool], List[Tuple[int, int, 'Ticket']]] = {}
+        self.__tickets: Dict['Client', 'Ticket'] = {}
+        self.__seqs = itertools.count()
+        self.__lock = Lock()
+        self.__stopped = Event()
+
+    def enqueue(self, msg: 'proto.FindGame', stream: 'proto.Stream') -> 'Client':
+        client = Client(0, msg.name, stream, self.queue_in)
+        with self.__lock:
+            ticket = self.__tickets[client] = Ticket(client, msg.lang, msg.rating, next(self.__seqs))
+            heapq.heappush(self.__pools.setdefault((msg.lang, msg.rating > 0), []), ticket.entry())
+            self.waiting += 1
+            client.send_msg(proto.Queued(self.waiting))
+        return client
+
+    def start(self):
+        Thread(target=self.__process_events, daemon=True).start()
+        Thread(target=self.__run, daemon=True).start()
+
+    def stop(self):
+        self.__stopped.set()
+        self.queue_in.put((None, None))
+        with self.__lock:
+            for ticket in self.__tickets.values():
+                ticket.client.send_msg(proto.Shutdown())
+            for game in self.rooms:
+                game.send_to_all(proto.Shutdown())
+                game.queue_in.put((None, None))
+
+    def stats(self) -> Dict[str, object]:
+        return {'waiting': self.waiting, 'rooms': len(self.rooms), 'wait': self.wait_times.to_dict()}
+
+    def __process_events(self):
+        while True:
+            msg, client = self.queue_in.get()
+            if not client:
+                break
+            with self.__lock:
+                if client.game:
+                    client.game.queue_in.put((msg, client))
+                elif not msg or isinstance(msg, proto.Leave):
+                    ticket = self.__tickets.pop(client, None)
+                    if ticket:
+                        ticket.active = False
+                        self.waiting -= 1
+
+    def __run(self):
+        while not self.__stopped.wait(self.interval):
+            now = time.perf_counter()
+            with self.__lock:
+                groups = [group for pool in self.__pools.values() for group in self.__match(pool, now)]
+                new_rooms = []
+                for group in groups:
+                    game = self.new_room(group[0].lang)
+                    game.clients_lock.acquire()
+                    for ticket in group:
+                        del self.__tickets[ticket.client]
+                        self.wait_times.add(now - ticket.queued)
+                        ticket.client.game = game
+                        ticket.client.worker.redirect(game.queue_in)
+                    self.waiting -= len(group)
+                    new_rooms.append((game, group))
+                open_rooms = []
+                for game in self.rooms:
+                    if game.clients or not game.lobby:
+                        open_rooms.append(game)
+                    else:
+                        game.queue_in.put((None, None))
+                self.rooms = open_rooms
+            for game, group in new_rooms:
+                try:
+                    self.__create_room(game, group)
+                finally:
+                    game.clients_lock.release()
+
+    def __match(self, pool: List[Tuple[int, int, 'Ticket']], now: float) -> List[List['Ticket']]:
+        groups = []
+        skipped = []
+        while True:
+            group = []
+            while pool and len(group) < self.room_size:
+                ticket = heapq.heappop(pool)[2]
+                if ticket.active:
+                    group.append(ticket)
+            if len(group) < self.room_size:
+                skipped += group
+                break
+            waited = now - min(ticket.queued for ticket in group)
+            if group[-1].rating - group[0].rating <= self.rating_window + waited * self.widen_rate:
+                groups.append(group)
+            else:
+                skipped.append(group[0])
+                for ticket in group[1:]:
+                    heapq.heappush(pool, ticket.entry())
+        for ticket in skipped:
+            heapq.heappush(pool, ticket.entry())
+        return groups
+
+    def __create_room(self, game: 'Game', group: List['Ticket']):
+        for player_id, ticket in enumerate(group):
+            client = ticket.client
+            client.player_id = player_id
+            client.ready = True
+            game.clients.append(client)
+            game.log('join', player=player_id, name=client.name, rating=ticket.rating)
+        player_infos = [proto.PlayerInfo(client.player_id, True, client.name) for client in game.clients]
+        for client in game.clients:
+            client.send_msg(proto.JoinOk(client.player_id, player_infos, game.lang, client.token))
+        _start_game(game)
+        with self.__lock:
+            if self.__stopped.is_set():
+                game.queue_in.put((None, None))
+            else:
+                self.rooms.append(game)
 
 
 class Game:
@@ -183,9 +534,12 @@ class Game:
         'lv': _tiles_lv
     }
 
-    def __init__(self, lang: str):
+    _room_ids = itertools.count(1)
+
+    def __init__(self, lang: str, seed: int = None, journal_path: str = None, record_dir: str = None,
+                 event_log: 'EventLogWriter' = None):
         self.board: 'Board' = None
-        self.free_tiles: List['Tile'] = None
+        self.free_tiles: 'TileBag' = None
         self.clients: List['Client'] = []
         self.clients_lock = Lock()
         self.lobby = True
@@ -193,25 +547,56 @@ class Game:
         self.queue_in = Queue()
         self.turns_without_score: int = None
         self.lang = lang
+        self.seed: int = None
+        self.__seeds = random.Random(seed)
+        self.move_cache: Dict[Tuple[int, Tuple[Tuple[int, str, int], ...]], 'MoveResult'] = {}
+        self.journal_path = journal_path
+        self.journal: 'GameJournal' = None
+        self.record_dir = record_dir
+        self.start: 'JournalStart' = None
+        self.actions: List['JournalAction'] = []
+        self.metrics: 'Metrics' = None
+        self.room_id = next(Game._room_ids)
+        self.events: Optional['RoomLog'] = RoomLog(self.room_id, event_log)
+        self.resume_grace = RESUME_GRACE
+        self.chat_batch = 0.0
+        self.chat_history: Deque['proto.ChatEntry'] = deque(maxlen=CHAT_HISTORY_SIZE)
+        self.pending_chat: List['proto.ChatEntry'] = []
 
     def find_free_player_id(self) -> int:
         taken_ids = set((client.player_id for client in self.clients))
         free_ids = (i for i in range(256) if i not in taken_ids)
         return next(free_ids)
 
+    def record_action(self, client: 'Client', msg: 'proto.ClientMessage'):
+        action = JournalAction(client.player_id, msg)
+        self.actions.append(action)
+        if self.journal:
+            self.journal.write(action)
+
+    def log(self, kind: str, **fields):
+        if self.events:
+            self.events.log(kind, **fields)
+
     def send_to_all(self, msg: 'proto.ServerMessage', exception_id: int = None):
         for client in self.clients:
             if exception_id != client.player_id:
                 client.send_msg(msg)
 
-    def load_tiles(self):
-        self.free_tiles = Game._tiles[self.lang].copy()
-        random.shuffle(self.free_tiles)
+    def load_tiles(self, seed: int = None):
+        self.seed = seed if seed is not None else self.__seeds.getrandbits(32)
+        self.free_tiles = TileBag(Game._tiles[self.lang], self.seed)
 
     def process_incoming_requests(self):
         while True:
             msg, client = self.queue_in.get()
-            if client:
+            if client and self.metrics:
+                start = time.perf_counter()
+                Handler.handle(msg, client, self)
+                msg_type = type(msg).__name__ if msg else 'Disconnect'
+                self.metrics.message_in(msg_type)
+                self.metrics.observe_handler(msg_type, time.perf_counter() - start)
+            elif client:
                 Handler.handle(msg, client, self)
             else:
                 break
@@ -230,40 +615,157 @@ def _turn_only(handler):
             if client.player_id == game.turn_player_id:
                 handler(cls, msg, client, game)
             else:
-                client.send_msg(proto.ActionRejected('Not player\'s turn!'))
+                _reject(msg, client, game, 'Not player\'s turn!')
     return handler_
 
 
+def _game_only(handler):
+    def handler_(cls, msg, client, game):
+        if not game.lobby:
+            handler(cls, msg, client, game)
+    return handler_
+
+
+def _reject(msg: 'proto.ClientMessage', client: 'Client', game: 'Game', reason: str):
+    client.send_msg(proto.ActionRejected(reason))
+    game.log('rejected', player=client.player_id, action=type(msg).__name__, reason=reason)
+
+
 class Handler(ABC):
     @staticmethod
     def handle(msg: Optional['proto.ClientMessage'], client: 'Client', game: 'Game'):
-        handler = Handler._mappings.get(msg.__class__) if msg else LeaveHandler
-        if handler:
-            with game.clients_lock:
-                handler._handle(msg, client, game)
+        span = tracing.start('server', msg, game.room_id) if tracing.enabled else None
+        handler = Handler._mappings.get(msg.__class__) if msg else DisconnectHandler
+        if msg and not isinstance(msg, _InternalMessage):
+            client.received += 1
+        try:
+            if handler:
+                with game.clients_lock:
+                    handler._handle(msg, client, game)
+        finally:
+            if span:
+                span.finish()
 
     @classmethod
     def _handle(cls, msg: 'proto.ClientMessage', client: 'Client', game: 'Game'):
         pass
 
 
-def _start_game(game: 'Game'):
+def _full_tiles(msg: 'proto.PlaceTiles', client: 'Client') -> Optional[List['FullTile']]:
+    player_tiles_by_id = {tile.id: tile for tile in client.player.tiles}
+    tiles = [FullTile(player_tiles_by_id[tile.id], tile)
+             for tile in msg.tile_placements if tile.id in player_tiles_by_id]
+    return tiles if len(msg.tile_placements) == len(tiles) else None
+
+
+def _evaluate_move(game: 'Game', tiles: List['FullTile']) -> 'MoveResult':
+    key = (game.board.hash, tuple(sorted((tile.position, tile.letter or '', tile.points) for tile in tiles)))
+    result = game.move_cache.get(key)
+    if result is None:
+        if len(game.move_cache) >= MOVE_CACHE_SIZE:
+            game.move_cache.clear()
+        result = game.move_cache[key] = evaluate_move(game.board, tiles, words_for(game.lang))
+    return result
+
+
+def _start_game(game: 'Game', seed: int = None):
     game.board = Board()
-    game.load_tiles()
+    game.move_cache.clear()
+    game.load_tiles(seed)
     game.turns_without_score = 0
     for client in game.clients:
         client.ready = False
         player = client.player = Player()
-        player.tiles = game.free_tiles[:7]
-        game.free_tiles = game.free_tiles[7:]
+        player.tiles = game.free_tiles.draw(7)
     game.send_to_all(proto.Notification('Game started!'))
-    game.turn_player_id = game.clients[random.randint(0, len(game.clients) - 1)].player_id
-    tiles_left = len(game.free_tiles)
-    player_tile_counts = [proto.StartTurnPlayer(client.player_id, 7) for client in game.clients]
-    for client in game.clients:
-        start_turn = proto.StartTurn(game.turn_player_id, tiles_left, client.player.tiles, player_tile_counts)
-        client.send_msg(start_turn)
+    game.turn_player_id = game.clients[game.free_tiles.rng.randrange(len(game.clients))].player_id
+    _start_turn(game)
     game.lobby = False
+    game.start = JournalStart(game.seed, [(client.player_id, client.name) for client in game.clients])
+    game.actions = []
+    if game.journal_path:
+        game.journal = GameJournal(game.journal_path)
+        game.journal.write(game.start)
+        for client in game.clients:
+            game.journal.write(JournalSession(client.player_id, client.token))
+    game.log('start', seed=game.seed, players=[client.player_id for client in game.clients],
+             first=game.turn_player_id)
+
+
+def _start_turn_template(game: 'Game') -> 'proto.StartTurnTemplate':
+    player_tile_counts = [proto.StartTurnPlayer(client.player_id, len(client.player.tiles))
+                          for client in game.clients]
+    return proto.StartTurnTemplate(game.turn_player_id, len(game.free_tiles), player_tile_counts)
+
+
+def _start_turn(game: 'Game'):
+    template = _start_turn_template(game)
+    for client in game.clients:
+        client.send_msg(template.message(client.player.tiles))
+
+
+def _end_game(game: 'Game'):
+    end_game = proto.EndGame([proto.EndGamePlayer(client.player_id, client.player.score)
+                              for client in game.clients])
+    game.send_to_all(end_game)
+    game.lobby = True
+    game.log('end', scores={client.player_id: client.player.score for client in game.clients},
+             actions=len(game.actions))
+    if game.journal:
+        game.journal.close(remove=True)
+        game.journal = None
+    if game.record_dir:
+        record = GameRecord(game.lang, game.start.seed, game.start.players, game.actions)
+        path = os.path.join(game.record_dir, f'{time.strftime("%Y%m%d-%H%M%S")}-{game.seed:08x}.psgr')
+        try:
+            record.save(path)
+        except IOError:
+            pass
+
+
+def _send_game_state(client: 'Client', game: 'Game'):
+    player_infos = [proto.PlayerInfo(client_.player_id, client_.ready, client_.name) for client_ in game.clients]
+    client.send_msg(proto.JoinOk(client.player_id, player_infos, game.lang, client.token))
+    if game.chat_history:
+        client.send_msg(proto.ChatBatch(list(game.chat_history)))
+    client.send_msg(_start_turn_template(game).message(client.player.tiles))
+    placed_tiles = [proto.EndTurnTile(position, square.tile.points, square.tile.letter)
+                    for position, square in enumerate(square for row in game.board.squares for square in row)
+                    if square.tile]
+    for client_ in game.clients:
+        client.send_msg(proto.EndTurn(client_.player_id, client_.player.score, placed_tiles, game.board.hash))
+        placed_tiles = []
+
+
+def _restore_game(game: 'Game'):
+    records = read_journal(game.journal_path)
+    if not records or not isinstance(records[0], JournalStart):
+        return
+    journal_path = game.journal_path
+    events = game.events
+    game.journal_path = None
+    game.events = None
+    try:
+        game.clients = [Client(player_id, name, None, game.queue_in) for player_id, name in records[0].players]
+        _start_game(game, records[0].seed)
+        clients_by_id = {client.player_id: client for client in game.clients}
+        for client in game.clients:
+            client.restored = True
+        for record in records[1:]:
+            client = clients_by_id.get(record.player_id)
+            if isinstance(record, JournalSession):
+                if client:
+                    client.token = record.token
+                continue
+            if game.lobby or client not in game.clients:
+                break
+            Handler.handle(record.msg, client, game)
+    finally:
+        game.journal_path = journal_path
+        game.events = events
+    game.log('restore', actions=len(game.actions), lobby=game.lobby)
+    if not game.lobby:
+        game.journal = GameJournal(journal_path, append=True)
 
 
 class ReadyHandler(Handler):
@@ -271,6 +773,7 @@ class ReadyHandler(Handler):
     @_lobby_only
     def _handle(cls, msg: 'proto.Ready', client: 'Client', game: 'Game'):
         client.ready = not client.ready
+        game.log('ready', player=client.player_id, ready=client.ready)
         all_ready = len(game.clients) > 1 and all(client.ready for client in game.clients)
         if all_ready:
             _start_game(game)
@@ -281,6 +784,11 @@ class ReadyHandler(Handler):
 class LeaveHandler(Handler):
     @classmethod
     def _handle(cls, msg: 'proto.Leave', client: 'Client', game: 'Game'):
+        if client not in game.clients:
+            return
+        game.log('leave', player=client.player_id, reason='leave' if msg else 'disconnect')
+        if not game.lobby:
+            game.record_action(client, proto.Leave())
         i = game.clients.index(client)
         del game.clients[i]
         game.send_to_all(proto.PlayerLeft(client.player_id))
@@ -292,20 +800,97 @@ class LeaveHandler(Handler):
                 deduction = sum(tile.points for tile in client_.player.tiles)
                 client_.send_msg(proto.Notification(f'Deducted {deduction} points'))
                 client_.player.score -= sum(tile.points for tile in client_.player.tiles)
-            end_game = proto.EndGame([proto.EndGamePlayer(client.player_id, client.player.score)
-                                      for client in game.clients])
-            game.send_to_all(end_game)
-            game.lobby = True
+            _end_game(game)
         elif game.turn_player_id == client.player_id:
-            game.free_tiles += client.player.tiles
-            random.shuffle(game.free_tiles)
+            game.free_tiles.put_back(client.player.tiles)
             game.turn_player_id = game.clients[i % len(game.clients)].player_id
-            tiles_left = len(game.free_tiles)
-            player_tile_counts = [proto.StartTurnPlayer(client.player_id, len(client.player.tiles))
-                                  for client in game.clients]
-            for client_ in game.clients:
-                client_.send_msg(proto.StartTurn(game.turn_player_id, tiles_left, client_.player.tiles,
-                                                 player_tile_counts))
+            _start_turn(game)
+
+
+class _InternalMessage(proto.ClientMessage):
+    def serialize(self) -> bytes:
+        return b''
+
+
+class _GraceExpired(_InternalMessage):
+    ...
+
+
+class _FlushChat(_InternalMessage):
+    ...
+
+
+class _Reattach(_InternalMessage):
+    def __init__(self, stream: 'proto.Stream', received: int, capture: Optional[Callable]):
+        self.stream = stream
+        self.received = received
+        self.capture = capture
+        self.accepted = False
+        self.done = Event()
+
+
+class DisconnectHandler(Handler):
+    @classmethod
+    def _handle(cls, msg: None, client: 'Client', game: 'Game'):
+        if client not in game.clients or not client.worker or not client.worker.closed:
+            return
+        if game.lobby or not game.resume_grace:
+            LeaveHandler._handle(msg, client, game)
+            return
+        client.worker = None
+        client.detached_at = time.monotonic()
+        game.log('detach', player=client.player_id)
+        game.send_to_all(proto.Notification(f'{client.name} lost connection'), client.player_id)
+        timer = Timer(game.resume_grace, game.queue_in.put, args=((_GraceExpired(), client),))
+        timer.daemon = True
+        timer.start()
+
+
+class GraceExpiredHandler(Handler):
+    @classmethod
+    def _handle(cls, msg: '_GraceExpired', client: 'Client', game: 'Game'):
+        if client in game.clients and not client.worker and client.detached_at is not None \
+                and time.monotonic() - client.detached_at >= game.resume_grace - 0.01:
+            LeaveHandler._handle(None, client, game)
+
+
+class ReattachHandler(Handler):
+    @classmethod
+    def _handle(cls, msg: '_Reattach', client: 'Client', game: 'Game'):
+        try:
+            if client in game.clients:
+                cls.__reattach(msg, client, game)
+                msg.accepted = True
+        finally:
+            msg.done.set()
+
+    @classmethod
+    def __reattach(cls, msg: '_Reattach', client: 'Client', game: 'Game'):
+        detached = client.detached_at is not None
+        if client.worker:
+            client.worker.close()
+        client.attach(msg.stream, game.queue_in)
+        client.metrics = game.metrics
+        client.worker.capture = msg.capture
+        client.detached_at = None
+        missed = None
+        if client.restored:
+            client.restored = False
+            client.received = 0
+        else:
+            client.worker.queue_out.put(proto.Resumed(client.received))
+            missed = client.sent - msg.received
+            recent = list(client.recent)
+            if 0 <= missed <= len(recent):
+                for missed_msg in recent[len(recent) - missed:]:
+                    client.worker.queue_out.put(missed_msg)
+            else:
+                missed = None
+        if missed is None:
+            _send_game_state(client, game)
+        game.log('resume', player=client.player_id, missed=missed)
+        if detached:
+            game.send_to_all(proto.Notification(f'{client.name} reconnected'), client.player_id)
 
 
 def _end_turn_without_score(client: 'Client', game: 'Game'):
@@ -315,20 +900,12 @@ def _end_turn_without_score(client: 'Client', game: 'Game'):
             deduction = sum(tile.points for tile in client_.player.tiles)
             client_.send_msg(proto.Notification(f'Deducted {deduction} points'))
             client_.player.score -= sum(tile.points for tile in client_.player.tiles)
-        end_game = proto.EndGame([proto.EndGamePlayer(client.player_id, client.player.score)
-                                  for client in game.clients])
-        game.send_to_all(end_game)
-        game.lobby = True
+        _end_game(game)
     else:
         game.turns_without_score += 1
-        game.send_to_all(proto.EndTurn(game.turn_player_id, client.player.score, []))
+        game.send_to_all(proto.EndTurn(game.turn_player_id, client.player.score, [], game.board.hash))
         game.turn_player_id = game.clients[(game.clients.index(client) + 1) % len(game.clients)].player_id
-        player_tile_counts = [proto.StartTurnPlayer(client.player_id, len(client.player.tiles))
-                              for client in game.clients]
-        for client_ in game.clients:
-            start_turn = proto.StartTurn(game.turn_player_id, len(game.free_tiles), client_.player.tiles,
-                                         player_tile_counts)
-            client_.send_msg(start_turn)
+        _start_turn(game)
 
 
 class TileExchangeHandler(Handler):
@@ -336,41 +913,23 @@ class TileExchangeHandler(Handler):
     @_turn_only
     def _handle(cls, msg: 'proto.TileExchange', client: 'Client', game: 'Game'):
         if len(game.free_tiles) < 7:
-            client.send_msg(proto.ActionRejected('There are less than 7 tiles left!'))
+            _reject(msg, client, game, 'There are less than 7 tiles left!')
         elif not msg.tile_ids:
-            client.send_msg(proto.ActionRejected('Tile exchange requires at least one selected tile!'))
+            _reject(msg, client, game, 'Tile exchange requires at least one selected tile!')
         else:
             tiles = [tile for tile in client.player.tiles if tile.id in msg.tile_ids]
             tile_count = len(tiles)
             if len(msg.tile_ids) == tile_count:
+                game.record_action(client, msg)
+                game.log('exchange', player=client.player_id, tiles=tile_count)
                 client.player.tiles = [tile for tile in client.player.tiles if tile not in tiles]
-                game.free_tiles += tiles
-                random.shuffle(game.free_tiles)
-                client.player.tiles += game.free_tiles[:tile_count]
-                game.free_tiles = game.free_tiles[tile_count:]
+                game.free_tiles.put_back(tiles)
+                client.player.tiles += game.free_tiles.draw(tile_count)
                 game.send_to_all(proto.Notification(f'{client.name} exchanged tiles'), client.player_id)
                 client.send_msg(proto.Notification('You exchanged tiles'))
                 _end_turn_without_score(client, game)
             else:
-                client.send_msg(proto.ActionRejected('Selected tiles do not belong to player!'))
-
-
-class FullTile:
-    def __init__(self, tile: 'Tile', place_tiles_tile: 'proto.PlaceTilesTile'):
-        self.id = tile.id
-        self.letter = tile.letter if tile.letter else place_tiles_tile.letter
-        self.points = tile.points
-        self.row = place_tiles_tile.position // 15
-        self.col = place_tiles_tile.position % 15
-        self.position = place_tiles_tile.position
-
-
-class WordCounter:
-    def __init__(self):
-        self.word = ''
-        self.points = 0
-        self.multiplier = 1
-        self.is_connected = False
+                _reject(msg, client, game, 'Selected tiles do not belong to player!')
 
 
 class PlaceTilesHandler(Handler):
@@ -378,132 +937,49 @@ class PlaceTilesHandler(Handler):
     @_turn_only
     def _handle(cls, msg: 'proto.PlaceTiles', client: 'Client', game: 'Game'):
         if not msg.tile_placements:
+            game.record_action(client, msg)
+            game.log('skip', player=client.player_id)
             game.send_to_all(proto.Notification(f'{client.name} skipped'), client.player_id)
             client.send_msg(proto.Notification('You skipped'))
             _end_turn_without_score(client, game)
             return
 
-        player_tiles_by_id = {tile.id: tile for tile in client.player.tiles}
-        tiles = [FullTile(player_tiles_by_id[tile.id], tile)
-                 for tile in msg.tile_placements if tile.id in player_tiles_by_id]
-        tile_count = len(tiles)
-        if len(msg.tile_placements) != tile_count:
-            client.send_msg(proto.ActionRejected('Placed tiles do not belong to player!'))
-            return
-
-        if any(not tile.letter for tile in tiles):
-            client.send_msg(proto.ActionRejected('Blank tiles must be assigned a letter!'))
-            return
-
-        if all(tile.row == tiles[0].row for tile in tiles):
-            def accessor(coord1, coord2):
-                return game.board.squares[coord1][coord2]
-        elif all(tile.col == tiles[0].col for tile in tiles):
-            def accessor(coord1, coord2):
-                return game.board.squares[coord2][coord1]
-            for tile in tiles:
-                tile.row, tile.col = tile.col, tile.row
-        else:
-            client.send_msg(proto.ActionRejected('Tiles must form a horizontal or vertical line!'))
-            return
-
-        row = tiles[0].row
-        tiles.sort(key=lambda tile: tile.col)
-        tiles_by_col = {tile.col: tile for tile in tiles}
-        for tile in tiles:
-            if tile.row not in range(15) or tile.col not in range(15) or tiles_by_col.get(tile.col) != tile or accessor(tile.row, tile.col).tile:
-                client.send_msg(proto.ActionRejected('Tiles are overlapping or out of bounds!'))
-                return
-
-        for col in range(tiles[0].col + 1, tiles[-1].col + 1):
-            if not accessor(row, col).tile and col not in tiles_by_col:
-                client.send_msg(proto.ActionRejected('Tiles must form a single line!'))
-                return
-
-        if not accessor(7, 7).tile:
-            if row != 7 or 7 not in tiles_by_col:
-                client.send_msg(proto.ActionRejected('The center square must be populated!'))
-                return
-            elif tile_count == 1:
-                client.send_msg(proto.ActionRejected('The first word must be at least 2 characters long!'))
-                return
-
-        def count_word(tile_from: 'FullTile', horizontal: bool = False) -> Optional['WordCounter']:
-            counter = WordCounter()
-            for i in range((tile_from.col if horizontal else tile_from.row) - 1, -1, -1):
-                tile = accessor(row, i).tile if horizontal else accessor(i, tile_from.col).tile
-                if not tile:
-                    break
-                counter.points += tile.points
-                counter.word = tile.letter + counter.word
-                counter.is_connected = True
-
-            for i in range(tile_from.col if horizontal else tile_from.row, 15):
-                square = accessor(row, i) if horizontal else accessor(i, tile_from.col)
-                if square.tile:
-                    tile = square.tile
-                    counter.points += tile.points
-                    counter.is_connected = True
-                elif (i in tiles_by_col) if horizontal else (i == tile_from.row):
-                    tile = tiles_by_col[i] if horizontal else tile_from
-                    if square.type == SquareType.DLS:
-                        counter.points += 2 * tile.points
-                    elif square.type == SquareType.TLS:
-                        counter.points += 3 * tile.points
-                    else:
-                        counter.points += tile.points
-                    if square.type == SquareType.DWS:
-                        counter.multiplier *= 2
-                    elif square.type == SquareType.TWS:
-                        counter.multiplier *= 3
-                else:
-                    break
-                counter.word += tile.letter
-
-            return counter if len(counter.word) > 1 else None
-
-        word_counters = []
-        horizontal_counter = count_word(tiles[0], True)
-        if horizontal_counter:
-            word_counters.append(horizontal_counter)
-        for tile in tiles:
-            word_counter = count_word(tile)
-            if word_counter:
-                word_counters.append(word_counter)
-
-        if all(not counter.is_connected for counter in word_counters) and accessor(7, 7).tile:
-            client.send_msg(proto.ActionRejected('Must connect with pre-existing tiles!'))
+        tiles = _full_tiles(msg, client)
+        if tiles is None:
+            _reject(msg, client, game, 'Placed tiles do not belong to player!')
             return
 
-        global words
-        invalid_words = {counter.word for counter in word_counters if counter.word not in words}
-        if invalid_words:
-            client.send_msg(proto.ActionRejected(f'Invalid word{"" if len(invalid_words) == 1 else "s"}: {", ".join(invalid_words)}'))
+        result = _evaluate_move(game, tiles)
+        if not result.valid:
+            _reject(msg, client, game, result.reason)
             return
 
-        for counter in word_counters:
-            score = counter.points * counter.multiplier
+        game.record_action(client, msg)
+        game.log('move', player=client.player_id, words=[counter.word for counter in result.word_counters],
+                 score=result.score, bingo=result.bingo)
+        for counter in result.word_counters:
+            score = counter.score
             client.player.score += score
             game.send_to_all(proto.Notification(f'{counter.word} - {score} points'))
 
-        if tile_count == 7:
+        if result.bingo:
             client.player.score += 50
             game.send_to_all(proto.Notification('Bingo! - 50 points'))
 
         for tile in tiles:
-            accessor(tile.row, tile.col).tile = tile
+            game.board.place(tile.position, tile)
+        game.move_cache.clear()
 
+        tile_count = len(tiles)
         placed_tiles = [proto.EndTurnTile(tile.position, tile.points, tile.letter) for tile in tiles]
-        game.send_to_all(proto.EndTurn(game.turn_player_id, client.player.score, placed_tiles))
+        game.send_to_all(proto.EndTurn(game.turn_player_id, client.player.score, placed_tiles, game.board.hash))
         game.turns_without_score = 0
 
         tile_ids = {tile.id for tile in tiles}
         client.player.tiles = [tile for tile in client.player.tiles if tile.id not in tile_ids]
 
         if game.free_tiles:
-            take_tiles_count = min(len(game.free_tiles), tile_count)
-            client.player.tiles += game.free_tiles[:take_tiles_count]
-            game.free_tiles = game.free_tiles[take_tiles_count:]
+            client.player.tiles += game.free_tiles.draw(tile_count)
         elif not client.player.tiles:
             game.send_to_all(proto.Notification(f'{client.name} has played out!'), client.player_id)
             client.send_msg(proto.Notification('You have played out!'))
@@ -516,25 +992,55 @@ class PlaceTilesHandler(Handler):
                     client_.send_msg(proto.Notification(f'Deducted {deduction} points'))
             client.player.score += all_sums
             client.send_msg(proto.Notification(f'Awarded {all_sums} points'))
-            end_game = proto.EndGame([proto.EndGamePlayer(client.player_id, client.player.score)
-                                      for client in game.clients])
-            game.send_to_all(end_game)
-            game.lobby = True
+            _end_game(game)
             return
 
         game.turn_player_id = game.clients[(game.clients.index(client) + 1) % len(game.clients)].player_id
-        player_tile_counts = [proto.StartTurnPlayer(client.player_id, len(client.player.tiles))
-                              for client in game.clients]
-        for client_ in game.clients:
-            start_turn = proto.StartTurn(game.turn_player_id, len(game.free_tiles), client_.player.tiles,
-                                         player_tile_counts)
-            client_.send_msg(start_turn)
+        _start_turn(game)
+
+
+class PreviewMoveHandler(Handler):
+    @classmethod
+    @_game_only
+    def _handle(cls, msg: 'proto.PreviewMove', client: 'Client', game: 'Game'):
+        if not msg.tile_placements:
+            client.send_msg(proto.MovePreview('No tiles placed!', 0, []))
+            return
+
+        tiles = _full_tiles(msg, client)
+        if tiles is None:
+            client.send_msg(proto.MovePreview('Placed tiles do not belong to player!', 0, []))
+            return
+
+        result = _evaluate_move(game, tiles)
+        preview_words = [proto.MovePreviewWord(counter.word, counter.score, counter.valid)
+                         for counter in result.word_counters]
+        client.send_msg(proto.MovePreview(result.reason, result.score, preview_words))
 
 
 class ChatHandler(Handler):
     @classmethod
     def _handle(cls, msg: 'proto.Chat', client: 'Client', game: 'Game'):
-        game.send_to_all(proto.PlayerChat(client.player_id, msg.text))
+        entry = proto.ChatEntry(client.player_id, client.name, msg.text)
+        if not game.chat_batch:
+            game.chat_history.append(entry)
+            game.send_to_all(proto.PlayerChat(client.player_id, msg.text))
+            return
+        if not game.pending_chat:
+            timer = Timer(game.chat_batch, game.queue_in.put, args=((_FlushChat(), client),))
+            timer.daemon = True
+            timer.start()
+        game.pending_chat.append(entry)
+
+
+class FlushChatHandler(Handler):
+    @classmethod
+    def _handle(cls, msg: '_FlushChat', client: 'Client', game: 'Game'):
+        entries = game.pending_chat
+        game.pending_chat = []
+        game.chat_history.extend(entries)
+        if entries:
+            game.send_to_all(proto.ChatBatch(entries))
 
 
 Handler._mappings: Dict[Type['proto.ClientMessage'], Type['Handler']] = {
@@ -542,5 +1048,61 @@ Handler._mappings: Dict[Type['proto.ClientMessage'], Type['Handler']] = {
     proto.Leave: LeaveHandler,
     proto.TileExchange: TileExchangeHandler,
     proto.PlaceTiles: PlaceTilesHandler,
-    proto.Chat: ChatHandler
+    proto.Chat: ChatHandler,
+    proto.PreviewMove: PreviewMoveHandler,
+    _GraceExpired: GraceExpiredHandler,
+    _FlushChat: FlushChatHandler,
+    _Reattach: ReattachHandler
 }
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Run a headless PyScrabble server')
+    parser.add_argument('--host', default='0.0.0.0', help='address to listen on')
+    parser.add_argument('--port', type=int, default=1234, help='port to listen on')
+    parser.add_argument('-l', '--lang', choices=sorted(Game._tiles), default='en', help='game language')
+    parser.add_argument('--max-players', type=int, choices=range(2, 5), default=4, help='players per room')
+    parser.add_argument('--match-size', type=int, choices=range(2, 5), default=2,
+                        help='players per room formed by matchmaking')
+    parser.add_argument('--rating-window', type=int, default=100,
+                        help='largest rating difference within a matchmaking room, widening while players wait')
+    parser.add_argument('--resume-grace', type=float, default=RESUME_GRACE,
+                        help='seconds a dropped player keeps their seat, 0 removes them right away')
+    parser.add_argument('--chat-batch', type=float, default=0.0,
+                        help='merge chat sent within this many seconds into one frame per player, 0 sends it at once')
+    parser.add_argument('-s', '--seed', type=int, help='seed of the tile bags')
+    parser.add_argument('--journal', help='journal the running game to this file and resume it on restart')
+    parser.add_argument('--record-dir', help='save finished games to this directory')
+    parser.add_argument('--metrics-port', type=int, help='serve Prometheus metrics on this local port')
+    parser.add_argument('--capture', help='capture all traffic to this file')
+    parser.add_argument('--event-log', help='append room events to this JSON lines file')
+    parser.add_argument('--events-dump', help='dump the recent events of the room to this file on SIGUSR2')
+    parser.add_argument('--profile', help='toggle the handler profiler with SIGUSR1, dumping stacks to this file')
+    args = parser.parse_args()
+    if args.seed is not None and not 0 <= args.seed < 2 ** 32:
+        parser.error('the seed must be between 0 and 4294967295')
+
+    server = Server(args.lang, args.seed, args.journal, args.record_dir, args.metrics_port, args.capture,
+                    args.event_log, args.max_players, args.match_size, args.rating_window, args.resume_grace,
+                    args.chat_batch)
+    stopped = Event()
+    signal.signal(signal.SIGINT, lambda *_: stopped.set())
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    if args.events_dump:
+        from pyscrabble.eventlog import install_signal_handler
+        if not install_signal_handler(args.events_dump):
+            print('--events-dump is ignored, this platform has no SIGUSR2', file=sys.stderr)
+    if args.profile and not tracing.install_signal_handler(args.profile):
+        print('--profile is ignored, this platform has no SIGUSR1', file=sys.stderr)
+    try:
+        server.start(args.host, args.port)
+    except IOError as e:
+        sys.exit(f'Cannot listen on {args.host}:{args.port}: {e}')
+    print(f'Listening on {args.host}:{args.port}', flush=True)
+    stopped.wait()
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, List
+
+import pyscrabble.protocol as proto
+import pyscrabble.server as server
+import pyscrabble.utils as utils
+from pyscrabble.bot import Bot, Lexicon
+
+lexicon: 'Lexicon' = None
+
+
+def load_lexicon(lang: str):
+    global lexicon
+    if lexicon is None:
+        lexicon = Lexicon(server.words_for(lang))
+
+
+class SimClient(server.Client):
+    def __init__(self, player_id: int, name: str, queue_in):
+        super().__init__(player_id, name, None, queue_in)
+        self.inbox: List['proto.ServerMessage'] = []
+
+    def send_msg(self, msg: 'proto.ServerMessage'):
+        self.inbox.append(msg)
+
+
+class BotPlayer:
+    def __init__(self, rng: random.Random, greed: float = 1.0):
+        self.bot = Bot(lexicon, rng, greed)
+
+    def choose(self, game: 'server.Game', client: 'SimClient') -> 'proto.ClientMessage':
+        return self.bot.choose(game.board, client.player.tiles, len(game.free_tiles))
+
+
+class ScriptedPlayer:
+    def __init__(self, messages: Iterable['proto.ClientMessage']):
+        self.__messages = iter(messages)
+
+    def choose(self, game: 'server.Game', client: 'SimClient') -> 'proto.ClientMessage':
+        return next(self.__messages, proto.PlaceTiles([]))
+
+
+PlayerFactory = Callable[[random.Random], object]
+
+
+class GameStats:
+    def __init__(self, seed: int):
+        self.seed = seed
+        self.actions = 0
+        self.latencies: Dict[str, List[float]] = {}
+        self.violations = Counter()
+        self.rejections = Counter()
+        self.scores: List[int] = []
+
+
+def _check_invariants(game: 'server.Game', tile_count: int) -> List[str]:
+    violations = []
+    board_tiles = [square.tile for row in game.board.squares for square in row if square.tile]
+    rack_tiles = [tile for client in game.clients for tile in client.player.tiles]
+    if len(board_tiles) + len(rack_tiles) + len(game.free_tiles) != tile_count:
+        violations.append('tile count changed')
+    ids = [tile.id for tile in board_tiles] + [tile.id for tile in rack_tiles]
+    if len(ids) != len(set(ids)):
+        violations.append('duplicate tile')
+    if any(len(client.player.tiles) > 7 for client in game.clients):
+        violations.append('rack overflow')
+    if not game.lobby and game.turn_player_id not in {client.player_id for client in game.clients}:
+        violations.append('turn player missing')
+    return violations
+
+
+def run_game(seed: int, players: List[PlayerFactory], lang: str = 'en', max_actions: int = 500) -> 'GameStats':
+    stats = GameStats(seed)
+    rng = random.Random(seed)
+    game = server.Game(lang, seed)
+    clients = [SimClient(i, f'player{i}', game.queue_in) for i in range(len(players))]
+    sim_players = {client.player_id: factory(random.Random(rng.getrandbits(32)))
+                   for client, factory in zip(clients, players)}
+    game.clients = list(clients)
+
+    def handle(msg: 'proto.ClientMessage', client: 'SimClient'):
+        client.inbox.clear()
+        start = time.perf_counter()
+        server.Handler.handle(msg, client, game)
+        stats.latencies.setdefault(type(msg).__name__, []).append(time.perf_counter() - start)
+        stats.actions += 1
+        for reply in client.inbox:
+            if isinstance(reply, proto.ActionRejected):
+                stats.rejections[reply.reason] += 1
+                if isinstance(sim_players[client.player_id], BotPlayer):
+                    stats.violations['bot move rejected'] += 1
+
+    for client in clients:
+        handle(proto.Ready(), client)
+    tile_count = len(game.free_tiles) + 7 * len(clients)
+
+    while not game.lobby:
+        if stats.actions >= max_actions:
+            stats.violations['game did not end'] += 1
+            break
+        client = next(client for client in game.clients if client.player_id == game.turn_player_id)
+        handle(sim_players[client.player_id].choose(game, client), client)
+        if not game.lobby:
+            stats.violations.update(_check_invariants(game, tile_count))
+
+    stats.scores = [client.player.score for client in clients]
+    return stats
+
+
+def _bot_factory(rng: random.Random) -> 'BotPlayer':
+    return BotPlayer(rng)
+
+
+def _run_games(seeds: List[int], player_count: int, lang: str) -> List['GameStats']:
+    load_lexicon(lang)
+    return [run_game(seed, player_count * [_bot_factory], lang) for seed in seeds]
+
+
+class Report:
+    def __init__(self):
+        self.games = 0
+        self.actions = 0
+        self.elapsed = 0.0
+        self.latencies: Dict[str, List[float]] = {}
+        self.violations = Counter()
+        self.rejections = Counter()
+        self.__results: Dict[int, List[int]] = {}
+
+    def add(self, stats: 'GameStats'):
+        self.games += 1
+        self.actions += stats.actions
+        for msg_type, latencies in stats.latencies.items():
+            self.latencies.setdefault(msg_type, []).extend(latencies)
+        self.violations.update(stats.violations)
+        self.rejections.update(stats.rejections)
+        self.__results[stats.seed] = stats.scores
+
+    @property
+    def digest(self) -> str:
+        digest = hashlib.sha256()
+        for seed in sorted(self.__results):
+            digest.update(f'{seed}:{self.__results[seed]};'.encode('utf-8'))
+        return digest.hexdigest()[:16]
+
+    def to_dict(self) -> dict:
+        latencies = {}
+        for msg_type, values in sorted(self.latencies.items()):
+            values.sort()
+            latencies[msg_type] = {
+                'count': len(values),
+                'p50_us': utils.percentile(values, 50) * 1e6,
+                'p90_us': utils.percentile(values, 90) * 1e6,
+                'p99_us': utils.percentile(values, 99) * 1e6,
+                'max_us': values[-1] * 1e6
+            }
+        return {
+            'games': self.games,
+            'actions': self.actions,
+            'elapsed_s': round(self.elapsed, 3),
+            'games_per_s': round(self.games / self.elapsed, 2) if self.elapsed else None,
+            'actions_per_s': round(self.actions / self.elapsed, 2) if self.elapsed else None,
+            'handler_latency': latencies,
+            'violations': dict(self.violations),
+            'rejections': dict(self.rejections),
+            'digest': self.digest
+        }
+
+
+def simulate(games: int, seed: int = 0, processes: int = None, player_count: int = 2, lang: str = 'en',
+             chunk_size: int = 4) -> 'Report':
+    report = Report()
+    seeds = [seed + i for i in range(games)]
+    chunks = [seeds[i:i + chunk_size] for i in range(0, len(seeds), chunk_size)]
+    start = time.perf_counter()
+    if processes == 1:
+        for chunk in chunks:
+            for stats in _run_games(chunk, player_count, lang):
+                report.add(stats)
+    else:
+        with ProcessPoolExecutor(processes) as executor:
+            for results in executor.map(_run_games, chunks, len(chunks) * [player_count], len(chunks) * [lang]):
+                for stats in results:
+                    report.add(stats)
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run headless PyScrabble self-play games')
+    parser.add_argument('-n', '--games', type=int, default=100, help='number of games')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='seed of the first game')
+    parser.add_argument('-j', '--processes', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('-p', '--players', type=int, choices=range(2, 5), default=2, help='players per game')
+    parser.add_argument('-l', '--lang', default='en', help='game language')
+    parser.add_argument('-o', '--output', help='write the report as JSON to this file')
+    parser.add_argument('--expect-digest', help='fail unless the result digest matches')
+    args = parser.parse_args()
+
+    report = simulate(args.games, args.seed, args.processes, args.players, args.lang).to_dict()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    print(f'{report["games"]} games, {report["actions"]} actions in {report["elapsed_s"]} s '
+          f'({report["games_per_s"]} games/s, {report["actions_per_s"]} actions/s)')
+    for msg_type, latency in report['handler_latency'].items():
+        print(f'  {msg_type:<14} n={latency["count"]:<7} p50={latency["p50_us"]:.1f}us '
+              f'p90={latency["p90_us"]:.1f}us p99={latency["p99_us"]:.1f}us max={latency["max_us"]:.1f}us')
+    for reason, count in sorted(report['rejections'].items()):
+        print(f'  rejected: {reason} x{count}')
+    for violation, count in sorted(report['violations'].items()):
+        print(f'  VIOLATION: {violation} x{count}')
+    print(f'digest {report["digest"]}')
+
+    failed = bool(report['violations']) or (args.expect_digest and args.expect_digest != report['digest'])
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+import json
+import signal
+import sys
+import time
+from collections import Counter
+from threading import Event, Lock, Thread, get_ident
+from typing import Any, Callable, Dict, IO, List, NamedTuple, Optional, Tuple
+
+import pyscrabble.protocol as proto
+
+enabled = False
+
+
+class HandlerEvent(NamedTuple):
+    side: str
+    msg_type: str
+    room: Optional[int]
+    size: int
+    start: float
+    duration: float
+
+
+Hook = Callable[['HandlerEvent'], Any]
+
+_hooks: List['Hook'] = []
+_active: Dict[int, str] = {}
+_profiler: 'Profiler' = None
+
+
+def _update_enabled():
+    global enabled
+    enabled = bool(_hooks) or _profiler is not None
+
+
+def add_hook(hook: 'Hook'):
+    _hooks.append(hook)
+    _update_enabled()
+
+
+def remove_hook(hook: 'Hook'):
+    if hook in _hooks:
+        _hooks.remove(hook)
+    _update_enabled()
+
+
+class Span:
+    def __init__(self, side: str, msg: Optional['proto.Message'], room: Optional[int]):
+        self.side = side
+        self.msg_type = type(msg).__name__ if msg else 'Disconnect'
+        self.msg = msg
+        self.room = room
+        self.thread_id = get_ident()
+        _active[self.thread_id] = f'{side}:{self.msg_type}'
+        self.start = time.perf_counter()
+
+    def finish(self):
+        duration = time.perf_counter() - self.start
+        _active.pop(self.thread_id, None)
+        if _hooks:
+            size = len(self.msg.serialize()) if self.msg else 0
+            event = HandlerEvent(self.side, self.msg_type, self.room, size, self.start, duration)
+            for hook in list(_hooks):
+                hook(event)
+
+
+def start(side: str, msg: Optional['proto.Message'], room: Optional[int] = None) -> 'Span':
+    return Span(side, msg, room)
+
+
+class HandlerStats:
+    def __init__(self):
+        self.__lock = Lock()
+        self.stats: Dict[Tuple[str, str], List[float]] = {}
+
+    def __call__(self, event: 'HandlerEvent'):
+        with self.__lock:
+            stats = self.stats.get((event.side, event.msg_type))
+            if not stats:
+                stats = self.stats[(event.side, event.msg_type)] = [0, 0.0, 0.0, 0]
+            stats[0] += 1
+            stats[1] += event.duration
+            stats[2] = max(stats[2], event.duration)
+            stats[3] += event.size
+
+    def report(self) -> str:
+        lines = [f'{"handler":<32} {"count":>8} {"mean_us":>10} {"max_us":>10} {"bytes":>10}']
+        with self.__lock:
+            for (side, msg_type), (count, total, maximum, size) in sorted(self.stats.items(),
+                                                                        key=lambda item: -item[1][1]):
+                lines.append(f'{side + "." + msg_type:<32} {count:>8} {total / count * 1e6:>10.1f} '
+                             f'{maximum * 1e6:>10.1f} {size:>10}')
+        return '\n'.join(lines)
+
+
+class JsonLinesHook:
+    def __init__(self, f: IO[str]):
+        self.__f = f
+        self.__lock = Lock()
+
+    def __call__(self, event: 'HandlerEvent'):
+        line = json.dumps({'side': event.side, 'type': event.msg_type, 'room': event.room, 'size': event.size,
+                           'start': event.start, 'duration_us': event.duration * 1e6})
+        with self.__lock:
+            self.__f.write(line + '\n')
+
+
+class Profiler:
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.__stopped = Event()
+        self.__thread = Thread(target=self.__run, daemon=True)
+
+    def __run(self):
+        own_id = get_ident()
+        while not self.__stopped.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id, label in list(_active.items()):
+                frame = frames.get(thread_id)
+                if thread_id == own_id or frame is None:
+                    continue
+                stack = []
+                while frame:
+                    code = frame.f_code
+                    stack.append(f'{code.co_filename.rsplit("/", 1)[-1]}:{code.co_name}:{frame.f_lineno}')
+                    frame = frame.f_back
+                stack.append(label)
+                self.stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+
+    def start(self):
+        self.__thread.start()
+
+    def stop(self):
+        self.__stopped.set()
+        self.__thread.join()
+
+    def dump(self, f: IO[str], limit: int = None):
+        for stack, count in self.stacks.most_common(limit):
+            f.write(f'{stack} {count}\n')
+
+
+def start_profiler(interval: float = 0.001) -> 'Profiler':
+    global _profiler
+    if not _profiler:
+        _profiler = Profiler(interval)
+        _profiler.start()
+        _update_enabled()
+    return _profiler
+
+
+def stop_profiler() -> Optional['Profiler']:
+    global _profiler
+    profiler = _profiler
+    if profiler:
+        _profiler = None
+        _update_enabled()
+        profiler.stop()
+    return profiler
+
+
+def install_signal_handler(path: str, signum: int = getattr(signal, 'SIGUSR1', None)) -> bool:
+    if signum is None:
+        return False
+
+    def toggle(*_):
+        profiler = stop_profiler()
+        if profiler:
+            with open(path, 'w') as f:
+                profiler.dump(f)
+        else:
+            start_profiler()
+
+    signal.signal(signum, toggle)
+    return True
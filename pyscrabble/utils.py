@@ -1,2 +1,55 @@
+import bisect
+import time
+from typing import List, Sequence
+
+
 def int_to_byte(n: int) -> bytes:
-    return n.to_bytes(1, byteorder='big')
\ No newline at end of file
+    return n.to_bytes(1, byteorder='big')
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q / 100))]
+
+
+def timestamp() -> int:
+    return int(time.monotonic() * 1e6)
+
+
+class Histogram:
+    default_bounds = tuple(2 ** i / 1e6 for i in range(6, 24))
+
+    def __init__(self, bounds: Sequence[float] = None):
+        self.bounds = list(bounds or Histogram.default_bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.last: float = None
+
+    def add(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.last = value
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0
+        rank = min(self.count - 1, int(self.count * q / 100))
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            if cumulative > rank:
+                return bound
+        return self.bounds[-1]
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'mean_ms': self.sum / self.count * 1e3 if self.count else None,
+            'last_ms': self.last * 1e3 if self.last is not None else None,
+            'p50_ms': self.percentile(50) * 1e3,
+            'p90_ms': self.percentile(90) * 1e3,
+            'p99_ms': self.percentile(99) * 1e3
+        }
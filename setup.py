@@ -14,9 +14,15 @@ setup(
         'Topic :: Games/Entertainment :: Board Games'
     ],
     packages=['pyscrabble'],
+    package_data={
+        'pyscrabble': ['words_*']
+    },
     entry_points={
         'gui_scripts': [
             'pyscrabble = pyscrabble.__main__:main'
+        ],
+        'console_scripts': [
+            'pyscrabble-server = pyscrabble.server:main'
         ]
     }
 )
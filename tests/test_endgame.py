@@ -0,0 +1,155 @@
+import itertools
+import random
+import unittest
+from typing import List, Optional
+
+from pyscrabble.bot import Lexicon
+from pyscrabble.endgame import SCORELESS_TURNS, TABLE_SIZE, EndgameSolver, Play, _INF, _Search, _place, _rack_points, \
+    _remove, _take
+from pyscrabble.model import Board, Tile
+
+WORDS = ['AT', 'TA', 'AS', 'CAT', 'CATS', 'SAT', 'TO', 'ON', 'NO', 'ONE', 'EON', 'NOT', 'TON', 'TONE', 'NOTE',
+         'SO', 'SON', 'SET', 'NET', 'TEN', 'EAT', 'TEA', 'ATE', 'OAT', 'ANT', 'TAN', 'CON', 'COT', 'SEA']
+
+
+def _board(word: str, row: int = 7, col: int = 6) -> 'Board':
+    board = Board()
+    for i, letter in enumerate(word):
+        board.place(row * 15 + col + i, Tile(100 + i, 1, letter))
+    return board
+
+
+def _rack(letters: str, first_id: int) -> List['Tile']:
+    return [Tile(first_id + i, 1, letter) for i, letter in enumerate(letters)]
+
+
+class _Minimax:
+    def __init__(self, search: '_Search'):
+        self.search = search
+        self.nodes = 0
+
+    def value(self, board: 'Board', rack: List['Tile'], other: List['Tile'], passes: int, depth: int) -> int:
+        self.nodes += 1
+        if depth <= 0:
+            return _rack_points(other) - _rack_points(rack)
+        plays: List[Optional['Play']] = list(self.search.generate(board, rack)) + [None]
+        return max(self.play(board, rack, other, passes, play, depth) for play in plays)
+
+    def play(self, board: 'Board', rack: List['Tile'], other: List['Tile'], passes: int, play: Optional['Play'],
+             depth: int) -> int:
+        if play is None:
+            if passes + 1 >= SCORELESS_TURNS:
+                return _rack_points(other) - _rack_points(rack)
+            return -self.value(board, other, rack, passes + 1, depth - 1)
+        remaining, placed = _take(rack, play)
+        if not remaining:
+            return play.score + 2 * _rack_points(other)
+        _place(board, play, placed)
+        try:
+            return play.score - self.value(board, other, remaining, 0, depth - 1)
+        finally:
+            _remove(board, play)
+
+
+def _assert_bound(test: 'unittest.TestCase', value: int, expected: int, alpha: int, beta: int):
+    if value <= alpha:
+        test.assertLessEqual(expected, value)
+    elif value >= beta:
+        test.assertGreaterEqual(expected, value)
+    else:
+        test.assertEqual(value, expected)
+
+
+class TestNegamax(unittest.TestCase):
+    positions = [('CAT', 'SOT', 'NEA', 0), ('CAT', 'ONE', 'STA', 0), ('TON', 'EAS', 'TCO', 3), ('SEA', 'TN', 'OTA', 4),
+                 ('EAT', 'JTA', 'AC', 4)]
+
+    def setUp(self):
+        self.lexicon = Lexicon(WORDS)
+
+    def test_matches_minimax(self):
+        for word, rack, other, passes in self.positions:
+            for depth, table_size in itertools.product(range(1, 5), (0, TABLE_SIZE)):
+                with self.subTest(word=word, rack=rack, other=other, depth=depth, table_size=table_size):
+                    board = _board(word)
+                    search = _Search(self.lexicon, table_size=table_size)
+                    value, _ = search.negamax(board, _rack(rack, 0), _rack(other, 10), passes, depth, -_INF, _INF)
+                    minimax = _Minimax(_Search(self.lexicon))
+                    expected = minimax.value(board, _rack(rack, 0), _rack(other, 10), passes, depth)
+                    self.assertEqual(value, expected)
+                    self.assertEqual(board.hash, _board(word).hash)
+
+    def test_pass_window(self):
+        for word, rack, other, passes in self.positions:
+            for depth in range(1, 5):
+                board = _board(word)
+                minimax = _Minimax(_Search(self.lexicon))
+                expected = minimax.play(board, _rack(rack, 0), _rack(other, 10), passes, None, depth)
+                for alpha, beta in ((expected - 3, expected - 1), (expected - 1, expected), (expected - 1, expected + 1),
+                                    (expected, expected + 1), (expected + 1, expected + 3)):
+                    with self.subTest(word=word, rack=rack, other=other, depth=depth, alpha=alpha, beta=beta):
+                        search = _Search(self.lexicon, table_size=0)
+                        value, _ = search.play(board, _rack(rack, 0), _rack(other, 10), passes, None, depth,
+                                               alpha, beta)
+                        _assert_bound(self, value, expected, alpha, beta)
+
+    def test_window_bounds(self):
+        for word, rack, other, passes in self.positions:
+            with self.subTest(word=word, rack=rack, other=other):
+                value, _ = _Search(self.lexicon).negamax(_board(word), _rack(rack, 0), _rack(other, 10), passes, 3,
+                                                         -_INF, _INF)
+                low, _ = _Search(self.lexicon).negamax(_board(word), _rack(rack, 0), _rack(other, 10), passes, 3,
+                                                       value - 1, value)
+                high, _ = _Search(self.lexicon).negamax(_board(word), _rack(rack, 0), _rack(other, 10), passes, 3,
+                                                        value, value + 1)
+                self.assertGreaterEqual(low, value)
+                self.assertLessEqual(high, value)
+
+    def test_prunes(self):
+        nodes = minimax_nodes = 0
+        for word, rack, other, passes in self.positions:
+            board = _board(word)
+            search = _Search(self.lexicon)
+            search.negamax(board, _rack(rack, 0), _rack(other, 10), passes, 4, -_INF, _INF)
+            minimax = _Minimax(_Search(self.lexicon))
+            minimax.value(board, _rack(rack, 0), _rack(other, 10), passes, 4)
+            nodes += search.nodes
+            minimax_nodes += minimax.nodes
+        self.assertLess(nodes * 5, minimax_nodes)
+
+
+class TestSolve(unittest.TestCase):
+    def setUp(self):
+        self.lexicon = Lexicon(WORDS)
+        self.solver = EndgameSolver('en', 1, self.lexicon, table_size=0)
+
+    def tearDown(self):
+        self.solver.close()
+
+    def test_random_positions(self):
+        rng = random.Random(0)
+        letters = sorted({letter for word in WORDS for letter in word})
+        points = {letter: rng.randint(1, 4) for letter in letters}
+        words = [word for word in WORDS if len(word) >= 3]
+        for _ in range(300):
+            word = rng.choice(words)
+            rack = [Tile(i, points[letter], letter)
+                    for i, letter in enumerate(rng.choices(letters, k=rng.randint(1, 3)))]
+            other = [Tile(10 + i, points[letter], letter)
+                     for i, letter in enumerate(rng.choices(letters, k=rng.randint(1, 3)))]
+            passes = rng.randrange(SCORELESS_TURNS)
+            depth = rng.randint(1, 4)
+            alpha = rng.randint(-8, 8)
+            beta = alpha + rng.randint(1, 3)
+            with self.subTest(word=word, rack=[(tile.letter, tile.points) for tile in rack],
+                              other=[(tile.letter, tile.points) for tile in other], passes=passes, depth=depth):
+                board = _board(word)
+                expected = _Minimax(_Search(self.lexicon)).value(board, rack, other, passes, depth)
+                self.assertEqual(self.solver.solve(board, rack, other, passes, 60.0, depth).value, expected)
+                value, _ = _Search(self.lexicon, table_size=0).negamax(board, rack, other, passes, depth,
+                                                                       expected + alpha, expected + beta)
+                _assert_bound(self, value, expected, expected + alpha, expected + beta)
+
+
+if __name__ == '__main__':
+    unittest.main()